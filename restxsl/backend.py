@@ -0,0 +1,312 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Pluggable XML backends.
+
+restxsl builds an XML version of each reStructuredText document,
+evaluates XPath expressions against it, transforms it with an XSL
+stylesheet, and serializes the result.  An L{XmlBackend} provides those
+operations on top of a particular XML library.  Two backends are
+available:
+
+  - C{libxml2}: the original backend, built on the libxml2 and libxslt
+    Python bindings (L{libxml2backend.Libxml2Backend}).  Entity loaders
+    and extension functions are global to the process, and documents
+    must be freed explicitly.
+
+  - C{lxml}: a backend built on lxml (L{lxmlbackend.LxmlBackend}).
+    Compiled stylesheets can be shared between threads, each
+    transformation has its own entity resolver, and documents are
+    garbage collected.
+
+Documents and nodes are opaque to the rest of restxsl; they are only
+ever passed back to the backend that created them.  The XML produced by
+the L{pyxslt} directive is always a libxml2 document (that is what the
+pyxslt serializer builds), so backends must be able to import libxml2
+fragments.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import imp
+
+
+
+# ######################################################################
+# XmlBackend class.
+#
+
+class XmlBackend(object):
+    """
+    Interface implemented by the XML backends.
+
+    @cvar name: The name of the backend (a key in L{BACKENDS}).
+    @type name: C{str}
+    @cvar supportsProfiling: C{True} if the backend's stylesheets can
+        profile their templates (see L{xslt.TemplateProfile}).
+    @type supportsProfiling: C{bool}
+    """
+
+    name = None
+    supportsProfiling = False
+
+
+    # ----------------------------------
+    # Tree building.
+    #
+
+    def newDocument(self):
+        """Return a new, empty XML document."""
+        raise NotImplementedError
+
+    def setRootElement(self, doc, tag):
+        """Create an element with the given tag, make it the root
+        element of the document, and return it."""
+        raise NotImplementedError
+
+    def addElement(self, parent, tag, text=None):
+        """Append a new element (optionally containing the given text)
+        to the given parent element and return it."""
+        raise NotImplementedError
+
+    def setAttribute(self, node, name, value):
+        """Set an attribute on the given element."""
+        raise NotImplementedError
+
+    def addText(self, node, text):
+        """Append the given C{unicode} text to the given element."""
+        raise NotImplementedError
+
+    def addFragment(self, parent, fragmentDoc):
+        """Append the root element of the given libxml2 document to the
+        given parent element.  The fragment document still belongs to
+        the caller, but may be left empty."""
+        raise NotImplementedError
+
+    def parseDocument(self, data, url):
+        """Parse the given XML text (a byte string) into a new
+        document.  The URL is used as the base URL of the document."""
+        raise NotImplementedError
+
+    def adoptDocument(self, fragmentDoc):
+        """Return a document belonging to this backend that contains the
+        given libxml2 document.  The backend takes ownership of the
+        libxml2 document; the returned document must be freed with
+        L{freeDocument}."""
+        raise NotImplementedError
+
+    def rootElement(self, doc):
+        """Return the root element of the given document."""
+        raise NotImplementedError
+
+    def copyDocument(self, doc):
+        """Return a deep copy of the given document."""
+        raise NotImplementedError
+
+    def freeDocument(self, doc):
+        """Free the given document.  The document cannot be used after
+        it has been freed."""
+        raise NotImplementedError
+
+
+    # ----------------------------------
+    # XPath.
+    #
+
+    def xpath(self, doc, expression):
+        """Evaluate the XPath expression against the given document and
+        return the result: a list of nodes, a string, a number, or a
+        boolean."""
+        raise NotImplementedError
+
+    def isNode(self, obj):
+        """Return C{True} if the given object is a node belonging to
+        this backend."""
+        raise NotImplementedError
+
+    def nodeText(self, node):
+        """Return the string value of the given node."""
+        raise NotImplementedError
+
+    def replaceWithText(self, node, text):
+        """Replace the given element with a text node."""
+        raise NotImplementedError
+
+    def replaceWithElement(self, node, tag, children):
+        """Replace the given element with a new element containing
+        copies of the given nodes."""
+        raise NotImplementedError
+
+    def replaceWithCopy(self, node, source):
+        """Replace the given element with a deep copy of the source
+        element (which may belong to another document) and return the
+        copy."""
+        raise NotImplementedError
+
+    def removeNode(self, node):
+        """Remove the given element from its document."""
+        raise NotImplementedError
+
+    def serializeNode(self, node):
+        """Return the given element (and its descendants) serialized as
+        UTF-8 XML text."""
+        raise NotImplementedError
+
+
+    # ----------------------------------
+    # XSLT.
+    #
+
+    def compileStylesheet(self, xslPath, entityLoader):
+        """
+        Compile the given stylesheet, loading it (and its includes and
+        imports) through the entity loader.  The returned object has
+        C{apply(doc, params, entityLoader=None, profile=None)},
+        C{serialize(result, encoding)}, and C{close()} methods.  If
+        C{profile} is a list, C{apply} appends a
+        C{(stylesheet, match, name, mode, calls, milliseconds)} tuple
+        to it for each template (only if the backend
+        L{supportsProfiling}).
+
+        @raise xslt.StylesheetException: If an error occurs while
+            parsing the stylesheet.
+        """
+        raise NotImplementedError
+
+    def setDepthLimits(self, maxTemplateDepth, maxVariableDepth):
+        """
+        Limit the depth of nested template calls and the number of
+        variables (and parameters) on the stack of the transformations
+        that are started after this call.  A limit of C{None} restores
+        libxslt's default.  A transformation that exceeds one of the
+        limits fails with a L{xslt.StylesheetException}.
+
+        @raise ValueError: If the backend cannot set one of the limits.
+        """
+        raise NotImplementedError
+
+    def registerFunctions(self, namespace, functions):
+        """Make the given callables (a dictionary mapping names to
+        callables that accept an XPath context followed by the function
+        arguments) available to stylesheets as extension functions in
+        the given namespace."""
+        raise NotImplementedError
+
+
+    # ----------------------------------
+    # Entity resolution.
+    #
+
+    def installEntityLoader(self, entityLoader):
+        """Use the given L{loader.EntityLoader} to load the files that
+        are referenced while parsing the stylesheet and while
+        transforming the document."""
+        raise NotImplementedError
+
+
+
+# ######################################################################
+# Backend registry.
+#
+
+BACKENDS = {
+    'libxml2': ('libxml2backend', 'Libxml2Backend', 'libxslt'),
+    'lxml': ('lxmlbackend', 'LxmlBackend', 'lxml'),
+}
+"""XML backends, mapped to a C{(module, class, required module)} tuple.
+Backend modules are only imported when the backend is first used; use
+L{backendAvailable} to find out if a backend's required module is
+installed."""
+
+# The backend objects that have been created, by name.
+_backends = {}
+
+def backendAvailable(name):
+    """
+    Determine if the given XML backend can be used.
+
+    @param name: The name of the backend (a key in L{BACKENDS}).
+    @type name: C{str}
+    @return: C{True} if the backend is known and its required module
+        is installed.
+    @rtype: C{bool}
+    """
+
+    try:
+        moduleName, className, required = BACKENDS[name]
+    except KeyError:
+        return False
+
+    try:
+        fp, path, description = imp.find_module(required)
+    except ImportError:
+        return False
+
+    if fp:
+        fp.close()
+    return True
+
+def getBackend(name='libxml2'):
+    """
+    Return the XML backend with the given name.  Backends do not have
+    any per-document state, so a single backend object is shared by all
+    callers.
+
+    @param name: The name of the backend (a key in L{BACKENDS}).
+    @type name: C{str}
+    @return: The backend.
+    @rtype: L{XmlBackend}
+    @raise ValueError: If the backend is unknown or its required module
+        is not installed.
+    """
+
+    try:
+        return _backends[name]
+    except KeyError:
+        pass
+
+    if not backendAvailable(name):
+        raise ValueError, 'XML backend not available: %s' % (name)
+
+    moduleName, className, required = BACKENDS[name]
+    module = __import__(moduleName, globals(), {}, [])
+    backend = _backends[name] = getattr(module, className)()
+    return backend
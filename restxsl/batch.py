@@ -0,0 +1,835 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Renders batches of reStructuredText files with a shared configuration.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import cPickle
+import json
+import os
+import Queue
+import re
+import select
+import signal
+import sys
+import time
+
+# restxsl imports.
+import backend
+import documentcache
+import extfunctions
+import includecache
+import limits
+import transform
+import xslt
+
+
+
+# ######################################################################
+# RenderFailure class.
+#
+
+class RenderFailure(object):
+    """
+    A file that could not be rendered.  L{renderBatch} generates these
+    in place of the file's information when it is asked to keep going
+    after errors.
+
+    @ivar restPath: The path of the reStructuredText file.
+    @type restPath: C{str}
+    @ivar error: The name of the exception class.
+    @type error: C{str}
+    @ivar message: The exception's message (the docutils or libxslt
+        diagnostics, for example).
+    @type message: C{str}
+    """
+
+    def __init__(self, restPath, error, message):
+        self.restPath = restPath
+        self.error = error
+        self.message = message
+
+    def __str__(self):
+        return '%s: %s: %s' % (self.restPath, self.error, self.message)
+
+
+
+# ######################################################################
+# Renderer class.
+#
+
+class Renderer(object):
+    """
+    Renders reStructuredText files with a fixed set of options.  The
+    Renderer keeps its caches (included files, compiled stylesheets, and
+    optionally parsed documents) warm between files, so a single
+    Renderer should be used for an entire batch of files.
+
+    @ivar includeCache: The cache of included files.
+    @type includeCache: L{includecache.IncludeCache}
+    @ivar stylesheetCache: The cache of compiled stylesheets.
+    @type stylesheetCache: L{xslt.StylesheetCache}
+    """
+
+    # ----------------------------------
+    # Constructor and destructor.
+    #
+
+    def __init__(self,
+                 smartPunctuation=False,
+                 extModule=None, extModuleCookie=None,
+                 encoding='ASCII',
+                 xslBasePath=None,
+                 xslPath=None, xslParams=None,
+                 extension='html',
+                 doctreeCache=None,
+                 renderLimits=None,
+                 xmlBackend=None,
+                 documentCache=None,
+                 splitSections=False,
+                 collectLinks=False,
+                 profileTemplates=False,
+                 reportLevel=2,
+                 instanceHashes=None,
+                 outputSettings=None):
+        """
+        Initialize the Renderer.  Most of the arguments are passed
+        straight through to L{transform.restxsl}.
+
+        @param extension: The extension (without a leading period) of
+            the output files.
+        @type extension: C{str}
+        @param renderLimits: The limits on the resources used to render
+            each document.  If the limits ask for isolation, each
+            document is rendered in a separate process, which can be
+            killed if it runs out of time or memory.  Note that isolated
+            documents do not benefit from the Renderer's in-memory
+            caches.
+        @type renderLimits: L{limits.RenderLimits}
+        @param xmlBackend: The XML backend used to render the documents,
+            or C{None} to use the libxml2 backend.
+        @type xmlBackend: L{backend.XmlBackend}
+        @param documentCache: The cache of the documents returned by the
+            C{restxsl:document()} extension function, or C{None} to
+            create an empty cache.  The cache must use the same XML
+            backend.
+        @type documentCache: L{documentcache.DocumentCache}
+        @param splitSections: C{True} to render each top-level section
+            of a document into its own output file, named after the
+            document and the section's id (C{manual-intro.html}).
+        @type splitSections: C{bool}
+        @param collectLinks: C{True} to record the links and anchors of
+            each document in its information, for L{linkcheck}.
+        @type collectLinks: C{bool}
+        @param profileTemplates: C{True} to record the time spent in
+            each stylesheet template in the information of each
+            document.
+        @type profileTemplates: C{bool}
+        @param reportLevel: The lowest level of the docutils system
+            messages returned in the information of each document.
+        @type reportLevel: C{int}
+        @param instanceHashes: The digests of the multidoc instances
+            rendered by a previous run, keyed by the path of the
+            reStructuredText file and then by instance filename, or
+            C{None} to render every instance.  Instances that have not
+            changed (and whose output files still exist) are not
+            rendered; see L{transform.RenderInfo.skippedOutputs}.
+        @type instanceHashes: C{dict} mapping C{str} to C{dict}
+        @param outputSettings: The settings used to write the output
+            files (see L{output.OutputWriter.settings}), which are part
+            of the multidoc instance digests.
+        @type outputSettings: C{tuple}
+        """
+
+        # Store the options.
+        self.smartPunctuation = smartPunctuation
+        self.extModule = extModule
+        self.extModuleCookie = extModuleCookie
+        self.encoding = encoding
+        self.xslBasePath = xslBasePath
+        self.xslPath = xslPath
+        self.xslParams = xslParams or {}
+        self.extension = extension
+        self.doctreeCache = doctreeCache
+        self.splitSections = splitSections
+        self.collectLinks = collectLinks
+        self.profileTemplates = profileTemplates
+        self.reportLevel = reportLevel
+        self.instanceHashes = instanceHashes
+        self.outputSettings = outputSettings
+        self.renderLimits = renderLimits or limits.RenderLimits()
+        self.xmlBackend = xmlBackend or backend.getBackend()
+
+        # Create the caches.
+        self.includeCache = includecache.IncludeCache()
+        self.stylesheetCache = xslt.StylesheetCache(self.xmlBackend)
+        self.documentCache = documentCache \
+            or documentcache.DocumentCache(self.xmlBackend)
+
+        # Create the extension module's XSLT extension functions, so
+        # that their results are memoized across the batch.
+        self.extFunctions = None
+        if hasattr(extModule, 'XSLT_FUNCTIONS'):
+            self.extFunctions = extfunctions.ExtensionFunctions(
+                extModule, extModuleCookie, self.renderLimits.extTimeout,
+                self.xmlBackend)
+
+
+    # ----------------------------------
+    # Renderer methods.
+    #
+
+    def render(self, restFile, xslPath=None, xslParams=None,
+               outputPath=None):
+        """
+        Render a reStructuredText file.
+
+        @param restFile: The path to the reStructuredText file, or C{-}
+            to read the file from stdin.
+        @type restFile: C{str}
+        @param xslPath: The stylesheet to use instead of the Renderer's
+            stylesheet (or the stylesheet named by the document).
+        @type xslPath: C{str}
+        @param xslParams: Stylesheet parameters that will be added to
+            (or will replace) the Renderer's parameters.
+        @type xslParams: C{dict}
+        @param outputPath: The path of the output file for a
+            single-document result, or C{None} to name the output file
+            after the reStructuredText file.
+        @type outputPath: C{str}
+        @return: A C{(outputs, info)} tuple.  C{outputs} is a list of
+            C{(path, XML text)} tuples, one for each result document;
+            the path is C{None} for documents read from stdin.  C{info}
+            is the L{transform.RenderInfo} for the file.
+        @rtype: C{tuple}
+        @raise limits.LimitExceeded: If the document exceeds one of its
+            render limits.
+        """
+
+        # Read the document from stdin if the filename is '-'.
+        if restFile == '-':
+            restPath, restSource = None, sys.stdin
+        else:
+            restPath, restSource = restFile, None
+
+        # Render the document in a separate process if requested to do
+        # so.  The child process cannot read our stdin, so we read the
+        # document for it.
+        if self.renderLimits.isolate and hasattr(os, 'fork'):
+            if restSource is not None:
+                restSource = restSource.read()
+            return self.__renderIsolated(
+                restPath, restSource, xslPath, xslParams, outputPath)
+        else:
+            return self.__render(
+                restPath, restSource, xslPath, xslParams, outputPath)
+
+
+    # ----------------------------------
+    # Private methods.
+    #
+
+    def __render(self, restPath, restSource, xslPath, xslParams, outputPath):
+        # Combine the stylesheet parameters.
+        params = self.xslParams.copy()
+        if xslParams:
+            params.update(xslParams)
+
+        # Find the digests of the multidoc instances rendered by the
+        # previous run, ignoring instances whose output files are gone.
+        previousHashes = None
+        if self.instanceHashes is not None and restPath is not None:
+            previousHashes = dict(
+                (filename, digest) for filename, digest
+                in self.instanceHashes.get(restPath, {}).items()
+                if os.path.exists(filename + '.' + self.extension))
+
+        # Convert the reStructuredText file to an XML file.
+        info = transform.RenderInfo()
+        resultDocuments = transform.restxsl(
+            restPath, restSource=restSource,
+            smartPunctuation=self.smartPunctuation,
+            extModule=self.extModule, extModuleCookie=self.extModuleCookie,
+            encoding=self.encoding,
+            xslBasePath=self.xslBasePath,
+            xslPath=xslPath or self.xslPath, xslParams=params,
+            doctreeCache=self.doctreeCache, includeCache=self.includeCache,
+            stylesheetCache=self.stylesheetCache, info=info,
+            renderLimits=self.renderLimits, extFunctions=self.extFunctions,
+            xmlBackend=self.xmlBackend, documentCache=self.documentCache,
+            splitSections=self.splitSections,
+            collectLinks=self.collectLinks,
+            profileTemplates=self.profileTemplates,
+            reportLevel=self.reportLevel,
+            instanceHashes=previousHashes,
+            outputSettings=self.outputSettings)
+
+        # Name each of the result documents.
+        outputs = []
+        for filename, xml in resultDocuments:
+            if restPath is None:
+                path = None
+            elif filename is None and outputPath:
+                path = outputPath
+            else:
+                # Generate the filename ourselves if one was not given
+                # to us by the restxsl function.  This will only be
+                # necessary if we are not processing a multidoc or split
+                # result set (because multidoc and split results always
+                # have filenames, and single document results never
+                # do).
+                if filename is None:
+                    assert len(resultDocuments) == 1
+                    filename = os.path.splitext(restPath)[0]
+                path = filename + '.' + self.extension
+
+            outputs.append((path, xml))
+
+        # Name the output files of the instances that were skipped.
+        info.skippedOutputs = [
+            filename + '.' + self.extension
+            for filename in info.skippedInstances]
+
+        # Return the outputs.
+        return (outputs, info)
+
+    def __renderIsolated(self, restPath, restSource, xslPath, xslParams,
+                         outputPath):
+        # Fork a child process to render the document.  The child sends
+        # the pickled result back to us through a pipe.
+        readFd, writeFd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Child process.
+            try:
+                os.close(readFd)
+                _renderChild(
+                    writeFd, self.renderLimits.maxMemory, self.__render,
+                    restPath, restSource, xslPath, xslParams, outputPath)
+            finally:
+                os._exit(0)
+
+        # Read the result, killing the child if it runs out of time.
+        os.close(writeFd)
+        try:
+            data = _readWithTimeout(readFd, self.renderLimits.timeout)
+        finally:
+            os.close(readFd)
+
+        if data is None:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            raise limits.LimitExceeded(
+                'timeout', 'Exceeded the timeout limit of %s seconds.' % (
+                    self.renderLimits.timeout))
+
+        pid, status = os.waitpid(pid, 0)
+
+        # The child died without sending a result if there is no data;
+        # running out of memory is the most likely cause.
+        if not data:
+            if self.renderLimits.maxMemory:
+                raise limits.LimitExceeded(
+                    'memory',
+                    'Render process died (status %d); the memory limit '
+                    'is %d bytes.' % (status, self.renderLimits.maxMemory))
+            raise RuntimeError, 'Render process died (status %d).' % (status)
+
+        # Return the result or raise the child's exception.
+        isError, result = cPickle.loads(data)
+        if isError:
+            raise result
+        return result
+
+
+
+# ######################################################################
+# Process isolation.
+#
+
+def _renderChild(writeFd, maxMemory, render, *args):
+    """Render a document in a child process, writing the pickled
+    C{(isError, result)} tuple to the given file descriptor."""
+
+    # Limit the size of our address space.
+    if maxMemory:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (maxMemory, maxMemory))
+
+    # Render the document.
+    try:
+        result = (False, render(*args))
+    except MemoryError, e:
+        if maxMemory:
+            e = limits.LimitExceeded(
+                'memory', 'Exceeded the memory limit of %d bytes.' % (
+                    maxMemory))
+        result = (True, e)
+    except Exception, e:
+        result = (True, e)
+
+    # Pickle the result.  Not every exception can be pickled, so we
+    # fall back to sending a description of the exception.
+    try:
+        data = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+    except Exception:
+        e = result[1]
+        data = cPickle.dumps(
+            (True, RuntimeError('%s: %s' % (e.__class__.__name__, e))),
+            cPickle.HIGHEST_PROTOCOL)
+
+    # Send the result, then flush our output streams (os._exit will not
+    # do that for us).
+    while data:
+        written = os.write(writeFd, data)
+        data = data[written:]
+    os.close(writeFd)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+def _readWithTimeout(fd, timeout):
+    """Read from the file descriptor until end-of-file, returning
+    C{None} if the timeout expires first."""
+
+    if timeout:
+        deadline = time.time() + timeout
+
+    chunks = []
+    while True:
+        # Wait for data.
+        if timeout:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                return None
+
+        # Read the data.
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+
+    return ''.join(chunks)
+
+
+
+# ######################################################################
+# Batch scheduling.
+#
+
+RE_FIELD = re.compile(r'^:([^:]+):(?:[ \t]+(.*?))?[ \t]*$')
+RE_ADORNMENT = re.compile(r'^([!-/:-@\[-`{-~])\1+[ \t]*$')
+
+def scanXslTemplate(restPath):
+    """
+    Find the stylesheet named by a reStructuredText file's
+    C{:xsl-template:} field without parsing the file.  Only the field
+    list at the start of the document (after the title and any
+    comments) is scanned, and the file is only read up to the end of
+    that field list, so this is just a scheduling hint: fields in
+    included files or later in the document are not found, for
+    example.  As with L{restxmldoc.RestXmlDocument}, the last
+    C{:xsl-template:} field wins.
+
+    @param restPath: The path to the reStructuredText file.
+    @type restPath: C{str}
+    @return: The stylesheet path, or C{None} if the file does not have
+        an C{:xsl-template:} field (or cannot be read).
+    @rtype: C{str}
+    """
+
+    template = None
+    try:
+        f = open(restPath, 'r')
+        try:
+            inFields = False
+            titleText = False
+            for line in f:
+                line = line.rstrip('\r\n')
+
+                # Blank lines and indented lines (field bodies, comment
+                # text, and so on) do not end the header, unless the
+                # previous line was a paragraph instead of a title.
+                if not line.strip() or line[0] in ' \t':
+                    if titleText:
+                        break
+                    continue
+
+                # Record the fields, stopping at the first line after
+                # the field list.
+                match = RE_FIELD.match(line)
+                if match:
+                    inFields = True
+                    titleText = False
+                    if match.group(1) == 'xsl-template':
+                        template = match.group(2) or None
+                    continue
+                elif inFields:
+                    break
+
+                # Skip comments and section title adornments.  Any other
+                # line must be title text (which is followed by its
+                # adornment); otherwise the document does not start with
+                # a field list.
+                if line.startswith('..') and not RE_ADORNMENT.match(line):
+                    continue
+                elif RE_ADORNMENT.match(line):
+                    titleText = False
+                elif titleText:
+                    break
+                else:
+                    titleText = True
+        finally:
+            f.close()
+    except IOError:
+        return None
+
+    return template
+
+def groupByStylesheet(restFiles, xslPath=None):
+    """
+    Group reStructuredText files by the stylesheet that they will be
+    transformed with, so that each stylesheet is compiled as few times as
+    possible (and so that the stylesheet stays hot in each worker's
+    cache).  Groups are returned in the order in which their first file
+    appears in C{restFiles}, and files keep their relative order within
+    each group.
+
+        >>> groupByStylesheet(['a.txt', 'b.txt'], 'site.xsl')
+        [['a.txt', 'b.txt']]
+
+    @param restFiles: The paths to the reStructuredText files.
+    @type restFiles: C{list} of C{str}
+    @param xslPath: The stylesheet that overrides the stylesheet named by
+        each file, or C{None}.
+    @type xslPath: C{str}
+    @return: The groups of files.
+    @rtype: C{list} of C{list} of C{str}
+    """
+
+    # Every file uses the same stylesheet if we were given one.
+    if xslPath:
+        return [list(restFiles)]
+
+    # Group the files.  Relative stylesheet paths are relative to the
+    # directory containing the reStructuredText file.
+    groups = {}
+    order = []
+    for restFile in restFiles:
+        template = None
+        if restFile != '-':
+            template = scanXslTemplate(restFile)
+            if template and not os.path.isabs(template):
+                template = os.path.join(os.path.dirname(restFile), template)
+
+        if template not in groups:
+            groups[template] = []
+            order.append(template)
+        groups[template].append(restFile)
+
+    # Return the groups.
+    return [groups[template] for template in order]
+
+
+def _renderFile(renderer, restFile, keepGoing):
+    # Render a single file, turning any error into a RenderFailure if we
+    # are to keep going.
+    try:
+        outputs, info = renderer.render(restFile)
+    except Exception, e:
+        if not keepGoing:
+            raise
+        return (restFile, None, RenderFailure(
+            restFile, e.__class__.__name__, str(e)))
+    return (restFile, outputs, info)
+
+def _renderChunks(renderer, tasks, results, keepGoing):
+    # Render the chunks sent to a worker process until we are sent None.
+    # Errors are sent back with the chunk, so that they are raised in
+    # the parent when the chunk's results are reached.
+    for chunkIndex, chunk in iter(tasks.get, None):
+        try:
+            result = (chunkIndex, [_renderFile(renderer, restFile, keepGoing)
+                                   for restFile in chunk], None)
+        except Exception, e:
+            try:
+                cPickle.dumps(e, 2)
+            except Exception:
+                e = RuntimeError('%s: %s' % (e.__class__.__name__, e))
+            result = (chunkIndex, None, e)
+        results.put(result)
+
+
+class _ChunkQueue(object):
+    """
+    The chunks of a batch, with the chunks that have not been sent to a
+    worker yet queued by stylesheet group.
+
+    @ivar chunks: The files in each chunk.
+    @type chunks: C{list} of C{list} of C{str}
+    """
+
+    def __init__(self, groups, chunkSize):
+        self.chunks = []
+        self.__pending = []
+        for group in groups:
+            self.__pending.append([])
+            for i in range(0, len(group), chunkSize):
+                self.__pending[-1].append(len(self.chunks))
+                self.chunks.append(group[i:i + chunkSize])
+        self.__unstarted = [index for index in range(len(self.__pending))
+                            if self.__pending[index]]
+
+    def next(self, group):
+        """
+        Return the group and index of the next chunk for a worker that
+        has been rendering the given group (or C{None} for a new
+        worker), or C{(None, None)} if there are no chunks left.  The
+        worker stays with its group until the group runs out of chunks,
+        then starts the next group that no worker has started, then
+        helps with the group that has the most chunks left.
+        """
+
+        if group is None or not self.__pending[group]:
+            if self.__unstarted:
+                group = self.__unstarted.pop(0)
+            else:
+                group = max(range(len(self.__pending)),
+                            key=lambda index: len(self.__pending[index]))
+                if not self.__pending[group]:
+                    return None, None
+        return group, self.__pending[group].pop(0)
+
+
+class _BatchWorker(object):
+    """
+    A process that renders chunks of a batch, along with the stylesheet
+    group whose chunks it is rendering.
+    """
+
+    def __init__(self, renderer, chunks, results, keepGoing):
+        import multiprocessing
+        self.chunks = chunks
+        self.tasks = multiprocessing.Queue()
+        self.group = None
+        self.chunkIndex = None
+        self.process = multiprocessing.Process(
+            target=_renderChunks,
+            args=(renderer, self.tasks, results, keepGoing))
+        self.process.daemon = True
+        self.process.start()
+
+    def send(self, group, chunkIndex):
+        """Send a chunk to the worker, or C{None} to stop the worker."""
+        self.group = group
+        self.chunkIndex = chunkIndex
+        if chunkIndex is None:
+            self.tasks.put(None)
+        else:
+            self.tasks.put((chunkIndex, self.chunks[chunkIndex]))
+
+
+def renderBatch(renderer, groups, jobs=1, chunkSize=8, keepGoing=False):
+    """
+    Render groups of reStructuredText files (as returned by
+    L{groupByStylesheet}), optionally spreading the work across several
+    processes.  Each group is split into chunks of files.  A process
+    keeps rendering the chunks of the group that it started with, so
+    each stylesheet is compiled by as few processes as possible; once
+    its group is finished, a process moves on to a group that has not
+    been started yet, and only when there are none left does it help
+    with the group that has the most chunks remaining.
+
+    Results are generated in the order of the files in C{groups}.
+
+    @param renderer: The renderer used to render the files.  Each
+        process gets its own copy of the renderer (and its caches).
+    @type renderer: L{Renderer}
+    @param groups: The groups of files to render.
+    @type groups: C{list} of C{list} of C{str}
+    @param jobs: The number of processes to use.
+    @type jobs: C{int}
+    @param chunkSize: The maximum number of files in each chunk.
+    @type chunkSize: C{int}
+    @param keepGoing: C{True} to continue rendering the remaining files
+        when a file cannot be rendered, instead of raising the error.
+    @type keepGoing: C{bool}
+    @return: An iterator over C{(restFile, outputs, info)} tuples, where
+        C{outputs} and C{info} are the values returned by
+        L{Renderer.render}.  If C{keepGoing} is C{True}, files that
+        could not be rendered generate C{(restFile, None, failure)}
+        tuples, where C{failure} is a L{RenderFailure}.
+    @rtype: C{iterator}
+    """
+
+    # Render the files in this process if we only have one job.
+    if jobs <= 1:
+        for group in groups:
+            for restFile in group:
+                yield _renderFile(renderer, restFile, keepGoing)
+        return
+
+    # Split the groups into chunks.
+    chunkQueue = _ChunkQueue(groups, chunkSize)
+    chunks = chunkQueue.chunks
+
+    # Start the worker processes.  multiprocessing is only imported when
+    # it is needed, since it is relatively expensive to import.
+    import multiprocessing
+    results = multiprocessing.Queue()
+    workers = []
+    try:
+        for index in range(min(jobs, len(chunks))):
+            worker = _BatchWorker(renderer, chunks, results, keepGoing)
+            workers.append(worker)
+            worker.send(*chunkQueue.next(None))
+
+        # Collect the results, giving each worker its next chunk as soon
+        # as it is done with the previous one, and generate the results
+        # in the order of the chunks.
+        finished = {}
+        nextIndex = 0
+        while nextIndex < len(chunks):
+            if nextIndex in finished:
+                chunkResults, error = finished.pop(nextIndex)
+                if error is not None:
+                    raise error
+                for result in chunkResults:
+                    yield result
+                nextIndex += 1
+                continue
+
+            try:
+                chunkIndex, chunkResults, error = results.get(timeout=1)
+            except Queue.Empty:
+                for worker in workers:
+                    if worker.chunkIndex is not None \
+                            and not worker.process.is_alive():
+                        raise RuntimeError(
+                            'Batch worker process exited with status %s.'
+                            % (worker.process.exitcode))
+                continue
+
+            finished[chunkIndex] = (chunkResults, error)
+            for worker in workers:
+                if worker.chunkIndex == chunkIndex:
+                    worker.send(*chunkQueue.next(worker.group))
+                    break
+    finally:
+        for worker in workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.process.join()
+
+
+
+# ######################################################################
+# Failure lists.
+#
+
+def loadFailures(path):
+    """
+    Return the failures recorded in the given failure list, or an empty
+    list if the failure list does not exist.
+
+    @rtype: C{list} of L{RenderFailure}
+    """
+
+    if not os.path.exists(path):
+        return []
+
+    f = open(path, 'r')
+    try:
+        return [RenderFailure(str(entry['path']), entry['error'],
+                              entry['message'])
+                for entry in json.load(f)['failures']]
+    finally:
+        f.close()
+
+def writeFailures(path, failures):
+    """
+    Write the given failures to a failure list.
+
+    @param path: The path of the failure list.
+    @type path: C{str}
+    @param failures: The failures.
+    @type failures: C{list} of L{RenderFailure}
+    """
+
+    entries = [{'path': failure.restPath, 'error': failure.error,
+                'message': failure.message}
+               for failure in failures]
+
+    f = open(path, 'w')
+    try:
+        f.write(json.dumps({'failures': entries}, indent=1, sort_keys=True))
+    finally:
+        f.close()
+
+
+
+# ######################################################################
+# Utility functions.
+#
+
+def quoteParams(params):
+    """
+    Quote stylesheet parameter values as XPATH string literals.
+
+        >>> quoteParams({'title': 'Home'})
+        {'title': "'Home'"}
+        >>> quoteParams({'title': "Don't panic"})
+        {'title': '"Don\\'t panic"'}
+
+    @param params: The parameters.
+    @type params: C{dict}
+    @return: The quoted parameters.
+    @rtype: C{dict}
+    """
+
+    quoted = {}
+    for name, value in params.items():
+        quoted[name] = transform._xpathLiteral(value)
+    return quoted
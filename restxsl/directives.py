@@ -44,19 +44,54 @@ reStructuredText directives provided by the restxsl module.
 
 # Python imports.
 import cStringIO
+import imp
 import os
 import re
 import sys
+import time
 
 # Docutils imports.
+import docutils.io
 import docutils.nodes
 import docutils.parsers.rst
+import docutils.parsers.rst.directives.misc
+import docutils.parsers.rst.states
+import docutils.statemachine
+import docutils.utils
 
 # restxsl imports.
+import limits
 import restxmldoc
 
 
 
+# ######################################################################
+# Optional module support.
+#
+
+def _moduleAvailable(name):
+    """
+    Determine if the given top-level module can be imported, without
+    actually importing it.  Optional modules used by our directives are
+    only imported when a document uses the directive.
+
+    @param name: The name of the module.
+    @type name: C{str}
+    @return: C{True} if the module can be found, otherwise C{False}.
+    @rtype: C{bool}
+    """
+
+    try:
+        fp, path, description = imp.find_module(name)
+    except ImportError:
+        return False
+
+    if fp:
+        fp.close()
+    return True
+
+
+
 # ######################################################################
 # code-block directive.
 #
@@ -126,7 +161,11 @@ def code_block_directive(name, arguments, options, content, lineno,
                 line=lineno)
             return [error]
 
-    # Load the SilverCity HTML generator for the specified language.
+    # Load the SilverCity HTML generator for the specified language.  We
+    # import SilverCity here (instead of at the top of the module) so
+    # that documents which do not use this directive do not pay for the
+    # import.
+    import SilverCity
     try:
         module = getattr(SilverCity, language)
         generator = getattr(module, language + 'HTMLGenerator')
@@ -157,16 +196,12 @@ code_block_directive.options = {
 }
 code_block_directive.content = True
 
-# Register the directive with docutils if we are able to load the
-# SilverCity module.
-try:
-    import SilverCity
+# Register the directive with docutils if the SilverCity module is
+# available.  If it is not, that is not an error; it just means that we
+# cannot provide the directive.
+if _moduleAvailable('SilverCity'):
     docutils.parsers.rst.directives.register_directive(
         'code-block', code_block_directive)
-except ImportError:
-    # Not an error; it just means that we do not have the SilverCity
-    # module available.
-    pass
 
 
 
@@ -191,6 +226,11 @@ def pyxslt_directive(name, arguments, options, content, lineno,
     will be passed straight-through to the XSL stylesheet for parsing.
     """
 
+    # The results of the Python function are not known until the
+    # document is parsed, so documents that use the pyxslt directive
+    # cannot be stored in the doctree cache.
+    state.document.settings.restxsl_uncacheable = True
+
     # Parse the arguments into a method name and keyword arguments to
     # that method.
     lines = arguments[0].split('\n')
@@ -246,11 +286,27 @@ def pyxslt_directive(name, arguments, options, content, lineno,
             line=lineno)
         return [error]
 
-    # Execute the Python function and collect the results.
+    # Execute the Python function and collect the results, enforcing
+    # the time limit on extension functions and recording the time
+    # taken by the call.
+    renderLimits = state.document.settings.restxsl_limits
+    timer = limits.Timer(
+        'ext-timeout', renderLimits and renderLimits.extTimeout)
     try:
-        results = method(
-            state.document.settings.restxsl_ext_module_cookie,
-            **methodKeywordArgs)
+        timer.start()
+        startTime = time.time()
+        try:
+            results = method(
+                state.document.settings.restxsl_ext_module_cookie,
+                **methodKeywordArgs)
+        finally:
+            timer.stop()
+            extCalls = state.document.settings.restxsl_ext_calls
+            if extCalls is not None:
+                extCalls.append((methodName, time.time() - startTime))
+    except limits.LimitExceeded:
+        # Limit violations abort the transformation.
+        raise
     except:
         error = state_machine.reporter.error(
             'Error executing Python function %s: %s' % (
@@ -271,7 +327,10 @@ def pyxslt_directive(name, arguments, options, content, lineno,
                 line=lineno)
             return [error]
 
-    # Serialize the results.
+    # Serialize the results.  The serializer is imported here so that
+    # documents which do not use this directive do not pay for the
+    # import.
+    import pyxslt.serialize
     ser = pyxslt.serialize.Serializer()
     ser.serializeOne(results)
     doc = ser.toXmlDoc()
@@ -297,13 +356,146 @@ def pyxslt_directive(name, arguments, options, content, lineno,
 pyxslt_directive.arguments = (1, 0, True)
 pyxslt_directive.content = True
     
-# Register the directive with docutils if we are able to load the pyxslt
-# module.
-try:
-    import pyxslt.serialize
+# Register the directive with docutils if the pyxslt module is
+# available.  If it is not, that is not an error; it just means that we
+# cannot provide the directive.
+if _moduleAvailable('pyxslt'):
     docutils.parsers.rst.directives.register_directive(
         'pyxslt', pyxslt_directive)
-except ImportError:
-    # Not an error; it just means that we do not have the pyxslt module
-    # available.
-    pass
+
+
+
+# ######################################################################
+# include directive.
+#
+
+# The exception reported by docutils when an input file cannot be
+# opened (older versions of docutils report IOError).
+_InputError = getattr(docutils.io, 'InputError', IOError)
+
+class CachedInclude(docutils.parsers.rst.directives.misc.Include):
+    """
+    The docutils include directive, reading included reStructuredText
+    files through the restxsl include cache given to
+    L{restxsl.transform.restxsl}.  The directive supports the same
+    options as the docutils directive (selecting the included text with
+    C{start-line}, C{end-line}, C{start-after}, and C{end-before}, and
+    refusing circular inclusions) using only the public directive API.
+    Files included as literal blocks, as code, or with another parser
+    are left to the docutils directive, and are not cached.  See
+    L{registerIncludeDirective}.
+    """
+
+    def run(self):
+        # Use the docutils directive if we do not have a cache, or if
+        # the file is not included as reStructuredText.
+        settings = self.state.document.settings
+        includeCache = settings.restxsl_include_cache
+        if includeCache is None or 'literal' in self.options \
+                or 'code' in self.options or 'parser' in self.options:
+            return docutils.parsers.rst.directives.misc.Include.run(self)
+        if not settings.file_insertion_enabled:
+            raise self.warning('"%s" directive disabled.' % (self.name))
+
+        # Find the file, relative to the file that contains the
+        # directive.
+        source = self.state_machine.input_lines.source(
+            self.lineno - self.state_machine.input_offset - 1)
+        path = docutils.parsers.rst.directives.path(self.arguments[0])
+        if path.startswith('<') and path.endswith('>'):
+            path = os.path.join(self.standard_include_path, path[1:-1])
+        path = os.path.normpath(
+            os.path.join(os.path.dirname(os.path.abspath(source)), path))
+        path = docutils.nodes.reprunicode(
+            docutils.utils.relative_path(None, path))
+        settings.record_dependencies.add(path)
+
+        # Refuse to include a file (with the same options) that is
+        # already being included.  The log holds a (path, options, end
+        # line) tuple for each inclusion; inclusions that end before
+        # this directive are finished.
+        startLine = self.options.get('start-line', None)
+        endLine = self.options.get('end-line', None)
+        afterText = self.options.get('start-after', None)
+        beforeText = self.options.get('end-before', None)
+        clipOptions = (startLine, endLine, beforeText, afterText)
+        includeLog = getattr(
+            self.state.document, 'restxsl_include_log', None) or [
+                (docutils.utils.relative_path(None, source),
+                 (None, None, None, None), sys.maxint // 2)]
+        includeLog = [entry for entry in includeLog
+                      if entry[2] >= self.lineno]
+        if (path, clipOptions) in [(logPath, logOptions)
+                                   for logPath, logOptions, logEnd
+                                   in includeLog]:
+            raise self.warning(
+                'circular inclusion in "%s" directive: %s' % (
+                    self.name, ' < '.join([path] + [
+                        logPath for logPath, logOptions, logEnd
+                        in includeLog[::-1]])))
+
+        # Read the file through the cache.
+        try:
+            text = includeCache.read(
+                path, self.options.get('encoding', settings.input_encoding),
+                settings.input_encoding_error_handler)
+        except (IOError, OSError), e:
+            raise self.severe(u'Problems with "%s" directive path:\n%s: %s.'
+                              % (self.name, _InputError.__name__, e))
+        except UnicodeError, e:
+            raise self.severe(u'Problem with "%s" directive:\n%s: %s'
+                              % (self.name, e.__class__.__name__, e))
+
+        # Select the part of the file to include.
+        if startLine or endLine is not None:
+            text = ''.join(text.splitlines(True)[startLine:endLine])
+        if afterText:
+            index = text.find(afterText)
+            if index < 0:
+                raise self.severe('Problem with "start-after" option of "%s" '
+                                  'directive:\nText not found.' % (self.name))
+            text = text[index + len(afterText):]
+        if beforeText:
+            index = text.find(beforeText)
+            if index < 0:
+                raise self.severe('Problem with "end-before" option of "%s" '
+                                  'directive:\nText not found.' % (self.name))
+            text = text[:index]
+
+        # Split the text into lines, enforcing the line length limit of
+        # the docutils versions that have one.
+        includeLines = docutils.statemachine.string2lines(
+            text, self.options.get('tab-width', settings.tab_width),
+            convert_whitespace=True)
+        lineLengthLimit = getattr(settings, 'line_length_limit', None)
+        if lineLengthLimit is not None:
+            for index, line in enumerate(includeLines):
+                if len(line) > lineLengthLimit:
+                    raise self.warning(
+                        '"%s": line %d exceeds the line-length-limit.'
+                        % (path, index + 1))
+
+        # Parse the lines as part of the document, and log the
+        # inclusion.
+        self.state_machine.insert_input(includeLines, path)
+        includeLog.append((path, clipOptions, self.lineno))
+        self.state.document.restxsl_include_log = [
+            (logPath, logOptions, logEnd + len(includeLines) + 2)
+            for logPath, logOptions, logEnd in includeLog]
+        return []
+
+def registerIncludeDirective(useCache):
+    """
+    Register the include directive used to parse the next document:
+    L{CachedInclude} if the document is parsed with an include cache,
+    otherwise the standard docutils directive.
+
+    @param useCache: C{True} if the document has an include cache.
+    @type useCache: C{bool}
+    """
+
+    if useCache:
+        directive = CachedInclude
+    else:
+        directive = docutils.parsers.rst.directives.misc.Include
+    docutils.parsers.rst.directives.register_directive('include', directive)
@@ -0,0 +1,331 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Provides an on-disk cache of parsed reStructuredText document trees.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import cPickle
+import hashlib
+import os
+import tempfile
+
+# Docutils imports.
+import docutils
+import docutils.utils
+
+# restxsl imports.
+import restxsl
+
+
+
+# ######################################################################
+# DoctreeCache class.
+#
+
+class DoctreeCache(object):
+    """
+    Cache of pickled docutils document trees, stored as individual files
+    in a cache directory.  Entries are keyed by the content of the
+    reStructuredText source, the docutils and restxsl versions, and the
+    docutils settings used to parse the source.  Each entry also records
+    the files that the source depended on (through C{include} directives,
+    for example) so that the entry can be ignored when one of those files
+    changes.
+
+    The total size of the cache directory is bounded.  The cache keeps
+    a running total of the size of its entries (the directory is only
+    measured when the cache is first written to, and when it is
+    pruned), and removes the least-recently used entries when the total
+    grows beyond that bound.  Other processes can add entries to the
+    same directory, so L{close} prunes the cache once more at the end of
+    a run.
+
+    Document trees that contain the results of C{pyxslt} directives are
+    never cached, because those results depend on the extension module
+    and cannot be pickled.
+    """
+
+    # ----------------------------------
+    # Constructor and destructor.
+    #
+
+    def __init__(self, cacheDir, maxSize=64*1024*1024):
+        """
+        Initialize the DoctreeCache with the directory that will hold
+        the cache entries.  The directory is created if it does not
+        already exist.
+
+        @param cacheDir: The path to the cache directory.
+        @type cacheDir: C{str}
+        @param maxSize: The maximum size, in bytes, of all of the entries
+            in the cache directory.
+        @type maxSize: C{int}
+        """
+
+        # Store our configuration.
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+
+        # Initialize our statistics.
+        self.hits = 0
+        self.misses = 0
+
+        # The total size of the entries in the cache, or None if the
+        # cache directory has not been measured yet.
+        self.__totalSize = None
+
+        # Create the cache directory if necessary.
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+
+    # ----------------------------------
+    # DoctreeCache methods.
+    #
+
+    def key(self, sourcePath, sourceText, settings):
+        """
+        Return the cache key for the given source.
+
+        @param sourcePath: The path to the reStructuredText source.
+            Relative C{include} directives are resolved against this
+            path, so it forms part of the key.
+        @type sourcePath: C{str}
+        @param sourceText: The contents of the reStructuredText source.
+        @type sourceText: C{str} or C{unicode}
+        @param settings: The docutils settings overrides used to parse
+            the source.  Values that cannot be represented (streams, for
+            example) should be removed by the caller.
+        @type settings: C{dict}
+        @return: The cache key.
+        @rtype: C{str}
+        """
+
+        if isinstance(sourceText, unicode):
+            sourceText = sourceText.encode('UTF-8')
+
+        digest = hashlib.sha1()
+        digest.update(sourceText)
+        digest.update('\0'.join([
+            os.path.abspath(sourcePath or ''),
+            docutils.__version__,
+            restxsl.__version__,
+            repr(sorted(settings.items()))]))
+        return digest.hexdigest()
+
+    def load(self, key):
+        """
+        Load the document tree with the given key.
+
+        @param key: The cache key returned by L{key}.
+        @type key: C{str}
+        @return: A C{(document, warnings, dependencies)} tuple, or
+            C{None} if the document is not in the cache (or if one of
+            its dependencies has changed).  The document's C{settings}
+            attribute will be C{None}.
+        @rtype: C{tuple}
+        """
+
+        # Read the cache entry.
+        entryPath = self.__entryPath(key)
+        try:
+            f = open(entryPath, 'rb')
+            try:
+                document, warnings, dependencies = cPickle.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        # Make sure that the document's dependencies have not changed.
+        for path, digest in dependencies:
+            if _fileDigest(path) != digest:
+                self.misses += 1
+                return None
+
+        # Mark the entry as recently used.
+        try:
+            os.utime(entryPath, None)
+        except OSError:
+            pass
+
+        # Give the document a new (silent) reporter; the document walker
+        # logs its progress to the reporter.
+        document.reporter = docutils.utils.Reporter(
+            document.get('source', ''), 5, 5)
+
+        # Return the document.
+        self.hits += 1
+        return (document, warnings, [path for path, digest in dependencies])
+
+    def store(self, key, document, warnings, dependencies):
+        """
+        Store a document tree in the cache.
+
+        @param key: The cache key returned by L{key}.
+        @type key: C{str}
+        @param document: The document tree.
+        @type document: L{docutils.nodes.document}
+        @param warnings: The docutils warnings generated while parsing
+            the document (see L{transform.RenderInfo.warnings}).
+        @type warnings: C{list}
+        @param dependencies: The paths of the files that the document
+            depends on.
+        @type dependencies: C{list} of C{str}
+        """
+
+        # Record a digest of each dependency.
+        dependencies = [(path, _fileDigest(path)) for path in dependencies]
+
+        # The reporter, transformer, and settings refer to streams and
+        # modules and cannot be pickled.  They are not needed once the
+        # document has been parsed, so we leave them out of the cache
+        # entry.
+        saved = (document.reporter, document.transformer, document.settings)
+        document.reporter = document.transformer = document.settings = None
+        try:
+            data = cPickle.dumps(
+                (document, warnings, dependencies), cPickle.HIGHEST_PROTOCOL)
+        finally:
+            (document.reporter, document.transformer, document.settings) \
+                = saved
+
+        # Write the entry to a temporary file and then move it into
+        # place, so that other processes never see a partial entry.
+        entryPath = self.__entryPath(key)
+        try:
+            oldSize = os.path.getsize(entryPath)
+        except OSError:
+            oldSize = 0
+        fd, tempPath = tempfile.mkstemp(dir=self.cacheDir, suffix='.tmp')
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        os.rename(tempPath, entryPath)
+
+        # Keep the cache within its size bound, measuring the cache the
+        # first time that we write to it.
+        if self.__totalSize is None:
+            self.prune()
+        else:
+            self.__totalSize += len(data) - oldSize
+            if self.__totalSize > self.maxSize:
+                self.prune()
+
+    def prune(self):
+        """
+        Measure the cache and, if the total size of the cache is beyond
+        its bound, remove the least-recently used entries until the
+        cache is at 90% of its bound.  The extra room means that the
+        cache does not have to be pruned again on the next L{store}.
+        """
+
+        # Get the size and last-use time of every entry.
+        entries = []
+        totalSize = 0
+        for name in os.listdir(self.cacheDir):
+            if not name.endswith('.doctree'):
+                continue
+
+            path = os.path.join(self.cacheDir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+
+            entries.append((st.st_mtime, st.st_size, path))
+            totalSize += st.st_size
+
+        # Remove the oldest entries first.
+        if totalSize > self.maxSize:
+            entries.sort()
+            for mtime, size, path in entries:
+                if totalSize <= self.maxSize * 9 // 10:
+                    break
+
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                totalSize -= size
+
+        # Remember the size of the cache.
+        self.__totalSize = totalSize
+
+    def close(self):
+        """
+        Prune the cache at the end of a run.  Entries added by other
+        processes (the workers of a batch, for example) are not counted
+        in this cache's running total, so the cache is measured again.
+        """
+
+        self.prune()
+
+
+    # ----------------------------------
+    # Private methods.
+    #
+
+    def __entryPath(self, key):
+        return os.path.join(self.cacheDir, key + '.doctree')
+
+
+
+# ######################################################################
+# Utility functions.
+#
+
+def _fileDigest(path):
+    """Return the SHA-1 digest of the given file, or C{None} if the file
+    cannot be read."""
+
+    try:
+        f = open(path, 'rb')
+        try:
+            return hashlib.sha1(f.read()).hexdigest()
+        finally:
+            f.close()
+    except IOError:
+        return None
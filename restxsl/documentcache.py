@@ -0,0 +1,227 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Provides a cache of the auxiliary XML documents used by stylesheets.
+
+Stylesheets often look up shared data (navigation, author lists, and so
+on) with the XSLT C{document()} function, which parses the file again
+for every page that is transformed.  The C{document} extension function
+in the restxsl namespace returns the same data from a L{DocumentCache}
+instead, so the file is parsed once per batch (or per worker)::
+
+    <xsl:stylesheet version="1.0"
+        xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
+        xmlns:restxsl="urn:restxsl:functions">
+      ...
+      <xsl:for-each select="restxsl:document('/nav.xml')/item">
+
+The href is resolved by the transformation's L{loader.EntityLoader}, in
+the same way as C{document()} hrefs.  Unlike C{document()},
+C{restxsl:document()} returns the root element of the document rather
+than the document node, and the returned nodes are shared by every
+transformation: they must not be used with C{key()}.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import hashlib
+import os
+import threading
+
+# restxsl imports.
+import backend
+import extfunctions
+
+
+
+# ######################################################################
+# DocumentCache class.
+#
+
+class DocumentCache(object):
+    """
+    Cache of parsed XML documents, shared by every transformation in a
+    batch.  An entry is checked against the file's modification time and
+    size whenever it is used; if those have changed, the file is read
+    again, but it is only parsed again if its contents have changed.
+    """
+
+    # ----------------------------------
+    # Constructor and destructor.
+    #
+
+    def __init__(self, xmlBackend=None):
+        """
+        Initialize an empty DocumentCache.
+
+        @param xmlBackend: The XML backend used to parse the documents,
+            or C{None} to use the libxml2 backend.
+        @type xmlBackend: L{backend.XmlBackend}
+        """
+
+        # Initialize the cache and our statistics.
+        self.xmlBackend = xmlBackend or backend.getBackend()
+        self.hits = 0
+        self.misses = 0
+        self.__entries = {}
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def __del__(self):
+        self.clear()
+
+
+    # ----------------------------------
+    # DocumentCache methods.
+    #
+
+    def load(self, path):
+        """
+        Return the parsed document with the given path, parsing the file
+        if it is not in the cache (or if it has changed).
+
+        @param path: The path to the XML file.
+        @type path: C{str}
+        @return: The document.
+        @raise IOError: If the file cannot be read.
+        """
+
+        path = os.path.abspath(path)
+        self.__lock.acquire()
+        try:
+            # Return the cached document if the file has not changed.
+            st = os.stat(path)
+            version = (st.st_mtime, st.st_size)
+            entry = self.__entries.get(path)
+            if entry and entry[1] == version:
+                self.hits += 1
+                return entry[0]
+
+            # Read the file.  The document only has to be parsed again
+            # if the contents of the file have changed.
+            f = open(path, 'rb')
+            try:
+                data = f.read()
+            finally:
+                f.close()
+
+            digest = hashlib.sha1(data).hexdigest()
+            if entry and entry[2] == digest:
+                self.hits += 1
+                self.__entries[path] = (entry[0], version, digest)
+                return entry[0]
+
+            # Parse the document, replacing the old version.
+            self.misses += 1
+            doc = self.xmlBackend.parseDocument(data, path)
+            self.__entries[path] = (doc, version, digest)
+            if entry:
+                self.xmlBackend.freeDocument(entry[0])
+            return doc
+        finally:
+            self.__lock.release()
+
+    def preload(self, paths):
+        """
+        Parse the given documents ahead of time, so that they are ready
+        before the first transformation (and, when documents are
+        rendered by several processes, so that every process shares the
+        parsed documents).
+
+        @param paths: The paths to the XML files.
+        @type paths: C{list} of C{str}
+        @raise IOError: If a file cannot be read.
+        """
+
+        for path in paths:
+            self.load(path)
+
+    def register(self, entityLoader):
+        """
+        Make the C{document} extension function available to the
+        transformations run by the calling thread, resolving hrefs with
+        the given entity loader.
+
+        @param entityLoader: The entity loader of the transformation.
+        @type entityLoader: L{loader.EntityLoader}
+        """
+
+        self.__local.entityLoader = entityLoader
+        self.xmlBackend.registerFunctions(
+            extfunctions.NAMESPACE, {'document': self.__document})
+
+    def clear(self):
+        """Remove all of the documents from the cache, freeing them."""
+
+        self.__lock.acquire()
+        try:
+            entries = self.__entries.values()
+            self.__entries.clear()
+        finally:
+            self.__lock.release()
+
+        for doc, version, digest in entries:
+            self.xmlBackend.freeDocument(doc)
+
+
+    # ----------------------------------
+    # Private methods.
+    #
+
+    def __document(self, ctx, href, *args):
+        # Use the string value of the first node if we were given a
+        # node-set.
+        if isinstance(href, list):
+            href = href and self.xmlBackend.nodeText(href[0]) or ''
+        if isinstance(href, unicode):
+            href = href.encode('UTF-8')
+
+        # Resolve the href and record the document as a dependency.
+        entityLoader = getattr(self.__local, 'entityLoader', None)
+        if entityLoader:
+            path = entityLoader.resolvePath(href)
+            if path not in entityLoader.dependencies:
+                entityLoader.dependencies.append(path)
+        else:
+            path = href
+
+        # Return the root element of the document.
+        return [self.xmlBackend.rootElement(self.load(path))]
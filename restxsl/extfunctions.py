@@ -0,0 +1,274 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+XSLT extension functions implemented by the restxsl extension module.
+
+The L{pyxslt} directive serializes the entire result of a Python
+function into the document before the stylesheet runs.  Extension
+functions let the stylesheet ask for data while it is running instead,
+so that only the data the stylesheet actually uses is computed.  An
+extension module exports functions to stylesheets by listing them in an
+C{XSLT_FUNCTIONS} attribute, either as a list of function names or as a
+dictionary that maps XSLT function names to callables::
+
+    XSLT_FUNCTIONS = ['price']
+
+    def price(cookie, sku):
+        return lookupPrice(sku)
+
+Stylesheets call the functions in the restxsl namespace::
+
+    <xsl:stylesheet version="1.0"
+        xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
+        xmlns:restxsl="urn:restxsl:functions">
+      ...
+      <xsl:value-of select="restxsl:price('B-1138')"/>
+
+As with the L{pyxslt} directive, each function is given the extension
+module cookie followed by the arguments from the stylesheet.  Strings,
+numbers, and booleans are passed through as-is, and node-sets are
+passed as lists of the string values of their nodes.  Functions can
+return strings, numbers, booleans, nodes of the XML backend's documents,
+or (if the pyxslt module is available) any other object that pyxslt can
+serialize; the serialized XML is returned to the stylesheet as a
+node-set containing the root element.
+
+Results are memoized by function name and arguments for the lifetime of
+the L{ExtensionFunctions} object, which is usually the lifetime of a
+batch of documents.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# restxsl imports.
+import backend
+import limits
+
+
+
+# ######################################################################
+# Constants.
+#
+
+# The namespace URI of the restxsl extension functions.
+NAMESPACE = 'urn:restxsl:functions'
+
+
+
+# ######################################################################
+# ExtensionFunctions class.
+#
+
+class ExtensionFunctions(object):
+    """
+    The XSLT extension functions exported by an extension module, along
+    with the memoized results of those functions.
+
+    Extension functions are registered globally, so L{register} must be
+    called before each transformation that uses this object's
+    functions.
+    """
+
+    # ----------------------------------
+    # Constructor and destructor.
+    #
+
+    def __init__(self, extModule, extModuleCookie=None, extTimeout=None,
+                 xmlBackend=None):
+        """
+        Initialize the ExtensionFunctions object with the functions
+        listed in the given extension module's C{XSLT_FUNCTIONS}
+        attribute.
+
+        @param extModule: The extension module.
+        @type extModule: C{module}
+        @param extModuleCookie: The object passed as the first argument
+            to each function.
+        @type extModuleCookie: C{object}
+        @param extTimeout: The maximum number of seconds that a single
+            function call may take, or C{None} for no limit.
+        @type extTimeout: C{float}
+        @param xmlBackend: The XML backend that the functions are
+            registered with, or C{None} to use the libxml2 backend.
+        @type xmlBackend: L{backend.XmlBackend}
+        @raise AttributeError: If a function listed in C{XSLT_FUNCTIONS}
+            does not exist in the extension module.
+        """
+
+        # Initialize our attributes.
+        self.extModuleCookie = extModuleCookie
+        self.extTimeout = extTimeout
+        self.xmlBackend = xmlBackend or backend.getBackend()
+        self.hits = 0
+        self.misses = 0
+        self.__memo = {}
+        self.__docs = []
+        self.__error = None
+
+        # Find the functions.
+        self.functions = {}
+        names = getattr(extModule, 'XSLT_FUNCTIONS', None) or []
+        if isinstance(names, dict):
+            self.functions.update(names)
+        else:
+            for name in names:
+                self.functions[name] = getattr(extModule, name)
+
+    def __del__(self):
+        self.clear()
+
+
+    # ----------------------------------
+    # ExtensionFunctions methods.
+    #
+
+    def register(self):
+        """Register our functions with the XML backend, replacing any
+        functions that were registered with the same names."""
+
+        self.__error = None
+        self.xmlBackend.registerFunctions(NAMESPACE, dict([
+            (name, self.__makeCallback(name)) for name in self.functions]))
+
+    def raiseError(self):
+        """
+        Re-raise the render limit violation that aborted the most recent
+        transformation, if any.  libxslt reports exceptions raised by
+        extension functions as a generic transformation failure; this
+        lets the caller report the actual cause.  (lxml re-raises the
+        exception itself.)
+
+        @raise limits.LimitExceeded: If a function call exceeded its
+            time limit.
+        """
+
+        error, self.__error = self.__error, None
+        if error is not None:
+            raise error
+
+    def clear(self):
+        """Forget the memoized results and free the XML documents that
+        were created for them."""
+
+        self.__memo.clear()
+        docs, self.__docs = self.__docs, []
+        for doc in docs:
+            self.xmlBackend.freeDocument(doc)
+
+
+    # ----------------------------------
+    # Private methods.
+    #
+
+    def __makeCallback(self, name):
+        # Extension functions are called with the XPath context followed
+        # by the function's arguments.
+        def callback(ctx, *args):
+            return self.__call(name, args)
+        return callback
+
+    def __call(self, name, args):
+        # Convert node-sets into lists of strings, which keeps XML nodes
+        # out of the extension module and lets us use the
+        # arguments as part of the memo key.
+        callArgs = []
+        for arg in args:
+            if isinstance(arg, list):
+                arg = [self.xmlBackend.nodeText(node) for node in arg]
+            callArgs.append(arg)
+        key = (name, repr(callArgs))
+
+        # Return the memoized result if we have one.
+        try:
+            result = self.__memo[key]
+            self.hits += 1
+            return result
+        except KeyError:
+            pass
+
+        # Call the function, enforcing the extension time limit.
+        self.misses += 1
+        timer = limits.Timer('ext-timeout', self.extTimeout)
+        timer.start()
+        try:
+            try:
+                result = self.functions[name](
+                    self.extModuleCookie, *callArgs)
+            finally:
+                timer.stop()
+        except limits.LimitExceeded, e:
+            self.__error = e
+            raise
+
+        # Convert the result into an XPath value and memoize it.
+        result = self.__convertResult(result)
+        self.__memo[key] = result
+        return result
+
+    def __convertResult(self, result):
+        # Pass simple values straight through.
+        if result is None:
+            return ''
+        elif isinstance(result, bool):
+            return result
+        elif isinstance(result, (int, long, float)):
+            return float(result)
+        elif isinstance(result, unicode):
+            return result.encode('utf-8')
+        elif isinstance(result, str):
+            return result
+
+        # Return nodes as node-sets.
+        if self.xmlBackend.isNode(result):
+            return [result]
+        if (isinstance(result, (list, tuple)) and result
+                and self.xmlBackend.isNode(result[0])):
+            return list(result)
+
+        # Serialize everything else into an XML document, which we keep
+        # around for as long as the result is memoized.  The serializer
+        # is imported here so that modules which do not use it do not
+        # pay for the import.
+        import pyxslt.serialize
+        ser = pyxslt.serialize.Serializer()
+        ser.serializeOne(result)
+        doc = self.xmlBackend.adoptDocument(ser.toXmlDoc())
+        self.__docs.append(doc)
+        return [self.xmlBackend.rootElement(doc)]
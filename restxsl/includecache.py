@@ -0,0 +1,142 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Provides a cache of the files read by the reStructuredText C{include}
+directive.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import os
+
+# Docutils imports.
+import docutils.io
+
+
+
+# ######################################################################
+# IncludeCache class.
+#
+
+class IncludeCache(object):
+    """
+    Cache of the decoded text of included files.  A single cache can be
+    shared by every document in a batch, so that boilerplate files that
+    are included by many documents are only read and decoded once.
+
+    Entries are invalidated when the modification time or the size of
+    the included file changes.
+
+    Note that the cache stores text, not document nodes: the included
+    text is still selected (C{start-after}, C{end-line}, etc.), split
+    into lines, and parsed by the docutils include directive in the
+    context of each including document, which is necessary for
+    substitution definitions and hyperlink targets to be registered
+    with that document.
+    """
+
+    # ----------------------------------
+    # Constructor and destructor.
+    #
+
+    def __init__(self):
+        """Initialize an empty IncludeCache."""
+
+        # Initialize the cache and our statistics.
+        self.__entries = {}
+        self.hits = 0
+        self.misses = 0
+
+
+    # ----------------------------------
+    # IncludeCache methods.
+    #
+
+    def read(self, path, encoding=None, errorHandler='strict'):
+        """
+        Read the given include file.
+
+        @param path: The path to the include file.
+        @type path: C{str}
+        @param encoding: The character encoding of the file, or C{None}
+            to let docutils determine the encoding.
+        @type encoding: C{str}
+        @param errorHandler: The docutils input encoding error handler.
+        @type errorHandler: C{str}
+        @return: The decoded text of the file.
+        @rtype: C{unicode}
+        @raise IOError: If the file cannot be read.
+        @raise UnicodeError: If the file cannot be decoded.
+        """
+
+        # Find the current version of the file.
+        st = os.stat(path)
+        key = (path, encoding, errorHandler)
+        version = (st.st_mtime, st.st_size)
+
+        # Return the cached text if the file has not changed.
+        try:
+            entryVersion, text = self.__entries[key]
+            if entryVersion == version:
+                self.hits += 1
+                return text
+        except KeyError:
+            pass
+
+        # Read and decode the file.
+        self.misses += 1
+        f = open(path, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+
+        text = docutils.io.StringInput(
+            source=data, source_path=path, encoding=encoding,
+            error_handler=errorHandler).read()
+
+        # Cache the text and return it.
+        self.__entries[key] = (version, text)
+        return text
+
+    def clear(self):
+        """Remove all of the entries from the cache."""
+        self.__entries.clear()
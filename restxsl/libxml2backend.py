@@ -0,0 +1,324 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+XML backend built on the libxml2 and libxslt Python bindings.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# xmlsoft imports.
+import libxml2
+import libxslt
+
+# restxsl imports.
+import backend
+import xslt
+
+
+
+# ######################################################################
+# Libxml2Backend class.
+#
+
+class Libxml2Backend(backend.XmlBackend):
+    """
+    XML backend built on the libxml2 and libxslt Python bindings.  The
+    entity loader and extension functions are global to the process,
+    so this backend must not be used by more than one thread at a time.
+    """
+
+    name = 'libxml2'
+
+    # The depth limits that are in effect (libxslt's are global to the
+    # process), so that they are only set when they change.
+    __depthLimits = (None, None)
+
+
+    # ----------------------------------
+    # Tree building.
+    #
+
+    def newDocument(self):
+        return libxml2.newDoc('1.0')
+
+    def setRootElement(self, doc, tag):
+        xmlNode = libxml2.newNode(tag)
+        doc.setRootElement(xmlNode)
+        return xmlNode
+
+    def addElement(self, parent, tag, text=None):
+        return parent.newChild(None, tag, text)
+
+    def setAttribute(self, node, name, value):
+        node.newProp(name, value)
+
+    def addText(self, node, text):
+        node.addContent(text.encode('UTF-8'))
+
+    def addFragment(self, parent, fragmentDoc):
+        # Move the fragment's root element into the output tree.
+        # addChild() reparents the element (and all of its descendants)
+        # into our document, so there is no need to make a deep copy of
+        # what can be a very large result set.  This is safe because the
+        # pyxslt serializer builds its documents without a dictionary,
+        # which means that none of the moved nodes refer to strings
+        # owned by the fragment document.
+        xmlNode = fragmentDoc.getRootElement()
+        xmlNode.unlinkNode()
+        parent.addChild(xmlNode)
+
+    def parseDocument(self, data, url):
+        return libxml2.readMemory(data, len(data), url, None, 0)
+
+    def adoptDocument(self, fragmentDoc):
+        return fragmentDoc
+
+    def rootElement(self, doc):
+        return doc.getRootElement()
+
+    def copyDocument(self, doc):
+        return doc.copyDoc(1)
+
+    def freeDocument(self, doc):
+        doc.freeDoc()
+
+
+    # ----------------------------------
+    # XPath.
+    #
+
+    def xpath(self, doc, expression):
+        return doc.xpathEval(expression)
+
+    def isNode(self, obj):
+        return isinstance(obj, libxml2.xmlNode)
+
+    def nodeText(self, node):
+        return node.getContent()
+
+    def replaceWithText(self, node, text):
+        # The replaced node is no longer part of the document, so we
+        # have to free it.
+        node.replaceNode(libxml2.newText(text)).freeNode()
+
+    def replaceWithElement(self, node, tag, children):
+        newNode = libxml2.newNode(tag)
+        for child in children:
+            newNode.addChild(child.docCopyNode(node.doc, 1))
+        node.replaceNode(newNode).freeNode()
+
+    def replaceWithCopy(self, node, source):
+        newNode = source.docCopyNode(node.doc, 1)
+        node.replaceNode(newNode).freeNode()
+        return newNode
+
+    def removeNode(self, node):
+        node.unlinkNode()
+        node.freeNode()
+
+    def serializeNode(self, node):
+        return node.serialize('UTF-8')
+
+
+    # ----------------------------------
+    # XSLT.
+    #
+
+    def compileStylesheet(self, xslPath, entityLoader):
+        # Stylesheets are loaded through the global entity loader, which
+        # must already have been installed.
+        return Libxml2Stylesheet(xslPath)
+
+    def setDepthLimits(self, maxTemplateDepth, maxVariableDepth):
+        # The libxslt bindings do not expose the limits, so we set them
+        # in the libxslt that the bindings' extension module links.
+        limits = (maxTemplateDepth, maxVariableDepth)
+        if limits == self.__depthLimits:
+            return
+        import libxsltmod
+        xslt.setLibxsltLimit(
+            libxsltmod.__file__, 'xsltMaxDepth',
+            maxTemplateDepth or xslt.DEFAULT_MAX_TEMPLATE_DEPTH)
+        xslt.setLibxsltLimit(
+            libxsltmod.__file__, 'xsltMaxVars',
+            maxVariableDepth or xslt.DEFAULT_MAX_VARIABLE_DEPTH)
+        self.__depthLimits = limits
+
+    def registerFunctions(self, namespace, functions):
+        for name, function in functions.items():
+            libxslt.registerExtModuleFunction(name, namespace, function)
+
+
+    # ----------------------------------
+    # Entity resolution.
+    #
+
+    def installEntityLoader(self, entityLoader):
+        libxml2.setEntityLoader(entityLoader)
+
+
+
+# ######################################################################
+# Libxml2Stylesheet class.
+#
+
+class Libxml2Stylesheet(object):
+    """
+    Wrapper around a libxslt stylesheet.  The stylesheet is freed when
+    the object is deleted, but long-running processes should call
+    L{close} (or use the object as a context manager) so that the
+    memory is released as soon as the stylesheet is no longer needed.
+    """
+
+    # ----------------------------------
+    # Constructor and destructor.
+    #
+
+    def __init__(self, xslPath):
+        """
+        Construct a Libxml2Stylesheet object given the path to an XSL
+        stylesheet.
+
+        @param xslPath: Path to the XSL file.
+        @type xslPath: C{str}
+        @raise xslt.StylesheetException: If an error occurs while parsing the
+            stylesheet.
+        """
+
+        # Parse the XSL file into an XML document.
+        self.__stylesheet = None
+        doc = libxml2.parseFile(xslPath)
+
+        # Now parse the stylesheet.
+        self.__stylesheet = libxslt.parseStylesheetDoc(doc)
+
+        # Throw an exception if we were unable to parse the stylesheet.
+        # The XML document still belongs to us in that case.
+        if not self.__stylesheet:
+            self.__stylesheet = None
+            doc.freeDoc()
+            raise xslt.StylesheetException, 'Error parsing stylesheet.'
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+
+    # ----------------------------------
+    # Lifecycle methods.
+    #
+
+    def close(self):
+        """
+        Free the stylesheet.  This will also take care of freeing the
+        underlying XML document.  The stylesheet cannot be used after it
+        has been closed; closing a stylesheet more than once is
+        harmless.
+        """
+
+        stylesheet, self.__stylesheet = self.__stylesheet, None
+        if stylesheet is not None:
+            stylesheet.freeStylesheet()
+
+
+    # ----------------------------------
+    # Stylesheet methods.
+    #
+
+    def apply(self, doc, params, entityLoader=None, profile=None):
+        """
+        Apply this stylesheet to the given libxml2 xmlDoc object.
+
+        @param doc: The XML document.
+        @type doc: L{libxml2.xmlDoc}
+        @param params: Stylesheet parameters.
+        @type params: C{dict}
+        @param entityLoader: Ignored; libxml2 uses the global entity
+            loader during the transformation.
+        @type entityLoader: L{loader.EntityLoader}
+        @param profile: Must be C{None}; the libxslt Python bindings do
+            not provide access to libxslt's template profiler.
+        @type profile: C{list}
+        @return: The transformed XML document.
+        @rtype: L{libxml2.xmlDoc}
+        @raise xslt.StylesheetException: If the transformation fails (because
+            libxslt detected infinite template recursion, for example),
+            or if a profile was requested.
+        """
+
+        # Make sure that the stylesheet is still open.
+        if self.__stylesheet is None:
+            raise xslt.StylesheetException, 'Stylesheet has been closed.'
+
+        # The bindings can only apply stylesheets without profiling.
+        if profile is not None:
+            raise xslt.StylesheetException, \
+                'Template profiling is not supported by libxslt bindings.'
+
+        # Apply the stylesheet.
+        result = self.__stylesheet.applyStylesheet(doc, params)
+
+        # Throw an exception if the transformation failed.
+        if result is None:
+            raise xslt.StylesheetException, 'Error applying stylesheet.'
+
+        # Return the transformed document.
+        return result
+
+    def serialize(self, result, encoding):
+        """
+        Serialize a document returned by L{apply}.
+
+        @param result: The transformed document.
+        @type result: L{libxml2.xmlDoc}
+        @param encoding: The character encoding of the serialized
+            document.
+        @type encoding: C{str}
+        @return: The serialized document.
+        @rtype: C{str}
+        """
+
+        return result.serialize(encoding=encoding)
@@ -0,0 +1,218 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Limits on the resources used to render a single document.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import signal
+import threading
+import time
+
+
+
+# ######################################################################
+# Limit exceptions.
+#
+
+class LimitExceeded(Exception):
+    """
+    Exception raised when a document exceeds one of its render limits.
+
+    @ivar limit: The name of the limit that was exceeded: C{timeout},
+        C{ext-timeout}, C{source-nodes}, C{output-size}, or C{memory}.
+    @type limit: C{str}
+    @ivar message: A description of the problem.
+    @type message: C{str}
+    """
+
+    def __init__(self, limit, message):
+        # Initialize the superclass.  Storing both values in args allows
+        # the exception to be pickled (and so passed between processes).
+        Exception.__init__(self, limit, message)
+
+        # Store the limit and message.
+        self.limit = limit
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+
+# ######################################################################
+# RenderLimits class.
+#
+
+class RenderLimits(object):
+    """
+    Limits on the resources used to render a single document.  Each
+    limit is disabled if it is C{None}.
+
+    Timeouts are implemented with C{SIGALRM} and so are only enforced in
+    the main thread of Unix processes.  They interrupt Python code
+    (docutils, C{pyxslt} functions, the entity loader, post-processors,
+    and so on) immediately, but a stylesheet that loops inside libxslt
+    is only interrupted when it calls back into Python, so without
+    C{isolate} the timeout is only a soft limit.  Set C{isolate} to
+    render each document in a separate process that is killed when it
+    runs out of time; this is also required for the memory limit.
+
+    Recursion in stylesheets is bounded by libxslt's template depth and
+    variable depth limits (see L{backend.XmlBackend.setDepthLimits}),
+    which default to 3000 nested templates and 15000 variables.  A
+    transformation that reaches either limit fails with a
+    L{xslt.StylesheetException}.  The limits are global to the process,
+    so they apply to every document rendered after they are set.
+
+    @ivar timeout: The wall-clock time, in seconds, allowed for each
+        document.
+    @type timeout: C{float}
+    @ivar extTimeout: The wall-clock time, in seconds, allowed for each
+        call to a C{pyxslt} function.
+    @type extTimeout: C{float}
+    @ivar maxSourceNodes: The maximum number of nodes in the
+        reStructuredText XML document (including the results of
+        C{pyxslt} functions) that is given to the stylesheet.
+    @type maxSourceNodes: C{int}
+    @ivar maxOutputSize: The maximum size, in bytes, of each serialized
+        result document.
+    @type maxOutputSize: C{int}
+    @ivar maxMemory: The maximum size, in bytes, of the address space of
+        the process that renders each document.  Requires C{isolate}.
+    @type maxMemory: C{int}
+    @ivar maxTemplateDepth: The maximum depth of nested template calls
+        in the stylesheet.  libxslt counts the local variables and
+        parameters of the nested templates towards this limit as well.
+    @type maxTemplateDepth: C{int}
+    @ivar maxVariableDepth: The maximum number of variables and
+        parameters on the stylesheet's stack.
+    @type maxVariableDepth: C{int}
+    @ivar isolate: C{True} to render each document in a separate process.
+    @type isolate: C{bool}
+    """
+
+    def __init__(self, timeout=None, extTimeout=None,
+                 maxSourceNodes=None, maxOutputSize=None,
+                 maxMemory=None, isolate=False, maxTemplateDepth=None,
+                 maxVariableDepth=None):
+        # Store the limits.
+        self.timeout = timeout
+        self.extTimeout = extTimeout
+        self.maxSourceNodes = maxSourceNodes
+        self.maxOutputSize = maxOutputSize
+        self.maxMemory = maxMemory
+        self.isolate = isolate or bool(maxMemory)
+        self.maxTemplateDepth = maxTemplateDepth
+        self.maxVariableDepth = maxVariableDepth
+
+
+
+# ######################################################################
+# Timer class.
+#
+
+class Timer(object):
+    """
+    Raises L{LimitExceeded} in the main thread if the timer is not
+    stopped before the given number of seconds have passed.  Timers can
+    be nested; an inner timer never extends the deadline of an outer
+    timer.
+    """
+
+    def __init__(self, limit, seconds):
+        """
+        Initialize the timer.
+
+        @param limit: The name of the limit enforced by this timer.
+        @type limit: C{str}
+        @param seconds: The number of seconds allowed, or C{None} to
+            disable the timer.
+        @type seconds: C{float}
+        """
+
+        # Store our configuration.
+        self.limit = limit
+        self.seconds = seconds
+        self.__active = False
+
+    def start(self):
+        """Start the timer."""
+
+        # We can only use SIGALRM in the main thread of a Unix process.
+        if not self.seconds \
+                or not hasattr(signal, 'setitimer') \
+                or threading.currentThread().getName() != 'MainThread':
+            return
+
+        # Leave an outer timer alone if it will fire first.
+        self.__outerRemaining = signal.getitimer(signal.ITIMER_REAL)[0]
+        if self.__outerRemaining and self.__outerRemaining <= self.seconds:
+            return
+
+        # Install our handler and start the timer.
+        self.__startTime = time.time()
+        self.__outerHandler = signal.signal(signal.SIGALRM, self.__expired)
+        signal.setitimer(signal.ITIMER_REAL, self.seconds)
+        self.__active = True
+
+    def stop(self):
+        """Stop the timer, restarting any outer timer."""
+
+        if not self.__active:
+            return
+
+        # Stop our timer and restore the outer handler.
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self.__outerHandler)
+        self.__active = False
+
+        # Restart the outer timer with whatever time it has left.
+        if self.__outerRemaining:
+            elapsed = time.time() - self.__startTime
+            remaining = self.__outerRemaining - elapsed
+            signal.setitimer(signal.ITIMER_REAL, max(remaining, 0.001))
+
+    def __expired(self, signum, frame):
+        raise LimitExceeded(
+            self.limit, 'Exceeded the %s limit of %s seconds.' % (
+                self.limit, self.seconds))
@@ -0,0 +1,224 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Site-wide link validation.
+
+A L{LinkChecker} is given every document rendered by a batch (with
+links collected; see L{batch.Renderer}), and then resolves each
+document's links against the anchors of all of the batch's outputs,
+without reading the outputs back in.  Links to files that were not
+rendered by the batch are only checked for existence, since their
+anchors are not known.  Links to C{#id} fragments are resolved against
+the page that contains them; when a document is split into sections,
+internal references are resolved against the section page that holds
+their target.  Absolute URLs (and absolute paths, which depend
+on where the site is served from) are not checked.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import os
+import urllib
+import urlparse
+
+
+
+# ######################################################################
+# BrokenLink class.
+#
+
+class BrokenLink(object):
+    """
+    A link whose target could not be found.
+
+    @ivar restPath: The path of the reStructuredText file that was
+        rendered.
+    @type restPath: C{str}
+    @ivar source: The path of the file that contains the link (an
+        included file, for example).
+    @type source: C{str}
+    @ivar line: The line number of the link, or C{None}.
+    @type line: C{int}
+    @ivar target: The target of the link.
+    @type target: C{str}
+    @ivar reason: Why the link is broken.
+    @type reason: C{str}
+    """
+
+    def __init__(self, restPath, source, line, target, reason):
+        self.restPath = restPath
+        self.source = source
+        self.line = line
+        self.target = target
+        self.reason = reason
+
+    def __str__(self):
+        location = self.source
+        if self.line is not None:
+            location = '%s:%d' % (self.source, self.line)
+        target = self.target
+        if isinstance(target, unicode):
+            target = target.encode('UTF-8')
+        return '%s: broken link to %s (%s)' % (location, target, self.reason)
+
+
+
+# ######################################################################
+# LinkChecker class.
+#
+
+class LinkChecker(object):
+    """
+    Collects the links and anchors of a batch of documents and finds the
+    links whose targets do not exist.
+    """
+
+    # ----------------------------------
+    # Constructor and destructor.
+    #
+
+    def __init__(self):
+        """Initialize an empty LinkChecker."""
+
+        self.__anchors = {}
+        self.__documents = []
+
+
+    # ----------------------------------
+    # LinkChecker methods.
+    #
+
+    def addDocument(self, restPath, outputs, info):
+        """
+        Add a rendered document.
+
+        @param restPath: The path of the reStructuredText file.
+        @type restPath: C{str}
+        @param outputs: The C{(path, XML text)} tuples returned for the
+            document by L{batch.Renderer.render}.
+        @type outputs: C{list}
+        @param info: The information collected while rendering the
+            document, including its links and anchors.
+        @type info: L{transform.RenderInfo}
+        """
+
+        # Record the anchors of each output.
+        outputPaths = [path for path, xml in outputs if path is not None]
+        pages = []
+        for path, anchors in zip(
+                [path for path, xml in outputs], info.anchors):
+            pages.append((path, set(anchors)))
+            if path is not None:
+                self.__anchors[os.path.normpath(path)] = pages[-1][1]
+
+        # Links are resolved relative to the first output (multidoc
+        # instances and split sections are all written to the same
+        # directory).
+        baseDir = ''
+        if outputPaths:
+            baseDir = os.path.dirname(outputPaths[0])
+        elif restPath:
+            baseDir = os.path.dirname(restPath)
+        self.__documents.append((restPath, baseDir, pages, info.links))
+
+    def check(self):
+        """
+        Resolve the links of every document.
+
+        @return: The broken links, in the order in which the documents
+            were added.
+        @rtype: C{list} of L{BrokenLink}
+        """
+
+        brokenLinks = []
+        for restPath, baseDir, pages, links in self.__documents:
+            for target, source, line, page in links:
+                # Fragments within the document are resolved against
+                # the page on which the target must be found, or against
+                # every page if the link appears on all of them.
+                if page is not None and page < len(pages):
+                    linkPages = [pages[page]]
+                else:
+                    linkPages = pages
+                reason = self.__resolve(target, baseDir, linkPages)
+                if reason:
+                    brokenLinks.append(BrokenLink(
+                        restPath, source or restPath, line, target, reason))
+        return brokenLinks
+
+
+    # ----------------------------------
+    # Private methods.
+    #
+
+    def __resolve(self, target, baseDir, pages):
+        # Return the reason that the given link is broken, or None if
+        # the link is fine (or cannot be checked).
+        if isinstance(target, unicode):
+            target = target.encode('UTF-8')
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(target)
+        if scheme or netloc or path.startswith('/'):
+            return None
+        path = urllib.unquote(path)
+        fragment = urllib.unquote(fragment)
+
+        # Links within the document must point at an anchor on each of
+        # the given pages.
+        if not path:
+            if fragment:
+                for pagePath, anchors in pages:
+                    if fragment in anchors:
+                        continue
+                    if pagePath is None:
+                        return 'no anchor %s in this document' % (fragment)
+                    return 'no anchor %s in %s' % (
+                        fragment, os.path.normpath(pagePath))
+            return None
+
+        # Links to the batch's outputs are checked against the output's
+        # anchors; other links are just checked for existence.
+        targetPath = os.path.normpath(os.path.join(baseDir, path))
+        if targetPath in self.__anchors:
+            if fragment and fragment not in self.__anchors[targetPath]:
+                return 'no anchor %s in %s' % (fragment, targetPath)
+        elif not os.path.exists(targetPath):
+            return 'no file %s' % (targetPath)
+        return None
@@ -60,6 +60,15 @@ class EntityLoader(object):
     Subclasses can extend this class and override loadFile() if they
     wish to load XSL files from other locations (a database, for
     example).
+
+    @ivar basePath: The base path used for absolute stylesheet
+        references, or C{None} to leave all references alone.
+    @type basePath: C{str}
+    @ivar relPath: The path used for relative stylesheet references.
+    @type relPath: C{str}
+    @ivar dependencies: The paths of all of the files that have been
+        opened by this loader.
+    @type dependencies: C{list} of C{str}
     """
 
     # ----------------------------------
@@ -72,7 +81,9 @@ class EntityLoader(object):
         that will be used to locate stylesheets.
 
         @param basePath: The base path that should be used for absolute
-            stylesheet references.
+            stylesheet references, or C{None} to leave all references
+            alone (in which case the loader only records the files that
+            it opens).
         @type basePath: C{str}
         @param relPath: The path that should be used for relative
             stylesheet references.
@@ -80,41 +91,63 @@ class EntityLoader(object):
         """
 
         # Store the base path and relative path.
-        self.__basePath = basePath
-        self.__relPath = relPath
+        self.basePath = basePath
+        self.relPath = relPath
+
+        # Initialize the list of opened files.
+        self.dependencies = []
 
 
     # ----------------------------------
     # EntityLoader methods.
     #
 
-    def loadFile(self, path):
+    def resolvePath(self, path):
         """
-        Load the XSL file with the given path.
+        Return the path of the file that the given reference refers to.
 
-        @param path: The path to the XSL file that need to be loaded.
-            This path is taken straight from the XSL file and may be
-            relative, absolute, or even a URL>
+        @param path: The path to the XSL file, taken straight from the
+            XSL file.
         @type path: C{str}
-        @return: The contents of the XSL file, or C{None} if the file
-            was not found.
+        @return: The path to the file.
         @rtype: C{str}
         """
 
         # Create the path the file based on the type of incoming
         # reference (relative or absolute).
-        if os.path.isabs(path):
+        if self.basePath is None:
+            # Leave the path alone.
+            return path
+        elif os.path.isabs(path):
             # Anchor the absolute path at our base path, stripping the
             # initial separator from the incoming path so that we can
             # join() it.
-            filePath = os.path.join(self.__basePath, path[1:])
+            return os.path.join(self.basePath, path[1:])
         else:
             # Anchor the relative path, then normalize it.
-            filePath = os.path.normpath(os.path.join(self.__relPath, path))
+            return os.path.normpath(os.path.join(self.relPath, path))
+
+    def loadFile(self, path):
+        """
+        Load the XSL file with the given path.
+
+        @param path: The path to the XSL file that need to be loaded.
+            This path is taken straight from the XSL file and may be
+            relative, absolute, or even a URL>
+        @type path: C{str}
+        @return: The contents of the XSL file, or C{None} if the file
+            was not found.
+        @rtype: C{str}
+        """
+
+        # Find the file.
+        filePath = self.resolvePath(path)
 
         # Try to open the file.
         try:
-            return open(filePath, 'r')
+            f = open(filePath, 'r')
+            self.dependencies.append(filePath)
+            return f
         except IOError:
             # Couldn't find the file; let libxml2 have a go at it.
             return None;
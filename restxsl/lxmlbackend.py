@@ -0,0 +1,469 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+XML backend built on lxml.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import copy
+import threading
+
+# lxml imports.
+import lxml.etree
+
+# restxsl imports.
+import backend
+import xslt
+
+
+
+# ######################################################################
+# Constants.
+#
+
+# The namespace of the xml: prefix.
+_XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+
+
+# ######################################################################
+# LxmlBackend class.
+#
+
+class LxmlBackend(backend.XmlBackend):
+    """
+    XML backend built on lxml.  Compiled stylesheets can be shared
+    between threads, and each transformation resolves entities through
+    the entity loader given to L{LxmlStylesheet.apply}, so this backend
+    does not depend on any global state other than the extension
+    function registry.
+    """
+
+    name = 'lxml'
+    supportsProfiling = True
+
+    # The depth limits that are in effect (libxslt's are global to the
+    # process), so that they are only set when they change.
+    __depthLimits = (None, None)
+
+
+    # ----------------------------------
+    # Tree building.
+    #
+
+    def newDocument(self):
+        return lxml.etree.ElementTree()
+
+    def setRootElement(self, doc, tag):
+        element = lxml.etree.Element(tag)
+        doc._setroot(element)
+        return element
+
+    def addElement(self, parent, tag, text=None):
+        element = lxml.etree.SubElement(parent, tag)
+        element.text = text
+        return element
+
+    def setAttribute(self, node, name, value):
+        # lxml does not accept prefixed attribute names, so attributes
+        # in the xml namespace (xml:space, for example) have to be
+        # given in Clark notation.
+        if name.startswith('xml:'):
+            name = '{%s}%s' % (_XML_NAMESPACE, name[4:])
+        node.set(name, value)
+
+    def addText(self, node, text):
+        # Text that follows a child element belongs in the tail of that
+        # element.
+        if len(node):
+            node[-1].tail = (node[-1].tail or u'') + text
+        else:
+            node.text = (node.text or u'') + text
+
+    def addFragment(self, parent, fragmentDoc):
+        parent.append(_parseFragment(fragmentDoc))
+
+    def parseDocument(self, data, url):
+        return lxml.etree.ElementTree(
+            lxml.etree.fromstring(data, base_url=url))
+
+    def adoptDocument(self, fragmentDoc):
+        try:
+            return lxml.etree.ElementTree(_parseFragment(fragmentDoc))
+        finally:
+            fragmentDoc.freeDoc()
+
+    def rootElement(self, doc):
+        return doc.getroot()
+
+    def copyDocument(self, doc):
+        return lxml.etree.ElementTree(copy.deepcopy(doc.getroot()))
+
+    def freeDocument(self, doc):
+        # lxml documents are garbage collected.
+        pass
+
+
+    # ----------------------------------
+    # XPath.
+    #
+
+    def xpath(self, doc, expression):
+        return doc.xpath(expression)
+
+    def isNode(self, obj):
+        return isinstance(obj, lxml.etree._Element)
+
+    def nodeText(self, node):
+        # Attribute and text nodes are returned by lxml as strings.
+        if isinstance(node, basestring):
+            return node
+        return node.xpath('string()')
+
+    def replaceWithText(self, node, text):
+        # Merge the text (and the text that followed the element) into
+        # the text of the previous sibling or the parent.  lxml removes
+        # an element's tail along with the element.
+        parent = node.getparent()
+        text = text + (node.tail or u'')
+        previous = node.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or u'') + text
+        else:
+            parent.text = (parent.text or u'') + text
+        parent.remove(node)
+
+    def replaceWithElement(self, node, tag, children):
+        newNode = lxml.etree.Element(tag)
+        for child in children:
+            childCopy = copy.deepcopy(child)
+            childCopy.tail = None
+            newNode.append(childCopy)
+        newNode.tail = node.tail
+        node.getparent().replace(node, newNode)
+
+    def replaceWithCopy(self, node, source):
+        newNode = copy.deepcopy(source)
+        newNode.tail = node.tail
+        node.getparent().replace(node, newNode)
+        return newNode
+
+    def removeNode(self, node):
+        self.replaceWithText(node, u'')
+
+    def serializeNode(self, node):
+        return lxml.etree.tostring(node, encoding='UTF-8', with_tail=False)
+
+
+    # ----------------------------------
+    # XSLT.
+    #
+
+    def compileStylesheet(self, xslPath, entityLoader):
+        return LxmlStylesheet(xslPath, entityLoader)
+
+    def setDepthLimits(self, maxTemplateDepth, maxVariableDepth):
+        # lxml only exposes the template depth limit.  The variable
+        # limit is set in the libxslt that lxml links, which exports its
+        # symbols from the etree module.
+        limits = (maxTemplateDepth, maxVariableDepth)
+        if limits == self.__depthLimits:
+            return
+        lxml.etree.XSLT.set_global_max_depth(
+            maxTemplateDepth or xslt.DEFAULT_MAX_TEMPLATE_DEPTH)
+        xslt.setLibxsltLimit(
+            lxml.etree.__file__, 'xsltMaxVars',
+            maxVariableDepth or xslt.DEFAULT_MAX_VARIABLE_DEPTH)
+        self.__depthLimits = limits
+
+    def registerFunctions(self, namespace, functions):
+        functionNamespace = lxml.etree.FunctionNamespace(namespace)
+        for name, function in functions.items():
+            functionNamespace[name] = function
+
+
+    # ----------------------------------
+    # Entity resolution.
+    #
+
+    def installEntityLoader(self, entityLoader):
+        # Entities are resolved by each stylesheet's resolver, which is
+        # given the entity loader for each transformation.
+        pass
+
+
+
+# ######################################################################
+# LxmlStylesheet class.
+#
+
+class LxmlStylesheet(object):
+    """
+    Compiled lxml stylesheet.  A stylesheet can be applied by several
+    threads at once; each thread resolves entities through the entity
+    loader that it gives to L{apply}.
+    """
+
+    # ----------------------------------
+    # Constructor and destructor.
+    #
+
+    def __init__(self, xslPath, entityLoader):
+        """
+        Compile the given stylesheet.
+
+        @param xslPath: Path to the XSL file.
+        @type xslPath: C{str}
+        @param entityLoader: The entity loader used to find the
+            stylesheet and its includes and imports.
+        @type entityLoader: L{loader.EntityLoader}
+        @raise xslt.StylesheetException: If an error occurs while
+            parsing the stylesheet.
+        """
+
+        # Store the path, which identifies the stylesheet's templates in
+        # profiles.  libxslt accumulates each template's profile across
+        # transformations, so we keep the previous totals in order to
+        # find the time spent in each transformation.
+        self.xslPath = xslPath
+        self.__profileTotals = {}
+        self.__profileLock = threading.Lock()
+
+        # Create a parser that resolves entities through our resolver.
+        # lxml uses the parser's resolvers for the stylesheet's includes
+        # and imports, and for document() calls made by the stylesheet.
+        self.__resolver = _EntityLoaderResolver()
+        parser = lxml.etree.XMLParser()
+        parser.resolvers.add(self.__resolver)
+
+        # Load the stylesheet through the entity loader, falling back to
+        # the original path if the loader cannot find the file.
+        self.__resolver.local.entityLoader = entityLoader
+        try:
+            try:
+                source = entityLoader.loadFile(xslPath) or xslPath
+                try:
+                    xslDoc = lxml.etree.parse(source, parser)
+                finally:
+                    if hasattr(source, 'close'):
+                        source.close()
+
+                self.__xslt = lxml.etree.XSLT(xslDoc)
+            except (IOError, lxml.etree.XMLSyntaxError,
+                    lxml.etree.XSLTParseError), e:
+                raise xslt.StylesheetException, \
+                    'Error parsing stylesheet: %s' % (e)
+        finally:
+            self.__resolver.local.entityLoader = None
+
+        # Find the output method so that we can serialize the results
+        # in the same way as libxslt.
+        self.__outputMethod = xslDoc.xpath(
+            'string(/xsl:*/xsl:output/@method)',
+            namespaces={'xsl': 'http://www.w3.org/1999/XSL/Transform'})
+
+    def close(self):
+        """Release the stylesheet.  lxml stylesheets are garbage
+        collected, so this only drops our reference to it."""
+        self.__xslt = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+
+    # ----------------------------------
+    # Stylesheet methods.
+    #
+
+    def apply(self, doc, params, entityLoader=None, profile=None):
+        """
+        Apply this stylesheet to the given document.
+
+        @param doc: The XML document.
+        @type doc: L{lxml.etree._ElementTree}
+        @param params: Stylesheet parameters (XPath expressions).
+        @type params: C{dict}
+        @param entityLoader: The entity loader used to resolve the
+            files loaded by the stylesheet (with document(), for
+            example).
+        @type entityLoader: L{loader.EntityLoader}
+        @param profile: A list to which the time spent in each template
+            will be added (see L{xslt.TemplateProfile.add}), or C{None}
+            to skip profiling.
+        @type profile: C{list}
+        @return: The transformed document.
+        @rtype: L{lxml.etree._XSLTResultTree}
+        @raise xslt.StylesheetException: If the transformation fails.
+        """
+
+        # Make sure that the stylesheet is still open.
+        if self.__xslt is None:
+            raise xslt.StylesheetException, 'Stylesheet has been closed.'
+
+        # Apply the stylesheet.  lxml only accepts ASCII byte strings,
+        # so parameter values are decoded from UTF-8.
+        xsltParams = {}
+        for name, value in (params or {}).items():
+            if isinstance(value, str):
+                value = value.decode('UTF-8')
+            xsltParams[str(name)] = value
+
+        self.__resolver.local.entityLoader = entityLoader
+        try:
+            try:
+                result = self.__xslt(
+                    doc, profile_run=profile is not None, **xsltParams)
+            except lxml.etree.XSLTApplyError, e:
+                raise xslt.StylesheetException, \
+                    'Error applying stylesheet: %s' % (e)
+        finally:
+            self.__resolver.local.entityLoader = None
+
+        # Collect the template profile.  Times are in milliseconds.
+        # Transformations that are profiled at the same time by
+        # different threads share each other's times.
+        if profile is not None:
+            self.__profileLock.acquire()
+            try:
+                for template in result.xslt_profile.getroot():
+                    key = (template.get('match', ''),
+                           template.get('name', ''),
+                           template.get('mode', ''))
+                    calls = int(template.get('calls'))
+                    milliseconds = float(template.get('time'))
+                    previousCalls, previousMilliseconds = \
+                        self.__profileTotals.get(key, (0, 0.0))
+                    self.__profileTotals[key] = (calls, milliseconds)
+                    if calls > previousCalls:
+                        profile.append((self.xslPath,) + key + (
+                            calls - previousCalls,
+                            milliseconds - previousMilliseconds))
+            finally:
+                self.__profileLock.release()
+            del result.xslt_profile
+
+        return result
+
+    def serialize(self, result, encoding):
+        """
+        Serialize a document returned by L{apply}, using the HTML
+        serializer if the stylesheet asked for HTML output (or did not
+        specify an output method and produced an C{html} element), as
+        libxslt does.  Text output is returned as-is, in the given
+        encoding.
+
+        @param result: The transformed document.
+        @type result: L{lxml.etree._XSLTResultTree}
+        @param encoding: The character encoding of the serialized
+            document.
+        @type encoding: C{str}
+        @return: The serialized document.
+        @rtype: C{str}
+        """
+
+        # Determine the output method.
+        method = self.__outputMethod
+        root = result.getroot()
+        if not method:
+            if root is not None and isinstance(root.tag, basestring) \
+                    and root.tag.lower() == 'html':
+                method = 'html'
+            else:
+                method = 'xml'
+
+        # Serialize the document.  Text output does not have a root
+        # element.
+        if method == 'text':
+            return unicode(result).encode(encoding, 'xmlcharrefreplace')
+        elif root is None:
+            return ''
+        elif method == 'xml':
+            return lxml.etree.tostring(
+                result, encoding=encoding, xml_declaration=True)
+        else:
+            return lxml.etree.tostring(
+                result, encoding=encoding, method=method)
+
+
+
+# ######################################################################
+# Entity resolution.
+#
+
+class _EntityLoaderResolver(lxml.etree.Resolver):
+    """lxml resolver that loads files through the calling thread's
+    L{loader.EntityLoader}."""
+
+    def __init__(self):
+        lxml.etree.Resolver.__init__(self)
+        self.local = threading.local()
+
+    def resolve(self, url, pubid, context):
+        entityLoader = getattr(self.local, 'entityLoader', None)
+        if entityLoader is None:
+            return None
+
+        # lxml gives us unicode URLs; libxml2 gives the loader byte
+        # strings.
+        if isinstance(url, unicode):
+            url = url.encode('UTF-8')
+
+        f = entityLoader.loadFile(url)
+        if f is None:
+            return None
+        return self.resolve_file(f, context, base_url=f.name)
+
+
+
+# ######################################################################
+# Utility functions.
+#
+
+def _parseFragment(fragmentDoc):
+    """Return a copy of the root element of the given libxml2 document
+    (usually built by the pyxslt serializer) as an lxml element."""
+    return lxml.etree.fromstring(
+        fragmentDoc.getRootElement().serialize('UTF-8'))
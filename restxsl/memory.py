@@ -0,0 +1,165 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Accounting of the memory allocated by libxml2 and libxslt.
+
+libxml2 can track every allocation that it (and libxslt) makes, which
+makes it possible to spot documents that leak XML trees or stylesheets
+in long-running processes.  Tracking must be turned on with
+L{enableDebugMemory} before libxml2 allocates anything, which in
+practice means immediately after importing this module.
+
+The libxml2 backend uses the libxml2 Python bindings, which turn on the
+tracking themselves.  lxml has no such function, and usually carries
+its own copy of libxml2 and libxslt, so for the lxml backend the
+library that C{lxml.etree} uses is loaded with C{ctypes} and switched
+to libxml2's debugging allocator before C{lxml.etree} is imported.
+Only the library used by the chosen backend is tracked; in particular,
+the libxml2 documents built by the pyxslt serializer are not counted
+when the lxml backend is used.
+
+The libxml2 bindings are only imported once memory debugging is turned
+on for the libxml2 backend, so that this module can be used with the
+lxml backend (which does not need the bindings).
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import imp
+import sys
+
+
+
+# ######################################################################
+# Memory accounting.
+#
+
+# True if libxml2 memory debugging has been turned on.
+_debugMemory = False
+
+# The ctypes handle on the library used by lxml.etree, if memory
+# debugging was turned on for the lxml backend.
+_lxmlLibrary = None
+
+def _enableLxmlDebugMemory():
+    # Load the library that lxml.etree will use (lxml.etree itself, if
+    # libxml2 is linked into it) and install libxml2's debugging
+    # allocator, just as the bindings' debugMemory() does.  This has to
+    # happen before lxml.etree is imported, because blocks allocated by
+    # the normal allocator cannot be freed by the debugging allocator.
+    import ctypes
+    if 'lxml.etree' in sys.modules:
+        raise ValueError, \
+            'Memory debugging must be turned on before lxml is imported'
+
+    fp, lxmlPath, description = imp.find_module('lxml')
+    fp, etreePath, description = imp.find_module('etree', [lxmlPath])
+    if fp:
+        fp.close()
+
+    library = ctypes.CDLL(etreePath)
+    try:
+        allocators = [
+            ctypes.cast(getattr(library, name), ctypes.c_void_p)
+            for name in ('xmlMemFree', 'xmlMemMalloc', 'xmlMemRealloc',
+                         'xmlMemoryStrdup')]
+        setup = library.xmlMemSetup
+        library.xmlMemUsed.restype = ctypes.c_int
+    except AttributeError:
+        raise ValueError, \
+            'The libxml2 used by lxml does not support memory debugging'
+    if setup(*allocators) != 0:
+        raise ValueError, 'Memory debugging could not be turned on for lxml'
+    return library
+
+def enableDebugMemory(backendName='libxml2'):
+    """
+    Turn on libxml2's memory debugging.  libxml2 only tracks memory
+    allocated after this call, so it must be made before any documents
+    or stylesheets are parsed.
+
+    @param backendName: The name of the XML backend whose copy of
+        libxml2 is tracked (see L{backend.BACKENDS}).
+    @type backendName: C{str}
+    @raise ValueError: If memory debugging cannot be turned on for the
+        lxml backend (because C{lxml.etree} has already been imported,
+        for example).
+    """
+
+    global _debugMemory, _lxmlLibrary
+    if backendName == 'lxml':
+        _lxmlLibrary = _enableLxmlDebugMemory()
+    else:
+        import libxml2
+        libxml2.debugMemory(1)
+    _debugMemory = True
+
+def isDebugMemoryEnabled():
+    """Return C{True} if libxml2's memory debugging is turned on."""
+    return _debugMemory
+
+def allocatedBytes():
+    """
+    Return the number of bytes currently allocated by libxml2 and
+    libxslt, or C{None} if memory debugging has not been turned on.
+
+    @rtype: C{int}
+    """
+
+    if not _debugMemory:
+        return None
+    if _lxmlLibrary is not None:
+        return _lxmlLibrary.xmlMemUsed()
+    import libxml2
+    return libxml2.debugMemory(1)
+
+def dumpMemory():
+    """
+    Write a list of the blocks that are still allocated by libxml2 to
+    the C{.memdump} file in the current directory.  This is only useful
+    if memory debugging has been turned on.
+    """
+
+    if _lxmlLibrary is not None:
+        _lxmlLibrary.xmlMemoryDump()
+        return
+    import libxml2
+    libxml2.dumpMemory()
@@ -0,0 +1,859 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Writes restxsl result documents to disk (as individual files or as a
+single archive), optionally minifying them and writing precompressed
+copies alongside them.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import cStringIO
+import gzip
+import hashlib
+import imp
+import json
+import os
+import Queue
+import re
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+
+
+
+# ######################################################################
+# Compressors.
+#
+
+def _gzipCompress(data):
+    # Compress the data with a zero timestamp so that the output only
+    # depends on the input.
+    io = cStringIO.StringIO()
+    gz = gzip.GzipFile(filename='', mode='wb', compresslevel=9,
+                       fileobj=io, mtime=0)
+    try:
+        gz.write(data)
+    finally:
+        gz.close()
+    return io.getvalue()
+
+def _brotliCompress(data):
+    import brotli
+    return brotli.compress(data)
+
+def _zstdCompress(data):
+    import zstandard
+    return zstandard.ZstdCompressor(level=19).compress(data)
+
+COMPRESSORS = {
+    'gzip': ('.gz', _gzipCompress, None),
+    'brotli': ('.br', _brotliCompress, 'brotli'),
+    'zstd': ('.zst', _zstdCompress, 'zstandard'),
+}
+"""Compression formats, mapped to a C{(extension, function, module)}
+tuple.  Formats that need a third-party module name that module; use
+L{compressorAvailable} to find out if the module is installed.  The
+modules are only imported when a file is first compressed."""
+
+def compressorAvailable(name):
+    """
+    Determine if the given compression format can be used.
+
+    @param name: The name of the compression format (a key in
+        L{COMPRESSORS}).
+    @type name: C{str}
+    @return: C{True} if the format is known and its module (if any) is
+        installed.
+    @rtype: C{bool}
+    """
+
+    try:
+        extension, compress, module = COMPRESSORS[name]
+    except KeyError:
+        return False
+
+    if module is None:
+        return True
+
+    try:
+        fp, path, description = imp.find_module(module)
+    except ImportError:
+        return False
+
+    if fp:
+        fp.close()
+    return True
+
+def _lookupCompressors(names):
+    # Return the (extension, function) tuples for the given compression
+    # formats, making sure that they are all available.
+    compressors = []
+    for name in names:
+        if not compressorAvailable(name):
+            raise ValueError, 'Compression format not available: %s' % (
+                name)
+        extension, compress, module = COMPRESSORS[name]
+        compressors.append((extension, compress))
+    return compressors
+
+
+
+# ######################################################################
+# Whitespace handling.
+#
+
+RE_PRESERVED = re.compile(
+    r'(<(pre|textarea|script|style)\b.*?</\2\s*>)', re.DOTALL | re.IGNORECASE)
+RE_WHITESPACE = re.compile(r'[ \t\r\n]+')
+
+def _collapseRun(m):
+    # Keep a single newline if the run contained one (so that the output
+    # is still split into lines), otherwise keep a single space.
+    if '\n' in m.group(0):
+        return '\n'
+    else:
+        return ' '
+
+def collapseWhitespace(xml):
+    """
+    Collapse runs of insignificant whitespace in a serialized XHTML
+    document into a single space (or a single newline, if the run
+    contained a newline).  The contents of C{pre}, C{textarea},
+    C{script}, and C{style} elements are left alone.  restxsl already
+    encodes the whitespace in literal blocks as non-breaking spaces,
+    which are not affected.
+
+        >>> collapseWhitespace('<p>\\n    Some   text\\n</p>')
+        '<p>\\nSome text\\n</p>'
+        >>> collapseWhitespace('<pre>a   b</pre>  <b>c</b>')
+        '<pre>a   b</pre> <b>c</b>'
+
+    @param xml: The serialized document.
+    @type xml: C{str}
+    @return: The document with its whitespace collapsed.
+    @rtype: C{str}
+    """
+
+    # The preserved elements end up at the odd indices of the split
+    # list (followed by the captured element name, which we drop).
+    parts = RE_PRESERVED.split(xml)
+    out = []
+    for i in range(0, len(parts), 3):
+        out.append(RE_WHITESPACE.sub(_collapseRun, parts[i]))
+        if i + 1 < len(parts):
+            out.append(parts[i + 1])
+    return ''.join(out)
+
+
+
+# ######################################################################
+# Depfile generation.
+#
+
+def _escapeMakePath(path):
+    # Escape the characters that are special to make.
+    return path.replace('$', '$$').replace(' ', '\\ ').replace('#', '\\#')
+
+def makeDepfile(target, dependencies):
+    """
+    Generate a Make-compatible dependency file (depfile) for the given
+    target.  Like the depfiles generated by C{gcc -MP}, the depfile
+    contains an empty rule for every dependency so that make does not
+    fail if one of the dependencies is deleted.
+
+        >>> print makeDepfile('index.html', ['index.txt', 'my site.xsl']),
+        index.html: index.txt my\\ site.xsl
+        index.txt:
+        my\\ site.xsl:
+
+    @param target: The path to the output file.
+    @type target: C{str}
+    @param dependencies: The paths of the files that the output file
+        depends on.
+    @type dependencies: C{list} of C{str}
+    @return: The contents of the depfile.
+    @rtype: C{str}
+    """
+
+    dependencies = [_escapeMakePath(path) for path in dependencies]
+    lines = ['%s: %s' % (_escapeMakePath(target), ' '.join(dependencies))]
+    for path in dependencies:
+        lines.append('%s:' % (path))
+    return '\n'.join(lines) + '\n'
+
+
+
+# ######################################################################
+# OutputWriter class.
+#
+
+class OutputWriter(object):
+    """
+    Writes result documents to disk.  Documents can optionally have
+    their whitespace collapsed before they are written, and can have
+    precompressed siblings (C{index.html.gz}, for example) written in
+    the same pass.  Compression is performed by a pool of worker
+    threads; call L{close} to wait for the workers to finish.
+
+    Files are only written if their contents have changed, so unchanged
+    outputs keep their modification times.  Changed files are written to
+    a temporary file and then renamed into place, so readers never see a
+    partially-written file.
+
+    The writer can also maintain a manifest: a JSON file that lists
+    every output along with the SHA-1 digest of its contents, and which
+    outputs were created, changed, left unchanged, or removed by the
+    most recent run.  An output is considered to be removed if the
+    previous manifest listed it for a source file that was recorded by
+    this run (see L{recordSource}), but this run did not write it; the
+    outputs of source files that were not rendered are left alone.
+    The manifest also records, for each source file passed to
+    L{recordSource}, the outputs it produced, the files it depended on,
+    the time it took to render (see L{shard}), and the digests of its
+    multidoc instances (see L{batch.Renderer}).
+
+    @ivar created: The paths of the outputs that did not exist before.
+    @type created: C{list} of C{str}
+    @ivar changed: The paths of the outputs whose contents changed.
+    @type changed: C{list} of C{str}
+    @ivar unchanged: The paths of the outputs whose contents did not
+        change (and which were therefore not written).
+    @type unchanged: C{list} of C{str}
+    @ivar removed: The paths of the outputs of the recorded source files
+        that were in the previous manifest but which were not written
+        by this run.  Only valid after L{close} has been called.
+    @type removed: C{list} of C{str}
+    """
+
+    # ----------------------------------
+    # Constructor and destructor.
+    #
+
+    def __init__(self, minify=False, compressors=(), threads=4,
+                 manifestPath=None, prune=False):
+        """
+        Initialize the OutputWriter.
+
+        @param minify: C{True} to collapse insignificant whitespace in
+            each document before it is written.
+        @type minify: C{bool}
+        @param compressors: The names of the compression formats (keys
+            in L{COMPRESSORS}) to write alongside each document.
+        @type compressors: C{list} of C{str}
+        @param threads: The number of compression threads.
+        @type threads: C{int}
+        @param manifestPath: The path to the manifest file, or C{None}
+            to skip the manifest.  The manifest from the previous run is
+            read from this path (if it exists) when the writer is
+            created, and the new manifest is written to this path when
+            the writer is closed.
+        @type manifestPath: C{str}
+        @param prune: C{True} to delete the removed outputs.
+        @type prune: C{bool}
+        @raise ValueError: If one of the compression formats is not
+            available.
+        """
+
+        # Store our configuration.
+        self.minify = minify
+        self.compressors = _lookupCompressors(compressors)
+        self.manifestPath = manifestPath
+        self.prune = prune
+
+        # Find the mode for new files; temporary files are created with
+        # a restrictive mode that we need to replace.
+        umask = os.umask(0)
+        os.umask(umask)
+        self.__fileMode = 0666 & ~umask
+
+        # Read the previous manifest.
+        self.__previousOutputs = {}
+        self.__previousSources = {}
+        if manifestPath and os.path.exists(manifestPath):
+            f = open(manifestPath, 'r')
+            try:
+                previousManifest = json.load(f)
+            finally:
+                f.close()
+            self.__previousOutputs = previousManifest['outputs']
+            self.__previousSources = previousManifest.get('sources', {})
+
+        # Initialize the manifest.
+        self.__lock = threading.Lock()
+        self.__outputs = {}
+        self.__sources = {}
+        self.created = []
+        self.changed = []
+        self.unchanged = []
+        self.removed = []
+
+        # Start the compression threads.
+        self.__queue = Queue.Queue(threads * 4)
+        self.__errors = []
+        self.__threads = []
+        if self.compressors:
+            for i in range(max(threads, 1)):
+                thread = threading.Thread(target=self.__compressWorker)
+                thread.setDaemon(True)
+                thread.start()
+                self.__threads.append(thread)
+
+
+    # ----------------------------------
+    # OutputWriter methods.
+    #
+
+    def write(self, path, data, plain=False):
+        """
+        Write a result document.
+
+        @param path: The path of the output file.
+        @type path: C{str}
+        @param data: The contents of the output file.
+        @type data: C{str}
+        @param plain: C{True} to write the data as-is, without minifying
+            or compressing it (for depfiles, for example).
+        @type plain: C{bool}
+        """
+
+        # Write plain files as-is.
+        if plain:
+            self._writeFile(path, data)
+            return
+
+        # Collapse the document's whitespace.
+        if self.minify:
+            data = collapseWhitespace(data)
+
+        # Write out the file.
+        isChanged = self._writeFile(path, data)
+
+        # Queue up the compressed versions of the file.  There is no
+        # need to compress the file again if it has not changed and the
+        # compressed version is still there.
+        for extension, compress in self.compressors:
+            compressedPath = path + extension
+            if not isChanged and compressedPath in self.__previousOutputs \
+                    and os.path.exists(compressedPath):
+                self.__record(
+                    compressedPath, self.__previousOutputs[compressedPath],
+                    self.unchanged)
+            else:
+                self.__queue.put((compressedPath, compress, data))
+
+    def recordSource(self, restPath, outputPaths, dependencies, seconds,
+                     instances=None):
+        """
+        Record a source file in the manifest.
+
+        @param restPath: The path of the reStructuredText file.
+        @type restPath: C{str}
+        @param outputPaths: The paths of the outputs written for the
+            file.
+        @type outputPaths: C{list} of C{str}
+        @param dependencies: The files that the outputs depend on.
+        @type dependencies: C{list} of C{str}
+        @param seconds: The time taken to render the file, or C{None}.
+        @type seconds: C{float}
+        @param instances: The digests of the file's multidoc instances,
+            keyed by instance filename, or C{None}.
+        @type instances: C{dict} mapping C{str} to C{str}
+        """
+
+        source = {
+            'outputs': list(outputPaths),
+            'dependencies': list(dependencies),
+            'seconds': seconds,
+        }
+        if instances:
+            source['instances'] = instances
+
+        self.__lock.acquire()
+        try:
+            self.__sources[restPath] = source
+        finally:
+            self.__lock.release()
+
+    def previousSources(self):
+        """
+        Return the paths of the source files recorded in the previous
+        manifest.
+
+        @rtype: C{list} of C{str}
+        """
+
+        return sorted(self.__previousSources)
+
+    def previousOutputs(self, restPath):
+        """
+        Return the paths of the outputs written for a source file by the
+        previous run.
+
+        @param restPath: The path of the reStructuredText file.
+        @type restPath: C{str}
+        @rtype: C{list} of C{str}
+        """
+
+        source = self.__previousSources.get(restPath)
+        if source is None:
+            return []
+        return source['outputs']
+
+    def previousInstances(self):
+        """
+        Return the digests of the multidoc instances recorded in the
+        previous manifest.
+
+        @return: The digests, keyed by the path of the reStructuredText
+            file and then by instance filename.
+        @rtype: C{dict} mapping C{str} to C{dict}
+        """
+
+        return dict((restPath, source['instances'])
+                    for restPath, source in self.__previousSources.items()
+                    if 'instances' in source)
+
+    def settings(self):
+        """
+        Return the settings that change the contents of the files
+        written by this OutputWriter: whether the files are minified,
+        and the extensions of the compressed versions.
+
+        @return: The settings.
+        @rtype: C{tuple}
+        """
+
+        return (self.minify,
+                [extension for extension, compress in self.compressors])
+
+    def keepSource(self, restPath):
+        """
+        Keep the outputs written for a source file by the previous run,
+        for a file that could not be rendered by this run.  The outputs
+        (along with their depfiles and compressed versions) are listed
+        as unchanged, so that they are not removed (or pruned), and the
+        file's entry in the previous manifest is carried over.
+
+        @param restPath: The path of the reStructuredText file.
+        @type restPath: C{str}
+        """
+
+        # Find the file in the previous manifest.
+        source = self.__previousSources.get(restPath)
+        if source is None:
+            return
+
+        # Keep the file's outputs.
+        self.keepOutputs(source['outputs'])
+
+        self.__lock.acquire()
+        try:
+            self.__sources[restPath] = source
+        finally:
+            self.__lock.release()
+
+    def keepOutputs(self, outputPaths):
+        """
+        Keep outputs written by the previous run that were not written
+        by this run (unchanged multidoc instances, for example).  The
+        outputs (along with their depfiles and compressed versions) are
+        listed as unchanged, so that they are not removed (or pruned).
+
+        @param outputPaths: The paths of the outputs.
+        @type outputPaths: C{list} of C{str}
+        """
+
+        for path in self.__siblings(outputPaths):
+            if path in self.__previousOutputs:
+                self.__record(
+                    path, self.__previousOutputs[path], self.unchanged)
+
+    def removeOutputs(self, outputPaths):
+        """
+        Delete outputs written by the previous run, along with their
+        depfiles and compressed versions, whether or not the writer is
+        pruning removed outputs.  The outputs are listed as removed once
+        the writer is closed.
+
+        @param outputPaths: The paths of the outputs.
+        @type outputPaths: C{list} of C{str}
+        """
+
+        for path in self.__siblings(outputPaths):
+            if path in self.__previousOutputs:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def flush(self):
+        """
+        Wait for all of the queued compression work to finish.
+
+        @raise IOError: If one of the compressed files could not be
+            written.
+        """
+
+        # Wait for the queue to drain.
+        self.__queue.join()
+
+        # Report the first error encountered by the threads.
+        if self.__errors:
+            raise self.__errors.pop(0)
+
+    def close(self):
+        """
+        Wait for all of the queued compression work to finish, then
+        write out the manifest.
+
+        @raise IOError: If one of the compressed files could not be
+            written.
+        """
+
+        # Stop the compression threads.
+        for thread in self.__threads:
+            self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+        # Report the first error encountered by the threads.
+        if self.__errors:
+            raise self.__errors[0]
+
+        # Find the outputs of the files recorded by this run that were
+        # not written again (including compressed versions that are no
+        # longer requested), deleting them if requested to do so.  The
+        # outputs of files that were not rendered by this run are left
+        # alone.
+        suffixes = ['', '.d'] + [
+            extension for extension, compress, module
+            in COMPRESSORS.values()]
+        removed = set()
+        for restPath in self.__sources:
+            source = self.__previousSources.get(restPath)
+            if source is None:
+                continue
+            for outputPath in source['outputs']:
+                for suffix in suffixes:
+                    path = outputPath + suffix
+                    if path in self.__previousOutputs \
+                            and path not in self.__outputs:
+                        removed.add(path)
+        self.removed = sorted(removed)
+        if self.prune:
+            for path in self.removed:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        # Write the manifest.
+        if self.manifestPath:
+            manifest = {
+                'outputs': self.__outputs,
+                'sources': self.__sources,
+                'created': sorted(self.created),
+                'changed': sorted(self.changed),
+                'unchanged': sorted(self.unchanged),
+                'removed': self.removed,
+            }
+            self._writeFile(
+                self.manifestPath,
+                json.dumps(manifest, indent=1, sort_keys=True),
+                record=False)
+
+
+    # ----------------------------------
+    # Protected methods.
+    #
+
+    def _writeFile(self, path, data, record=True):
+        """
+        Write a file if its contents have changed.
+
+        @return: C{True} if the file was written, C{False} if the file
+            already contained the given data.
+        @rtype: C{bool}
+        """
+
+        # Compare the data to the existing file.  We only need to read
+        # the file if its size matches.
+        try:
+            if os.path.getsize(path) == len(data):
+                f = open(path, 'rb')
+                try:
+                    isChanged = f.read() != data
+                finally:
+                    f.close()
+            else:
+                isChanged = True
+            exists = True
+        except (IOError, OSError):
+            isChanged = True
+            exists = False
+
+        # Write the file to a temporary file in the same directory as
+        # the output file (creating the directory if necessary), then
+        # rename it into place.
+        if isChanged:
+            outputDir = os.path.dirname(path)
+            if outputDir and not os.path.isdir(outputDir):
+                try:
+                    os.makedirs(outputDir)
+                except OSError:
+                    # Another worker may have created the directory.
+                    if not os.path.isdir(outputDir):
+                        raise
+            fd, tempPath = tempfile.mkstemp(
+                dir=os.path.dirname(path) or '.',
+                prefix='.' + os.path.basename(path), suffix='.tmp')
+            try:
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+                os.chmod(tempPath, self.__fileMode)
+                os.rename(tempPath, path)
+            except:
+                os.remove(tempPath)
+                raise
+
+        # Record the file in the manifest.
+        if record:
+            if not exists:
+                status = self.created
+            elif isChanged:
+                status = self.changed
+            else:
+                status = self.unchanged
+            self.__record(path, hashlib.sha1(data).hexdigest(), status)
+
+        # Return the status.
+        return isChanged
+
+
+    # ----------------------------------
+    # Private methods.
+    #
+
+    def __siblings(self, outputPaths):
+        suffixes = ['', '.d'] + [
+            extension for extension, compress in self.compressors]
+        return [outputPath + suffix
+                for outputPath in outputPaths for suffix in suffixes]
+
+    def __record(self, path, digest, status):
+        self.__lock.acquire()
+        try:
+            self.__outputs[path] = digest
+            status.append(path)
+        finally:
+            self.__lock.release()
+
+    def __compressWorker(self):
+        while True:
+            # Get the next job; None tells us to stop.
+            job = self.__queue.get()
+            if job is None:
+                self.__queue.task_done()
+                break
+
+            # Compress and write the file.
+            path, compress, data = job
+            try:
+                self._writeFile(path, compress(data))
+            except Exception, e:
+                self.__errors.append(e)
+            self.__queue.task_done()
+
+
+
+# ######################################################################
+# ArchiveWriter class.
+#
+
+class ArchiveWriter(object):
+    """
+    Writes result documents into a single archive instead of individual
+    files.  Writing one large file sequentially avoids the filesystem
+    metadata cost of creating thousands of small files.  Three formats
+    are supported:
+
+        - C{tar}: An uncompressed tar archive.  The archive can be
+          written to stdout.
+        - C{zip}: A zip archive (compressed with deflate).  The archive
+          cannot be written to stdout, because the zip format requires a
+          seekable file.
+        - C{stream}: A simple length-prefixed stream.  Each document is
+          preceded by a header line containing the length of its
+          filename and the length of its contents (as decimal numbers
+          separated by a space), followed by the filename and then the
+          contents.  The stream can be written to stdout.
+
+    Each archive member is named with the relative path that the
+    document would have had if it had been written to disk.
+    """
+
+    # ----------------------------------
+    # Constructor and destructor.
+    #
+
+    def __init__(self, archivePath, format='tar', minify=False,
+                 compressors=()):
+        """
+        Initialize the ArchiveWriter.
+
+        @param archivePath: The path to the archive, or C{-} to write the
+            archive to stdout.
+        @type archivePath: C{str}
+        @param format: The archive format: C{tar}, C{zip}, or C{stream}.
+        @type format: C{str}
+        @param minify: C{True} to collapse insignificant whitespace in
+            each document before it is written.
+        @type minify: C{bool}
+        @param compressors: The names of the compression formats (keys
+            in L{COMPRESSORS}) of the compressed copies of each document
+            that should be added to the archive.
+        @type compressors: C{list} of C{str}
+        @raise ValueError: If the format is not supported, or if one of
+            the compression formats is not available.
+        """
+
+        # Validate the configuration.
+        if format not in ('tar', 'zip', 'stream'):
+            raise ValueError, 'Unsupported archive format: %s' % (format)
+        if format == 'zip' and archivePath == '-':
+            raise ValueError, 'zip archives cannot be written to stdout.'
+
+        # Store our configuration.
+        self.format = format
+        self.minify = minify
+        self.compressors = _lookupCompressors(compressors)
+        self.__mtime = time.time()
+
+        # Open the archive.
+        if archivePath == '-':
+            self.__fp = sys.stdout
+        else:
+            self.__fp = open(archivePath, 'wb')
+
+        if format == 'tar':
+            self.__archive = tarfile.open(mode='w|', fileobj=self.__fp)
+        elif format == 'zip':
+            self.__archive = zipfile.ZipFile(
+                self.__fp, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            self.__archive = None
+
+
+    # ----------------------------------
+    # ArchiveWriter methods.
+    #
+
+    def write(self, path, data, plain=False):
+        """
+        Add a result document to the archive.
+
+        @param path: The path that the output file would have had on
+            disk.  Leading slashes and C{..} components are removed.
+        @type path: C{str}
+        @param data: The contents of the output file.
+        @type data: C{str}
+        @param plain: C{True} to add the data as-is, without minifying
+            or compressing it.
+        @type plain: C{bool}
+        """
+
+        # Collapse the document's whitespace.
+        if self.minify and not plain:
+            data = collapseWhitespace(data)
+
+        # Make the path relative.
+        path = os.path.normpath(path).replace(os.sep, '/')
+        path = '/'.join([p for p in path.split('/') if p not in ('', '..')])
+
+        # Add the document and its compressed versions.
+        self.__add(path, data)
+        if plain:
+            return
+        for extension, compress in self.compressors:
+            self.__add(path + extension, compress(data))
+
+    def flush(self):
+        """Flush the documents written so far to the archive file."""
+        self.__fp.flush()
+
+    def close(self):
+        """Finish writing the archive."""
+
+        if self.__archive is not None:
+            self.__archive.close()
+        if self.__fp is sys.stdout:
+            self.__fp.flush()
+        else:
+            self.__fp.close()
+
+
+    # ----------------------------------
+    # Private methods.
+    #
+
+    def __add(self, path, data):
+        if self.format == 'tar':
+            info = tarfile.TarInfo(path)
+            info.size = len(data)
+            info.mtime = self.__mtime
+            info.mode = 0644
+            self.__archive.addfile(info, cStringIO.StringIO(data))
+        elif self.format == 'zip':
+            info = zipfile.ZipInfo(path, time.localtime(self.__mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0644 << 16
+            self.__archive.writestr(info, data)
+        else:
+            self.__fp.write('%d %d\n' % (len(path), len(data)))
+            self.__fp.write(path)
+            self.__fp.write(data)
@@ -0,0 +1,277 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Build performance reports.
+
+A L{BuildReport} collects the L{transform.RenderInfo} of every document
+rendered by a build, and writes out a report (as JSON or HTML) listing
+the time taken to render each document, the size of its output, the
+time spent in C{pyxslt} directive calls and compiling stylesheets, the
+hit rates of the caches, and the slowest documents.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import cgi
+import json
+
+
+
+# ######################################################################
+# BuildReport class.
+#
+
+class BuildReport(object):
+    """
+    A report on the performance of a build.
+
+    @ivar top: The number of documents listed in the slowest documents
+        section of the report.
+    @type top: C{int}
+    """
+
+    # ----------------------------------
+    # Constructor and destructor.
+    #
+
+    def __init__(self, top=20):
+        """
+        Initialize an empty BuildReport.
+
+        @param top: The number of slowest documents to report.
+        @type top: C{int}
+        """
+
+        # Store our configuration.
+        self.top = top
+
+        # Initialize the statistics.
+        self.__documents = []
+        self.__extFunctions = {}
+        self.__stylesheetCompiles = []
+        self.__caches = {}
+
+
+    # ----------------------------------
+    # BuildReport methods.
+    #
+
+    def addDocument(self, restPath, outputs, info):
+        """
+        Add a rendered document to the report.
+
+        @param restPath: The path of the reStructuredText file.
+        @type restPath: C{str}
+        @param outputs: The C{(path, XML text)} tuples returned for the
+            document by L{batch.Renderer.render}.
+        @type outputs: C{list}
+        @param info: The information collected while rendering the
+            document.
+        @type info: L{transform.RenderInfo}
+        """
+
+        # Record the document.
+        self.__documents.append({
+            'path': restPath,
+            'seconds': info.seconds or 0.0,
+            'outputs': len(outputs),
+            'outputSize': sum([len(xml) for path, xml in outputs]),
+            'extCalls': len(info.extCalls),
+            'extSeconds': sum(
+                [seconds for name, seconds in info.extCalls], 0.0),
+            'compileSeconds': sum(
+                [seconds for xslPath, seconds in info.stylesheetCompiles],
+                0.0),
+        })
+
+        # Accumulate the extension function calls.
+        for name, seconds in info.extCalls:
+            calls = self.__extFunctions.setdefault(
+                name, {'calls': 0, 'seconds': 0.0})
+            calls['calls'] += 1
+            calls['seconds'] += seconds
+
+        # Record the stylesheet compile events.
+        for xslPath, seconds in info.stylesheetCompiles:
+            self.__stylesheetCompiles.append({
+                'stylesheet': xslPath,
+                'document': restPath,
+                'seconds': seconds,
+            })
+
+        # Accumulate the cache statistics.
+        for name, (hits, misses) in info.cacheStatistics.items():
+            counts = self.__caches.setdefault(name, {'hits': 0, 'misses': 0})
+            counts['hits'] += hits
+            counts['misses'] += misses
+
+    def summary(self):
+        """
+        Return the report as a dictionary (the structure of the JSON
+        report).
+
+        @rtype: C{dict}
+        """
+
+        # Compute the totals.
+        documents = self.__documents
+        totals = {'documents': len(documents)}
+        for name in ('seconds', 'outputs', 'outputSize', 'extCalls',
+                     'extSeconds', 'compileSeconds'):
+            totals[name] = sum([document[name] for document in documents])
+
+        # Compute the cache hit rates.
+        caches = {}
+        for name, counts in self.__caches.items():
+            lookups = counts['hits'] + counts['misses']
+            caches[name] = {
+                'hits': counts['hits'],
+                'misses': counts['misses'],
+                'hitRate': lookups and float(counts['hits']) / lookups or None,
+            }
+
+        # Find the slowest documents.
+        slowest = sorted(
+            documents, key=lambda document: -document['seconds'])
+
+        return {
+            'totals': totals,
+            'documents': documents,
+            'slowest': slowest[:self.top],
+            'extFunctions': self.__extFunctions,
+            'stylesheetCompiles': self.__stylesheetCompiles,
+            'caches': caches,
+        }
+
+    def write(self, path):
+        """
+        Write the report to the given file.  The report is written as
+        HTML if the path ends in C{.html} or C{.htm}, and as JSON
+        otherwise.
+
+        @param path: The path of the report.
+        @type path: C{str}
+        """
+
+        summary = self.summary()
+        if path.endswith('.html') or path.endswith('.htm'):
+            data = _formatHtml(summary)
+        else:
+            data = json.dumps(summary, indent=1, sort_keys=True)
+
+        f = open(path, 'w')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+
+
+
+# ######################################################################
+# HTML formatting.
+#
+
+def _formatTable(title, columns, rows):
+    """Return an HTML table with the given title, column headings, and
+    rows (lists of values)."""
+
+    html = ['<h2>%s</h2>' % (cgi.escape(title)), '<table>',
+            '<tr>%s</tr>' % (''.join([
+                '<th>%s</th>' % (cgi.escape(column)) for column in columns]))]
+    for row in rows:
+        cells = []
+        for value in row:
+            if isinstance(value, float):
+                value = '%.3f' % (value)
+            elif value is None:
+                value = '-'
+            cells.append('<td>%s</td>' % (cgi.escape(str(value))))
+        html.append('<tr>%s</tr>' % (''.join(cells)))
+    html.append('</table>')
+    return '\n'.join(html)
+
+def _formatHtml(summary):
+    """Return the given report summary as an HTML document."""
+
+    documentColumns = ['Document', 'Seconds', 'Outputs', 'Output bytes',
+                       'pyxslt calls', 'pyxslt seconds', 'Compile seconds']
+    def documentRow(document):
+        return [document['path'], document['seconds'], document['outputs'],
+                document['outputSize'], document['extCalls'],
+                document['extSeconds'], document['compileSeconds']]
+
+    totals = summary['totals']
+    caches = summary['caches']
+    extFunctions = summary['extFunctions']
+
+    sections = [
+        _formatTable(
+            'Totals',
+            ['Documents', 'Seconds', 'Outputs', 'Output bytes',
+             'pyxslt calls', 'pyxslt seconds', 'Compile seconds'],
+            [[totals['documents'], totals['seconds'], totals['outputs'],
+              totals['outputSize'], totals['extCalls'],
+              totals['extSeconds'], totals['compileSeconds']]]),
+        _formatTable(
+            'Slowest documents', documentColumns,
+            [documentRow(document) for document in summary['slowest']]),
+        _formatTable(
+            'Caches', ['Cache', 'Hits', 'Misses', 'Hit rate'],
+            [[name, caches[name]['hits'], caches[name]['misses'],
+              caches[name]['hitRate']] for name in sorted(caches)]),
+        _formatTable(
+            'pyxslt functions', ['Function', 'Calls', 'Seconds'],
+            [[name, extFunctions[name]['calls'],
+              extFunctions[name]['seconds']]
+             for name in sorted(extFunctions)]),
+        _formatTable(
+            'Stylesheet compiles', ['Stylesheet', 'Document', 'Seconds'],
+            [[event['stylesheet'], event['document'], event['seconds']]
+             for event in summary['stylesheetCompiles']]),
+        _formatTable(
+            'Documents', documentColumns,
+            [documentRow(document) for document in summary['documents']]),
+    ]
+
+    return '\n'.join([
+        '<html>', '<head><title>restxsl build report</title></head>',
+        '<body>', '<h1>restxsl build report</h1>'] + sections + [
+        '</body>', '</html>', ''])
@@ -45,13 +45,11 @@ reStructuredText roles provided by the restxsl module.
 # Python imports.
 import re
 
-# xmlsoft imports.
-import libxml2
-
 # Docutils imports.
 import docutils.nodes
 
 # restxsl imports.
+import backend
 import uniquote
 
 
@@ -96,19 +94,26 @@ class RestXmlDocument(docutils.nodes.GenericNodeVisitor):
     """
     XML version of a reStructuredText document tree.  This object
     accepts a reStructuredText document tree and parses it into a
-    libxml2 xmlDoc tree.  The result can then be output using libxml2,
-    fed through a libxslt stylesheet, etc.
+    XML tree using one of the XML backends (a libxml2 xmlDoc, by
+    default).  The result can then be output, fed through an XSL
+    stylesheet, etc.
+
+    The XML document is freed when the object is deleted, but
+    long-running processes should call L{close} (or use the object as a
+    context manager) so that the memory is released as soon as the
+    document is no longer needed.
 
     @ivar doc: The XML document that was created when the given
         reStructuredText document tree was parsed.
-    @type doc: L{libxml2.xmlDoc}
+    @type doc: L{libxml2.xmlDoc}, or the document type of the XML
+        backend
     """
 
     # ----------------------------------
     # Constructor and destructor.
     #
 
-    def __init__(self, document, smartPunctuation=True):
+    def __init__(self, document, smartPunctuation=True, xmlBackend=None):
         """
         Construct a RestXmlDocument from the given reStructuredText
         document tree.  Quotes, dashes, and ellipses in the document can
@@ -128,17 +133,22 @@ class RestXmlDocument(docutils.nodes.GenericNodeVisitor):
             ellipses to their smart (and curly) Unicode counterparts;
             C{False} to leave the punctuation alone.
         @type smartPunctuation: C{bool}
+        @param xmlBackend: The XML backend used to build the XML
+            document, or C{None} to use the libxml2 backend.
+        @type xmlBackend: L{backend.XmlBackend}
         """
 
         # Initialize the superclass.
         docutils.nodes.GenericNodeVisitor.__init__(self, document)
 
         # Initialize our attributes.
+        self.doc = None
         self.xslTemplate = None
+        self.xmlBackend = xmlBackend or backend.getBackend()
         self._smartPunctuation = smartPunctuation
 
         # Create the XML document.
-        self.doc = libxml2.newDoc('1.0')
+        self.doc = self.xmlBackend.newDocument()
 
 
         # Create our node stack and initialize the root element flag.
@@ -146,13 +156,39 @@ class RestXmlDocument(docutils.nodes.GenericNodeVisitor):
         self.__haveRootElement = False
 
         # Walk through the reStructuredText document tree and use it to
-        # populate our XML document.
-        document.walkabout(self)
+        # populate our XML document.  Free the document right away if
+        # that fails.
+        try:
+            document.walkabout(self)
+        except:
+            self.close()
+            raise
 
 
     def __del__(self):
-        # Free the XML document.
-        self.doc.freeDoc()
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+
+    # ----------------------------------
+    # Lifecycle methods.
+    #
+
+    def close(self):
+        """
+        Free the XML document.  The L{doc} attribute is set to C{None};
+        closing a document more than once is harmless.
+        """
+
+        doc, self.doc = self.doc, None
+        if doc is not None:
+            self.xmlBackend.freeDocument(doc)
 
 
     # ----------------------------------
@@ -186,9 +222,10 @@ class RestXmlDocument(docutils.nodes.GenericNodeVisitor):
 
 
     def visit_XmlFragment(self, node):
-        # Copy the XML fragment into the output tree.
-        xmlNode = node.doc.getRootElement().docCopyNode(self.doc, 1)
-        self.__nodeStack[-1][0].addChild(xmlNode)
+        # Add the XML fragment's root element to the output tree.  The
+        # libxml2 backend moves the element instead of copying it,
+        # which leaves the fragment empty.
+        self.xmlBackend.addFragment(self.__nodeStack[-1][0], node.doc)
 
     def depart_XmlFragment(self, node):
         # Free the XML fragment.
@@ -199,8 +236,8 @@ class RestXmlDocument(docutils.nodes.GenericNodeVisitor):
         # Add a pyxslt-xpath-reference node as a child of the last node
         # on the stack.  No need to push this new node on the stack,
         # because we know that it is a leaf node in the docutils tree.
-        xmlNode = self.__nodeStack[-1][0].newChild(
-            None, 'pyxslt-xpath-reference', node.xpath)
+        xmlNode = self.xmlBackend.addElement(
+            self.__nodeStack[-1][0], 'pyxslt-xpath-reference', node.xpath)
 
     def depart_XpathReference(self, node):
         # Nothing to do here, but we cannot use the default handler
@@ -238,16 +275,16 @@ class RestXmlDocument(docutils.nodes.GenericNodeVisitor):
             # of this method take care of that line.
             for line in text.split('\n')[:-1]:
                 # Output this line.
-                self.__nodeStack[-1][0].addContent(line.encode('UTF-8'))
+                self.xmlBackend.addText(self.__nodeStack[-1][0], line)
 
                 # Output the br node.
-                self.__nodeStack[-1][0].newChild(None, 'br', None)
+                self.xmlBackend.addElement(self.__nodeStack[-1][0], 'br')
 
             # Leave the last line alone.
             text = text.split('\n')[-1]
 
         # Add the text to the last node on the stack.
-        self.__nodeStack[-1][0].addContent(text.encode('UTF-8'))
+        self.xmlBackend.addText(self.__nodeStack[-1][0], text)
 
     def depart_Text(self, node):
         # Nothing to do here.  But, since we do not push text nodes onto
@@ -277,20 +314,21 @@ class RestXmlDocument(docutils.nodes.GenericNodeVisitor):
         # node as a child of the last node on the stack.
         if not self.__haveRootElement:
             # Create the root node and add it to the document.
-            xmlNode = libxml2.newNode(node.tagname)
-            self.doc.setRootElement(xmlNode)
+            xmlNode = self.xmlBackend.setRootElement(self.doc, node.tagname)
             self.__haveRootElement = True
         else:
             # Add the node as a child of the last node on the stack.
-            xmlNode = self.__nodeStack[-1][0].newChild(None, node.tagname, None)
+            xmlNode = self.xmlBackend.addElement(
+                self.__nodeStack[-1][0], node.tagname)
 
         # Add the docutils attributes to the XML node.
         for name, value in node.attlist():
             if type(value) == list:
-                values = [docutils.nodes.serial_escape('%s' % v) for v in value]
-                xmlNode.newProp(name, ' '.join(values))
+                values = [
+                    docutils.nodes.serial_escape('%s' % v) for v in value]
+                self.xmlBackend.setAttribute(xmlNode, name, ' '.join(values))
             else:
-                xmlNode.newProp(name, str(value))
+                self.xmlBackend.setAttribute(xmlNode, name, str(value))
 
         # Push the node onto the node stack.
         self.__nodeStack.append((xmlNode, isRaw, preserveWhitespace))
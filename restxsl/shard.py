@@ -0,0 +1,277 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Deterministic partitioning of a build across several machines, and
+merging of the manifests written by each part (shard) of the build.
+
+Every shard is given the same list of input files and computes the same
+partition, so no coordination between the machines is needed.  Files
+are weighted by how long they took to render in a previous build (the
+C{seconds} recorded in the C{sources} section of a manifest), and are
+assigned to the least-loaded shard, heaviest first.  Files without a
+recorded time are assigned by a stable hash of their path, so adding a
+file to the site does not move other new files between shards.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import hashlib
+import json
+import os
+
+
+
+# ######################################################################
+# Shard exceptions.
+#
+
+class ManifestConflict(Exception):
+    """
+    Exception raised when shard manifests cannot be merged because more
+    than one shard wrote the same output file.
+
+    @ivar conflicts: The conflicting output paths, mapped to the list of
+        manifests that contain them.
+    @type conflicts: C{dict}
+    """
+
+    def __init__(self, conflicts):
+        Exception.__init__(self, conflicts)
+        self.conflicts = conflicts
+
+    def __str__(self):
+        return '\n'.join([
+            '%s: written by %s' % (path, ', '.join(self.conflicts[path]))
+            for path in sorted(self.conflicts)])
+
+
+
+# ######################################################################
+# Partitioning.
+#
+
+def parseShard(text):
+    """
+    Parse a shard specification of the form C{i/N}, where C{i} is the
+    (1-based) index of the shard and C{N} is the number of shards.
+
+        >>> parseShard('2/5')
+        (2, 5)
+        >>> parseShard('6/5')
+        Traceback (most recent call last):
+        ...
+        ValueError: invalid shard: 6/5
+
+    @param text: The shard specification.
+    @type text: C{str}
+    @return: A C{(index, count)} tuple.
+    @rtype: C{tuple}
+    @raise ValueError: If the specification is invalid.
+    """
+
+    try:
+        index, count = [int(part) for part in text.split('/')]
+    except ValueError:
+        raise ValueError, 'invalid shard: %s' % (text)
+    if not 1 <= index <= count:
+        raise ValueError, 'invalid shard: %s' % (text)
+    return (index, count)
+
+def stableHash(path):
+    """
+    Return a hash of the given path that is the same on every machine
+    and in every Python process (unlike the built-in C{hash}).
+
+    @rtype: C{int}
+    """
+
+    return int(hashlib.sha1(path).hexdigest()[:8], 16)
+
+def partition(restFiles, count, timings=None):
+    """
+    Partition the files into the given number of shards.
+
+        >>> partition(['a', 'b', 'c', 'd'], 2, {'a': 3, 'b': 1, 'c': 1})
+        [['b', 'c', 'd'], ['a']]
+
+    @param restFiles: The paths of the files.
+    @type restFiles: C{list} of C{str}
+    @param count: The number of shards.
+    @type count: C{int}
+    @param timings: The time taken to render each file in a previous
+        build, or C{None}.
+    @type timings: C{dict} mapping C{str} to C{float}
+    @return: The files in each shard, in their original order.
+    @rtype: C{list} of C{list} of C{str}
+    """
+
+    timings = timings or {}
+    assignments = {}
+    loads = [0.0] * count
+
+    # Assign the files without a recorded time by their hash.  Each is
+    # assumed to take the average recorded time.
+    known = [path for path in restFiles if path in timings]
+    average = known and sum([timings[p] for p in known]) / len(known) or 1.0
+    for path in restFiles:
+        if path not in timings:
+            shard = stableHash(path) % count
+            assignments[path] = shard
+            loads[shard] += average
+
+    # Assign the remaining files to the least-loaded shard, heaviest
+    # file first.  Ties are broken by the hash of the path (and then by
+    # the path itself), so that every shard computes the same result.
+    known.sort(key=lambda path: (-timings[path], stableHash(path), path))
+    for path in known:
+        shard = loads.index(min(loads))
+        assignments[path] = shard
+        loads[shard] += timings[path]
+
+    # Build the shards.
+    shards = [[] for i in range(count)]
+    for path in restFiles:
+        shards[assignments[path]].append(path)
+    return shards
+
+def selectShard(restFiles, index, count, timings=None):
+    """
+    Return the files that belong to the given shard.
+
+    @param index: The (1-based) index of the shard.
+    @type index: C{int}
+    @see: L{partition}
+    """
+
+    return partition(restFiles, count, timings)[index - 1]
+
+
+
+# ######################################################################
+# Manifests.
+#
+
+def loadManifest(path):
+    """Load the given manifest file."""
+
+    f = open(path, 'r')
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+def loadTimings(manifestPath):
+    """
+    Return the render time of each source file recorded in the given
+    manifest, or an empty dictionary if the manifest does not exist.
+
+    @rtype: C{dict} mapping C{str} to C{float}
+    """
+
+    if not os.path.exists(manifestPath):
+        return {}
+
+    sources = loadManifest(manifestPath).get('sources', {})
+    return dict([(path, source['seconds'])
+                 for path, source in sources.items()
+                 if source.get('seconds') is not None])
+
+def mergeManifests(manifestPaths, previousManifestPath=None):
+    """
+    Merge the manifests written by the shards of a build.
+
+    @param manifestPaths: The paths of the shard manifests.
+    @type manifestPaths: C{list} of C{str}
+    @param previousManifestPath: The path of the merged manifest from
+        the previous build, or C{None}.  The outputs in that manifest
+        that were not written by any shard are listed as removed.
+    @type previousManifestPath: C{str}
+    @return: The merged manifest.
+    @rtype: C{dict}
+    @raise ManifestConflict: If more than one shard wrote the same
+        output file.
+    """
+
+    merged = {
+        'outputs': {}, 'sources': {},
+        'created': [], 'changed': [], 'unchanged': [],
+    }
+    owners = {}
+
+    # Combine the manifests, keeping track of which manifests wrote each
+    # output.
+    for manifestPath in manifestPaths:
+        manifest = loadManifest(manifestPath)
+        for path, digest in manifest['outputs'].items():
+            owners.setdefault(path, []).append(manifestPath)
+            merged['outputs'][path] = digest
+        merged['sources'].update(manifest.get('sources', {}))
+        for status in ('created', 'changed', 'unchanged'):
+            merged[status].extend(manifest.get(status, []))
+
+    # Make sure that every output was written by exactly one shard.
+    conflicts = dict([(path, manifests)
+                      for path, manifests in owners.items()
+                      if len(manifests) > 1])
+    if conflicts:
+        raise ManifestConflict(conflicts)
+
+    # Find the outputs that were removed since the previous build.  The
+    # per-shard lists are meaningless, because files can move between
+    # shards from one build to the next.
+    previousOutputs = {}
+    if previousManifestPath and os.path.exists(previousManifestPath):
+        previousOutputs = loadManifest(previousManifestPath)['outputs']
+    merged['removed'] = sorted([path for path in previousOutputs
+                                if path not in merged['outputs']])
+
+    for status in ('created', 'changed', 'unchanged'):
+        merged[status].sort()
+    return merged
+
+def writeManifest(path, manifest):
+    """Write the given manifest to a file."""
+
+    f = open(path, 'w')
+    try:
+        f.write(json.dumps(manifest, indent=1, sort_keys=True))
+    finally:
+        f.close()
@@ -37,24 +37,19 @@ XSL stylesheets.
 
 # Python imports.
 import cStringIO
+import hashlib
 import os
-import sys
+import time
 
-# Docutils imports.
-import docutils.core
-
-# xmlsoft imports.
-import libxml2
-
-# restxsl imports.
+# restxsl imports.  docutils, our directives and roles, and the modules
+# that build the XML document are imported by the functions that use
+# them, so that importing this module does not load the docutils parser.
+import backend
+import limits
 import loader
-import restxmldoc
+import memory
 import xslt
 
-# restxsl directives and roles.
-import directives
-import roles
-
 
 
 # ######################################################################
@@ -72,6 +67,139 @@ class InvalidXpathExpression(Exception):
 
 
 
+# ######################################################################
+# RenderInfo class.
+#
+
+class RenderInfo(object):
+    """
+    Information collected by L{restxsl} while transforming a document.
+    Callers that need this information create a RenderInfo object and
+    pass it to L{restxsl}, which fills it in.
+
+    @ivar dependencies: The paths of all of the files that the result
+        documents depend on: the reStructuredText file, the files it
+        includes, the stylesheet and the files it includes and imports,
+        and any other files loaded during the transformation.
+    @type dependencies: C{list} of C{str}
+    @ivar memoryBefore: The number of bytes allocated by libxml2 before
+        the document was rendered, or C{None} if libxml2 memory
+        debugging is not turned on (see L{memory.enableDebugMemory}).
+    @type memoryBefore: C{int}
+    @ivar memoryAfter: The number of bytes allocated by libxml2 after
+        the document was rendered, or C{None}.
+    @type memoryAfter: C{int}
+    @ivar seconds: The wall-clock time taken to render the document, in
+        seconds.
+    @type seconds: C{float}
+    @ivar extCalls: The name of each Python function called by a
+        L{directives.pyxslt_directive} and the time that the call took,
+        in seconds.
+    @type extCalls: C{list} of C{(str, float)} tuples
+    @ivar stylesheetCompiles: The path of each stylesheet compiled
+        while rendering the document and the time that the compilation
+        took, in seconds.  Stylesheets found in the stylesheet cache are
+        not listed.
+    @type stylesheetCompiles: C{list} of C{(str, float)} tuples
+    @ivar cacheStatistics: The number of hits and misses in each of the
+        caches given to L{restxsl} while rendering the document, keyed by
+        the name of the cache (C{doctree}, C{include}, C{stylesheet},
+        C{document}, and C{ext-function}).
+    @type cacheStatistics: C{dict} mapping C{str} to C{(hits, misses)}
+    @ivar links: The targets of the C{reference}, C{footnote_reference},
+        and C{citation_reference} nodes in the document, each with the
+        source file and line number of the reference.  Internal
+        references are given as C{#id}.  C{page} is the index (in
+        C{anchors}) of the result document in which the target must be
+        found: the section page that contains the reference or, for an
+        internal reference, the section page that contains its target.
+        C{page} is C{None} if the target must be found in every result
+        document (when the document was not split into sections, or if
+        the reference or its target is not in a section).  Only
+        collected if L{restxsl} is asked to collect links.
+    @type links: C{list} of C{(target, source, line, page)} tuples
+    @ivar anchors: The ids (and C{a} element names) in each result
+        document, in the same order as the result documents.  Only
+        collected if L{restxsl} is asked to collect links.
+    @type anchors: C{list} of C{list} of C{str}
+    @ivar templateProfile: The time spent in each stylesheet template
+        while transforming the document (see L{xslt.TemplateProfile}).
+        Only collected if L{restxsl} is asked to profile the templates.
+    @type templateProfile: C{list} of C{(stylesheet, match, name, mode,
+        calls, milliseconds)} tuples
+    @ivar warnings: The docutils system messages generated while parsing
+        the document, at or above the report level given to L{restxsl}.
+        C{level} is the docutils message level (1 for info, 2 for
+        warnings, 3 for errors, and 4 for severe errors; see
+        L{formatWarning}).
+    @type warnings: C{list} of C{(level, source, line, message)} tuples
+    @ivar instanceHashes: The digest of each instance of a multidoc
+        document, keyed by the instance's filename.  Only computed if
+        L{restxsl} is given the digests from a previous run.
+    @type instanceHashes: C{dict} mapping C{str} to C{str}
+    @ivar skippedInstances: The filenames of the multidoc instances that
+        were not transformed because their digests had not changed.
+        Their result documents are not returned by L{restxsl}.
+    @type skippedInstances: C{list} of C{str}
+    @ivar skippedOutputs: The paths of the output files of the skipped
+        instances.  Filled in by L{batch.Renderer}, which names the
+        output files.
+    @type skippedOutputs: C{list} of C{str}
+    """
+
+    def __init__(self):
+        # Initialize our attributes.
+        self.dependencies = []
+        self.memoryBefore = None
+        self.memoryAfter = None
+        self.seconds = None
+        self.extCalls = []
+        self.stylesheetCompiles = []
+        self.cacheStatistics = {}
+        self.links = []
+        self.anchors = []
+        self.templateProfile = []
+        self.warnings = []
+        self.instanceHashes = {}
+        self.skippedInstances = []
+        self.skippedOutputs = []
+
+    def addDependencies(self, paths):
+        """Add the given paths to the list of dependencies, ignoring
+        paths that are already in the list."""
+
+        for path in paths:
+            if path not in self.dependencies:
+                self.dependencies.append(path)
+
+
+
+# ######################################################################
+# Post-processor registration.
+#
+
+_postProcessors = []
+
+def registerPostProcessor(postProcessor):
+    """
+    Register a post-processor that will be called for every result
+    document produced by L{restxsl}.  Post-processors are called in the
+    order in which they were registered, after any post-processors
+    given to L{restxsl} itself.
+
+    @param postProcessor: A callable that accepts two arguments: the
+        transformed document and the reStructuredText XML document that
+        was given to the stylesheet.  The post-processor can inspect or
+        modify the transformed document in place before it is
+        serialized.  Both documents belong to the XML backend that is
+        in use (libxml2 C{xmlDoc} objects, by default).
+    @type postProcessor: C{callable}
+    """
+
+    _postProcessors.append(postProcessor)
+
+
+
 # ######################################################################
 # restxsl function.
 #
@@ -82,11 +210,24 @@ def restxsl(
         extModule=None, extModuleCookie=None,
         encoding='ASCII',
         xslBasePath=None,
-        xslPath=None, xslParams=None):
+        xslPath=None, xslParams=None,
+        doctreeCache=None, includeCache=None,
+        restSource=None, postProcessors=None,
+        stylesheetCache=None, info=None,
+        renderLimits=None, extFunctions=None, xmlBackend=None,
+        documentCache=None, splitSections=False, collectLinks=False,
+        profileTemplates=False, reportLevel=2, instanceHashes=None,
+        outputSettings=None):
     """
     Transform reStructuredText to XML using an XSL stylesheet.
 
     @param restPath: The path to the reStructuredText file to transform.
+        If C{restSource} is given, then this is the (virtual) path of
+        that source, and is only used to resolve relative references
+        (C{include} directives, C{source-file} options, and relative
+        stylesheet paths).  May be C{None} in that case, in which case
+        relative references are resolved against the current
+        directory.
     @type restPath: C{str}
     @param smartPunctuation: C{True} to convert quotes, dashes, and
         ellipses to their smart (and curly) Unicode counterparts;
@@ -114,21 +255,170 @@ def restxsl(
     @type xslPath: C{str} containing the path to an XSL stylesheet.
     @param xslParams: Parameters to pass to the XSL stylesheet.
     @type xslParams: C{dict}
+    @param doctreeCache: The cache used to avoid reparsing unchanged
+        reStructuredText files, or C{None} to always parse the file.
+    @type doctreeCache: L{doctreecache.DoctreeCache}
+    @param includeCache: The cache used to avoid rereading files that
+        are included by more than one document, or C{None} to read
+        included files every time.
+    @type includeCache: L{includecache.IncludeCache}
+    @param restSource: The reStructuredText source to transform, or
+        C{None} to read the source from C{restPath}.  This can be a
+        string (C{str} or C{unicode}) or a file-like object with a
+        C{read} method.
+    @type restSource: C{str}, C{unicode}, or C{file}
+    @param postProcessors: Callables that will be applied to each
+        transformed document before it is serialized, in addition to
+        those registered with L{registerPostProcessor}.
+    @type postProcessors: C{list} of C{callable}
+    @param stylesheetCache: The cache used to avoid recompiling
+        stylesheets, or C{None} to compile the stylesheet every time.
+    @type stylesheetCache: L{xslt.StylesheetCache}
+    @param info: An object that will be filled in with information
+        about the transformation, or C{None}.
+    @type info: L{RenderInfo}
+    @param renderLimits: The limits on the resources used to render the
+        document, or C{None} for no limits.
+    @type renderLimits: L{limits.RenderLimits}
+    @param extFunctions: The XSLT extension functions made available to
+        the stylesheet, which memoize their results across calls.  If
+        this is C{None}, the functions listed in the extension module's
+        C{XSLT_FUNCTIONS} attribute are made available, and their
+        results are only memoized while this document is transformed.
+    @type extFunctions: L{extfunctions.ExtensionFunctions}
+    @param xmlBackend: The XML backend used to build, transform, and
+        serialize the XML document, or C{None} to use the libxml2
+        backend.  The stylesheet cache and extension functions (if
+        given) must use the same backend.
+    @type xmlBackend: L{backend.XmlBackend}
+    @param documentCache: The cache of the documents returned by the
+        C{restxsl:document()} extension function, or C{None} to parse
+        those documents again for every call to L{restxsl}.  The cache
+        must use the same XML backend.
+    @type documentCache: L{documentcache.DocumentCache}
+    @param splitSections: C{True} to produce one result document for
+        each top-level section of the document (see
+        L{_transformSections}), instead of a single result document.
+        Multidoc documents are never split.
+    @type splitSections: C{bool}
+    @param collectLinks: C{True} to record the document's outgoing
+        links and the anchors in each result document in C{info} (see
+        L{linkcheck}).
+    @type collectLinks: C{bool}
+    @param profileTemplates: C{True} to record the time spent in each
+        stylesheet template in C{info}.  Only some XML backends support
+        profiling (see L{backend.XmlBackend.supportsProfiling}).
+    @type profileTemplates: C{bool}
+    @param reportLevel: The lowest level of the docutils system messages
+        that are returned in C{info} (1 for info, 2 for warnings, 3 for
+        errors, 4 for severe errors, and 5 for none).  Lower levels make
+        docutils do more work.
+    @type reportLevel: C{int}
+    @param instanceHashes: The digests of the instances of a multidoc
+        document rendered by a previous run, keyed by instance filename
+        (see L{RenderInfo.instanceHashes}), or C{None} to transform
+        every instance.  Instances whose digests have not changed are
+        not transformed; they are listed in
+        L{RenderInfo.skippedInstances} instead.  The digest covers the
+        instance's part of the document, the rest of the document, the
+        stylesheet and the files it includes and imports, the
+        stylesheet parameters, the output encoding, the names of the
+        post-processors, and C{outputSettings}.  It does not cover files
+        loaded during the transformation or the results of XSLT
+        extension functions.
+    @type instanceHashes: C{dict} mapping C{str} to C{str}
+    @param outputSettings: The settings used to write the result
+        documents (see L{output.OutputWriter.settings}), which are part
+        of the multidoc instance digests, so that changing them renders
+        every instance again.  Only used with C{instanceHashes}.
+    @type outputSettings: C{tuple}
     @return: A list of C{(filename, XML text)} tuples, one for each
         result document.  There will normally be only a single document,
         but in the case of a multi-instance call to the L{pyxslt}
-        directive, there will be multiple result documents.  Note that
-        the C{filename} portion of the tuple will always be C{None} in
-        the single-document case.
+        directive, or when splitting the document into sections, there
+        will be multiple result documents.  Note that the C{filename}
+        portion of the tuple will always be C{None} in the
+        single-document case.
     @rtype: C{list} of C{(filename, XML text)} tuples
+    @raise limits.LimitExceeded: If the document exceeds one of its
+        render limits.
     """
 
-    # Create the settings_override dictionary so that we can get
-    # docutils warnings.
-    warnings = cStringIO.StringIO()
+    # Use the libxml2 backend if we were not given a backend.
+    if xmlBackend is None:
+        xmlBackend = backend.getBackend()
+
+    # Use an empty set of limits if we were not given any limits.
+    if renderLimits is None:
+        renderLimits = limits.RenderLimits()
+
+    # Create the render information object if the caller did not give
+    # us one.
+    if info is None:
+        info = RenderInfo()
+
+    # Find the caches whose statistics will be recorded.
+    caches = [(name, cache) for name, cache in (
+                  ('doctree', doctreeCache), ('include', includeCache),
+                  ('stylesheet', stylesheetCache),
+                  ('document', documentCache),
+                  ('ext-function', extFunctions))
+              if cache is not None]
+    cacheCounts = [(cache.hits, cache.misses) for name, cache in caches]
+
+    # Transform the document, enforcing the overall time limit and
+    # recording the memory allocated by libxml2 before and after the
+    # transformation.
+    info.memoryBefore = memory.allocatedBytes()
+    startTime = time.time()
+    timer = limits.Timer('timeout', renderLimits.timeout)
+    timer.start()
+    try:
+        return _restxslDocument(
+            restPath, smartPunctuation, extModule, extModuleCookie,
+            encoding, xslBasePath, xslPath, xslParams,
+            doctreeCache, includeCache, restSource, postProcessors,
+            stylesheetCache, info, renderLimits, extFunctions, xmlBackend,
+            documentCache, splitSections, collectLinks, profileTemplates,
+            reportLevel, instanceHashes, outputSettings)
+    finally:
+        timer.stop()
+        info.seconds = time.time() - startTime
+        info.memoryAfter = memory.allocatedBytes()
+        for (name, cache), (hits, misses) in zip(caches, cacheCounts):
+            info.cacheStatistics[name] = (
+                cache.hits - hits, cache.misses - misses)
+
+
+def _restxslDocument(
+        restPath, smartPunctuation, extModule, extModuleCookie,
+        encoding, xslBasePath, xslPath, xslParams,
+        doctreeCache, includeCache, restSource, postProcessors,
+        stylesheetCache, info, renderLimits, extFunctions, xmlBackend,
+        documentCache, splitSections, collectLinks, profileTemplates,
+        reportLevel, instanceHashes, outputSettings):
+    # Load docutils (along with the directives and roles that we
+    # register with it) and the modules that build the XML document.
+    import docutils.core
+    import docutils.io
+    import docutils.utils
+    import directives
+    import roles
+    import documentcache
+    import extfunctions
+    import restxmldoc
+
+    # Record the reStructuredText file as a dependency.
+    if restPath and restSource is None:
+        info.addDependencies([restPath])
+
+    # Create the settings_override dictionary.  Messages below the
+    # report level are discarded by docutils, and the rest are collected
+    # from the document tree, so the warning stream (without which
+    # docutils would write to stderr) is never read.
     settingsOverrides = {
-        'report_level': 0,
-        'warning_stream': warnings,
+        'report_level': reportLevel,
+        'warning_stream': cStringIO.StringIO(),
     }
 
     # Create the docutils SettingsSpec used to pass information to our
@@ -140,129 +430,660 @@ def restxsl(
                 (None, ('--restxsl-ext-module', ), {}),
                 (None, ('--restxsl-ext-module-cookie', ), {}),
                 (None, ('--restxsl-multidoc', ), {}),
+                (None, ('--restxsl-uncacheable', ), {}),
+                (None, ('--restxsl-include-cache', ), {}),
+                (None, ('--restxsl-limits', ), {}),
+                (None, ('--restxsl-ext-calls', ), {}),
             ),
     )
     settingsSpec.settings_defaults = {
         'restxsl_ext_module': extModule,
         'restxsl_ext_module_cookie': extModuleCookie,
         'restxsl_multidoc': None,
+        'restxsl_uncacheable': False,
+        'restxsl_include_cache': includeCache,
+        'restxsl_limits': renderLimits,
+        'restxsl_ext_calls': info.extCalls,
     }
 
+    # Read the source ourselves if we were given an in-memory source,
+    # or if we need its contents for the doctree cache.
+    restText = None
+    if restSource is not None:
+        if hasattr(restSource, 'read'):
+            restText = restSource.read()
+        else:
+            restText = restSource
+    elif doctreeCache and restPath != '-':
+        f = open(restPath, 'rb')
+        try:
+            restText = f.read()
+        finally:
+            f.close()
+
+    # Look for the document in the doctree cache.  The key covers the
+    # contents of the file and every setting that affects the parse.
+    restDoc = None
+    cacheKey = None
+    if doctreeCache and restText is not None:
+        cacheSettings = settingsOverrides.copy()
+        del cacheSettings['warning_stream']
+        cacheKey = doctreeCache.key(restPath, restText, cacheSettings)
+
+        cached = doctreeCache.load(cacheKey)
+        if cached:
+            restDoc, warnings, dependencies = cached
+            info.addDependencies(dependencies)
+
     # Parse the reStructuredText file into a reStructuredText document
-    # tree.
-    try:
-        restDoc = docutils.core.publish_doctree(
-            source_class=docutils.io.FileInput, source=None,
-            source_path=restPath,
-            settings_spec=settingsSpec, settings_overrides=settingsOverrides)
-    except docutils.utils.SystemMessage, msg:
-        raise RestException(msg)
-
-    # Print out any warnings.
-    # TODO Return these to the caller.
-    warningsText = warnings.getvalue()
-    if warningsText:
-        sys.stderr.write(warningsText)
+    # tree if we did not find it in the cache.
+    if restDoc is None:
+        if restText is not None:
+            sourceClass = docutils.io.StringInput
+        else:
+            sourceClass = docutils.io.FileInput
+
+        # Read included files through the include cache, if we have
+        # one.
+        directives.registerIncludeDirective(includeCache is not None)
+
+        try:
+            restDoc = docutils.core.publish_doctree(
+                source_class=sourceClass, source=restText,
+                source_path=restPath,
+                settings_spec=settingsSpec,
+                settings_overrides=settingsOverrides)
+        except docutils.utils.SystemMessage, msg:
+            raise RestException(msg)
+
+        info.addDependencies(restDoc.settings.record_dependencies.list)
+
+        # Remove the system messages from the document (they are not
+        # part of the XML document) before the document is cached.
+        warnings = _pruneSystemMessages(restDoc, restPath, reportLevel)
+
+        # Store the document in the cache unless it used a directive
+        # whose results cannot be cached.
+        if cacheKey and not restDoc.settings.restxsl_uncacheable:
+            doctreeCache.store(
+                cacheKey, restDoc, warnings,
+                restDoc.settings.record_dependencies.list)
+
+    # Return the warnings to the caller.
+    info.warnings.extend(warnings)
 
     # Turn the reStructuredText document tree into a reStructuredText
     # XML document.
-    restXml = restxmldoc.RestXmlDocument(restDoc, smartPunctuation)
+    restXml = restxmldoc.RestXmlDocument(
+        restDoc, smartPunctuation, xmlBackend)
 
+    # Create the extension functions for this document if we were not
+    # given a set of functions to use.
+    ownExtFunctions = extFunctions is None and extModule is not None \
+        and hasattr(extModule, 'XSLT_FUNCTIONS')
+    if ownExtFunctions:
+        extFunctions = extfunctions.ExtensionFunctions(
+            extModule, extModuleCookie, renderLimits.extTimeout, xmlBackend)
 
-    # Use the document's stylesheet if the caller did not give us an
-    # override stylesheet.
-    if not xslPath:
-        xslPath = restXml.xslTemplate
+    # Create a document cache for this document if we were not given a
+    # cache to use.
+    ownDocumentCache = documentCache is None
+    if ownDocumentCache:
+        documentCache = documentcache.DocumentCache(xmlBackend)
+
+    # Free the XML document (and the stylesheet, unless it belongs to
+    # the stylesheet cache) when we are done with them.
+    stylesheet = None
+    try:
+        # Make sure that the document is not too large.
+        if renderLimits.maxSourceNodes:
+            numNodes = int(
+                xmlBackend.xpath(restXml.doc, 'count(//node())'))
+            if numNodes > renderLimits.maxSourceNodes:
+                raise limits.LimitExceeded(
+                    'source-nodes',
+                    'Document has %d nodes; the limit is %d.' % (
+                        numNodes, renderLimits.maxSourceNodes))
 
-    # Initialize the entity loader if we were given a base path.
-    if xslBasePath:
+
+        # Use the document's stylesheet if the caller did not give us an
+        # override stylesheet.
+        if not xslPath:
+            xslPath = restXml.xslTemplate
+
+        # Initialize the entity loader.  The loader only applies the base
+        # path to stylesheet references if we were given a base path, but
+        # we always install it so that we know which files were loaded.
         entityLoader = loader.EntityLoader(
-            xslBasePath, os.path.dirname(restPath))
-        libxml2.setEntityLoader(entityLoader)
+            xslBasePath or None, os.path.dirname(restPath or ''))
+        xmlBackend.installEntityLoader(entityLoader)
+
+        # Load the XSL file, using the stylesheet cache if we have one,
+        # and record the time spent compiling it.
+        compileTime = time.time()
+        if stylesheetCache:
+            misses = stylesheetCache.misses
+            stylesheet, xslDependencies = stylesheetCache.load(
+                xslPath, entityLoader)
+            info.addDependencies(xslDependencies)
+            isCompiled = stylesheetCache.misses != misses
+        else:
+            stylesheet = xmlBackend.compileStylesheet(xslPath, entityLoader)
+            xslDependencies = list(entityLoader.dependencies)
+            isCompiled = True
+        if isCompiled:
+            info.stylesheetCompiles.append(
+                (xslPath, time.time() - compileTime))
+
+        # Build the list of post-processors.
+        postProcessors = list(postProcessors or []) + _postProcessors
+        postProcessorNames = [_postProcessorName(postProcessor)
+                              for postProcessor in postProcessors]
+
+        # Collect the document's links, and the anchors in each of the
+        # result documents (after the other post-processors have run).
+        if collectLinks:
+            info.links = _collectLinks(
+                restDoc, restPath, splitSections and not (
+                    restDoc.settings and restDoc.settings.restxsl_multidoc))
+            postProcessors.append(
+                lambda out, xmlDoc: info.anchors.append(
+                    _collectAnchors(xmlBackend, out)))
+
+        # Make the extension functions available to the stylesheet.
+        # The extension module's functions are registered last, so that
+        # they take precedence over our own functions.
+        documentCache.register(entityLoader)
+        if extFunctions:
+            extFunctions.register()
+
+
+        # Compute the part of the multidoc instance digests that is
+        # shared by every instance if we were given the digests from a
+        # previous run.
+        closureDigest = None
+        if instanceHashes is not None \
+                and restDoc.settings and restDoc.settings.restxsl_multidoc:
+            closureDigest = _closureDigest(
+                xslPath, xslDependencies, xslParams, encoding,
+                postProcessorNames, outputSettings)
 
-    # Load the XSL file.
-    stylesheet = xslt.Stylesheet(xslPath)
+        # Bound the stylesheet's recursion.  The limits are global, so
+        # they are set for every document (which restores the defaults
+        # if this document does not have any limits).
+        xmlBackend.setDepthLimits(
+            renderLimits.maxTemplateDepth, renderLimits.maxVariableDepth)
 
+        # Transform the document, profiling the stylesheet's templates
+        # if requested to do so.
+        templateProfile = None
+        if profileTemplates:
+            templateProfile = info.templateProfile
+        try:
+            resultDocuments = _transformDocument(
+                xmlBackend, restPath, restDoc, restXml, stylesheet,
+                entityLoader, xslParams, encoding, postProcessors,
+                renderLimits, splitSections, templateProfile,
+                instanceHashes, closureDigest, info)
+        except xslt.StylesheetException:
+            # Report the real reason if an extension function stopped
+            # the transformation.
+            if extFunctions:
+                extFunctions.raiseError()
+            raise
+
+        # Record the files loaded during the transformation.
+        info.addDependencies(entityLoader.dependencies)
+    finally:
+        if stylesheet is not None and not stylesheetCache:
+            stylesheet.close()
+        restXml.close()
+        if ownExtFunctions:
+            extFunctions.clear()
+        if ownDocumentCache:
+            documentCache.clear()
+
+    # Return the result document list.
+    return resultDocuments
+
+
+def _transformDocument(xmlBackend, restPath, restDoc, restXml, stylesheet,
+                       entityLoader, xslParams, encoding, postProcessors,
+                       renderLimits, splitSections, templateProfile,
+                       instanceHashes, closureDigest, info):
+    # Split the document into sections if requested to do so (and if
+    # the document has any sections).
+    if splitSections and not (
+            restDoc.settings and restDoc.settings.restxsl_multidoc):
+        resultDocuments = _transformSections(
+            xmlBackend, restPath, restXml, stylesheet, entityLoader,
+            xslParams, encoding, postProcessors, renderLimits,
+            templateProfile)
+        if resultDocuments:
+            return resultDocuments
 
     # Is this a multiple-instance document (multidoc)?  If so, we need
     # to process the file multiple times, one for each document
     # instance.  If not, just process the current document.
     resultDocuments = []
-    if restDoc.settings.restxsl_multidoc:
-        # Generate a document for each of the multidoc's children.
-        for mdChildIndex, mdChild in enumerate(
-                restXml.doc.xpathEval('//pyxslt[@multidoc="true"]/*')):
-            # Get the name of the document using the multidoc XPATH
-            # expression.
-            filenameNode = restXml.doc.xpathEval(
-                '//pyxslt[@multidoc="true"]/%s' % (
-                    restDoc.settings.restxsl_multidoc))
-            instanceFilename = filenameNode[mdChildIndex].getContent()
-
-            # Make a copy of the original document.
-            instanceDoc = libxml2.newDoc('1.0')
-            xmlNode = restXml.doc.getRootElement().docCopyNode(instanceDoc, 1)
-            instanceDoc.setRootElement(xmlNode)
-
-            # Find the multidoc root.
-            mdRoot = instanceDoc.doc.xpathEval('//pyxslt[@multidoc="true"]')[0]
-
-            # Replace the multidoc element in the instance document with
-            # a new 'pyxslt' node containing the current child.
-            mdChildCopy = mdChild.docCopyNode(instanceDoc, 1)
-            mdPythonNode = libxml2.newNode('pyxslt')
-            mdPythonNode.addChild(mdChildCopy)
-            mdRoot.replaceNode(mdPythonNode)
-
-            # Process the copy of the document.
-            xml = _restxsl(instanceDoc, stylesheet, xslParams, encoding)
-            resultDocuments.append((instanceFilename, xml))
-
-            # Free the instance document.
-            instanceDoc.freeDoc()
+    if restDoc.settings and restDoc.settings.restxsl_multidoc:
+        # Find the multidoc's children, and the name of each of the
+        # instance documents using the multidoc XPATH expression.
+        mdChildren = xmlBackend.xpath(
+            restXml.doc, '//pyxslt[@multidoc="true"]/*')
+        filenameNodes = xmlBackend.xpath(
+            restXml.doc, '//pyxslt[@multidoc="true"]/%s' % (
+                restDoc.settings.restxsl_multidoc))
+
+        # Make a copy of the original document without the multidoc's
+        # children.  Each instance document is a copy of this skeleton,
+        # so the cost of building an instance does not grow with the
+        # number of instances.
+        skeletonDoc = xmlBackend.copyDocument(restXml.doc)
+        try:
+            for node in xmlBackend.xpath(
+                    skeletonDoc, '//pyxslt[@multidoc="true"]/*'):
+                xmlBackend.removeNode(node)
+
+            # The skeleton is part of every instance's digest.
+            if instanceHashes is not None:
+                skeletonDigest = hashlib.sha1(closureDigest)
+                skeletonDigest.update(xmlBackend.serializeNode(
+                    xmlBackend.rootElement(skeletonDoc)))
+
+            # Generate a document for each of the multidoc's children.
+            for mdChildIndex, mdChild in enumerate(mdChildren):
+                instanceFilename = xmlBackend.nodeText(
+                    filenameNodes[mdChildIndex])
+
+                # Skip the instance if it has not changed since the
+                # previous run.
+                if instanceHashes is not None:
+                    digest = skeletonDigest.copy()
+                    digest.update(xmlBackend.serializeNode(mdChild))
+                    digest = digest.hexdigest()
+                    info.instanceHashes[instanceFilename] = digest
+                    if instanceHashes.get(instanceFilename) == digest:
+                        info.skippedInstances.append(instanceFilename)
+                        continue
+
+                # Make a copy of the skeleton document.
+                instanceDoc = xmlBackend.copyDocument(skeletonDoc)
+                try:
+                    # Find the multidoc root.
+                    mdRoot = xmlBackend.xpath(
+                        instanceDoc, '//pyxslt[@multidoc="true"]')[0]
+
+                    # Replace the multidoc element in the instance
+                    # document with a new 'pyxslt' node containing the
+                    # current child.
+                    xmlBackend.replaceWithElement(
+                        mdRoot, 'pyxslt', [mdChild])
+
+                    # Process the copy of the document.
+                    xml = _restxsl(
+                        xmlBackend, instanceDoc, stylesheet, entityLoader,
+                        xslParams, encoding, postProcessors,
+                        renderLimits.maxOutputSize, templateProfile)
+                    resultDocuments.append((instanceFilename, xml))
+                finally:
+                    # Free the instance document.
+                    xmlBackend.freeDocument(instanceDoc)
+        finally:
+            # Free the skeleton document.
+            xmlBackend.freeDocument(skeletonDoc)
     else:
         # Process the document.
-        xml = _restxsl(restXml.doc, stylesheet, xslParams, encoding)
+        xml = _restxsl(
+            xmlBackend, restXml.doc, stylesheet, entityLoader, xslParams,
+            encoding, postProcessors, renderLimits.maxOutputSize,
+            templateProfile)
         resultDocuments.append((None, xml))
 
-    # Free the stylesheet and parsed document.
-    del stylesheet
-    del restXml
+    # Return the result document list.
+    return resultDocuments
+
+
+def _transformSections(xmlBackend, restPath, restXml, stylesheet,
+                       entityLoader, xslParams, encoding, postProcessors,
+                       renderLimits, templateProfile):
+    """
+    Transform each of the top-level sections of the document into its
+    own result document.  Each result document (page) is named after
+    the reStructuredText file and the (first) id of its section
+    (C{manual-intro} for the C{intro} section of C{manual.txt}, for
+    example) and placed next to the reStructuredText file, so that
+    documents in the same directory with sections of the same name do
+    not overwrite each other's pages.
+
+    The document is only built once.  The stylesheet is applied to a
+    copy of the document in which the top-level sections have been
+    replaced by the current section; everything else in the document
+    (the title and any content before the first section, for example)
+    appears in every copy.  A C{split-toc} element is added to the end
+    of the document, containing an C{entry} element (with C{id},
+    C{title}, C{page}, and C{index} attributes) for each section.
+
+    The following stylesheet parameters describe the current section:
+    C{section-id}, C{section-title}, C{section-index} (starting at 1),
+    C{section-count}, C{section-page} (the name of the page, without
+    an extension), C{prev-section-id}, C{prev-section-title},
+    C{prev-section-page}, C{next-section-id}, C{next-section-title},
+    and C{next-section-page} (the previous and next values are empty
+    strings at the ends of the document), and C{toc}, which selects the
+    C{split-toc} entries.
+
+    @return: The C{(filename, XML text)} tuples for the sections, or
+        C{None} if the document does not have any top-level sections.
+    @rtype: C{list} of C{(filename, XML text)} tuples
+    """
+
+    # Find the top-level sections.
+    sections = xmlBackend.xpath(restXml.doc, '/*/section')
+    if not sections:
+        return None
+
+    # Get the id, title, and page name of each section.
+    pagePrefix = ''
+    if restPath:
+        pagePrefix = os.path.splitext(os.path.basename(restPath))[0] + '-'
+    entries = []
+    for index in range(1, len(sections) + 1):
+        ids = xmlBackend.xpath(
+            restXml.doc, 'string(/*/section[%d]/@ids)' % (index)).split()
+        title = xmlBackend.xpath(
+            restXml.doc, 'string(/*/section[%d]/title)' % (index))
+        if isinstance(title, unicode):
+            title = title.encode('UTF-8')
+        sectionId = ids and ids[0] or 'section-%d' % (index)
+        entries.append((sectionId, title, pagePrefix + sectionId))
+
+    # Build the skeleton document: a copy of the document with only a
+    # placeholder for the top-level sections, and with the table of
+    # contents added to the end.
+    skeletonDoc = xmlBackend.copyDocument(restXml.doc)
+    resultDocuments = []
+    try:
+        skeletonSections = xmlBackend.xpath(skeletonDoc, '/*/section')
+        placeholder = skeletonSections[0]
+        for section in skeletonSections[1:]:
+            xmlBackend.removeNode(section)
+
+        toc = xmlBackend.addElement(
+            xmlBackend.rootElement(skeletonDoc), 'split-toc')
+        for index, (sectionId, title, page) in enumerate(entries):
+            entry = xmlBackend.addElement(toc, 'entry')
+            xmlBackend.setAttribute(entry, 'id', sectionId)
+            xmlBackend.setAttribute(entry, 'title', title)
+            xmlBackend.setAttribute(entry, 'page', page)
+            xmlBackend.setAttribute(entry, 'index', str(index + 1))
+
+        # Transform each section.
+        for index, section in enumerate(sections):
+            # Put the section into the skeleton.
+            placeholder = xmlBackend.replaceWithCopy(placeholder, section)
+
+            # Describe the section to the stylesheet.
+            prevId, prevTitle, prevPage = \
+                index > 0 and entries[index - 1] or ('', '', '')
+            nextId, nextTitle, nextPage = \
+                index + 1 < len(entries) and entries[index + 1] or ('', '', '')
+            params = dict(xslParams or {})
+            params.update({
+                'section-id': _xpathLiteral(entries[index][0]),
+                'section-title': _xpathLiteral(entries[index][1]),
+                'section-index': str(index + 1),
+                'section-count': str(len(entries)),
+                'section-page': _xpathLiteral(entries[index][2]),
+                'prev-section-id': _xpathLiteral(prevId),
+                'prev-section-title': _xpathLiteral(prevTitle),
+                'prev-section-page': _xpathLiteral(prevPage),
+                'next-section-id': _xpathLiteral(nextId),
+                'next-section-title': _xpathLiteral(nextTitle),
+                'next-section-page': _xpathLiteral(nextPage),
+                'toc': '/*/split-toc/entry',
+            })
+
+            # Transform the document.
+            xml = _restxsl(
+                xmlBackend, skeletonDoc, stylesheet, entityLoader, params,
+                encoding, postProcessors, renderLimits.maxOutputSize,
+                templateProfile)
+            resultDocuments.append((
+                os.path.join(
+                    os.path.dirname(restPath or ''), entries[index][2]),
+                xml))
+    finally:
+        xmlBackend.freeDocument(skeletonDoc)
 
     # Return the result document list.
     return resultDocuments
 
 
-def _restxsl(xmlDoc, stylesheet, xslParams=None, encoding='ASCII'):
+def _restxsl(xmlBackend, xmlDoc, stylesheet, entityLoader, xslParams=None,
+             encoding='ASCII', postProcessors=(), maxOutputSize=None,
+             templateProfile=None):
     # Resolve pyxslt XPATH references.
-    for xmlNode in xmlDoc.xpathEval('//pyxslt-xpath-reference'):
+    for xmlNode in xmlBackend.xpath(xmlDoc, '//pyxslt-xpath-reference'):
         # Get the XPATH expression.
-        xpath = origXpath = xmlNode.getContent()
+        xpath = origXpath = xmlBackend.nodeText(xmlNode)
 
         # Prepend the ``//pyxslt/`` root to relative XPATH expressions.
         if xpath[0] != '/':
             xpath = '//pyxslt/' + xpath
 
         # Look up this reference.
-        targetNode = xmlDoc.xpathEval(xpath)
+        targetNode = xmlBackend.xpath(xmlDoc, xpath)
         if not targetNode:
             raise InvalidXpathExpression, origXpath
 
         # Replace the XPATH reference with the contents of the found
         # node.
-        newTextNode = libxml2.newText(targetNode[0].getContent())
-        xmlNode.replaceNode(newTextNode)
+        xmlBackend.replaceWithText(
+            xmlNode, xmlBackend.nodeText(targetNode[0]))
 
 
     # Apply the stylesheet to the reStructuredText XML document.
-    out = stylesheet.apply(xmlDoc, xslParams)
+    out = stylesheet.apply(
+        xmlDoc, xslParams, entityLoader, profile=templateProfile)
+
+    try:
+        # Run the post-processors over the transformed document.
+        for postProcessor in postProcessors:
+            postProcessor(out, xmlDoc)
 
-    # Get the contents of the XML file.
-    xml = out.serialize(encoding=encoding)
+        # Get the contents of the XML file.
+        xml = stylesheet.serialize(out, encoding)
+    finally:
+        # Free the transformed document.
+        xmlBackend.freeDocument(out)
 
-    # Free the transformed document.
-    out.freeDoc()
+    # Make sure that the result is not too large.
+    if maxOutputSize and len(xml) > maxOutputSize:
+        raise limits.LimitExceeded(
+            'output-size',
+            'Result document is %d bytes; the limit is %d.' % (
+                len(xml), maxOutputSize))
 
 
     # Return the XML text.
     return xml
+
+
+def _postProcessorName(postProcessor):
+    """Return the name of a post-processor, for the multidoc instance
+    digests.  Functions are named after their module and name; lambdas,
+    which all have the same name, are also named after the file and line
+    that define them.  Other callables are named after their class."""
+
+    name = getattr(postProcessor, '__name__', None)
+    if name is None:
+        return repr(type(postProcessor))
+    name = '%s.%s' % (getattr(postProcessor, '__module__', None), name)
+    code = getattr(postProcessor, 'func_code', None)
+    if code is not None and code.co_name == '<lambda>':
+        name = '%s (%s:%d)' % (name, code.co_filename, code.co_firstlineno)
+    return name
+
+
+def _closureDigest(xslPath, xslDependencies, xslParams, encoding,
+                   postProcessorNames=(), outputSettings=None):
+    """Return the part of the digest of a multidoc instance that does not
+    depend on the document: the stylesheet and the contents of the files
+    it includes and imports, the stylesheet parameters, the output
+    encoding, the names of the post-processors, and the settings used to
+    write the result documents."""
+
+    digest = hashlib.sha1(repr((
+        xslPath, sorted((xslParams or {}).items()), encoding,
+        list(postProcessorNames), outputSettings)))
+    for path in sorted(xslDependencies):
+        try:
+            f = open(path, 'rb')
+            try:
+                data = f.read()
+            finally:
+                f.close()
+        except IOError:
+            data = ''
+        digest.update('%s\0%d\0' % (path, len(data)))
+        digest.update(data)
+    return digest.digest()
+
+
+def _pruneSystemMessages(restDoc, restPath, reportLevel):
+    # Remove the system messages from the document, returning those at
+    # or above the report level as (level, source, line, message)
+    # tuples.  Messages generated by the docutils transforms are not
+    # part of the document tree; they are kept in a separate list (or,
+    # if a writer's transforms have been applied, moved into a section
+    # at the end of the document, which is removed once it has been
+    # emptied).
+    import docutils.nodes
+    messages = list(restDoc.traverse(docutils.nodes.system_message))
+    messages.extend([node for node in restDoc.transform_messages
+                     if node.parent is None])
+    restDoc.transform_messages = []
+
+    warnings = []
+    for node in messages:
+        if node['level'] >= reportLevel:
+            message = '\n\n'.join([
+                child.astext() for child in node.children
+                if isinstance(child, docutils.nodes.paragraph)])
+            if isinstance(message, unicode):
+                message = message.encode('UTF-8')
+            warnings.append((
+                node['level'], node.get('source') or restPath,
+                node.get('line'), message))
+        if node.parent is not None:
+            node.parent.remove(node)
+
+    for node in tuple(restDoc.traverse(docutils.nodes.section)):
+        if 'system-messages' in node['classes'] and len(node) == 1:
+            node.parent.remove(node)
+
+    return warnings
+
+
+def formatWarning(warning):
+    """
+    Format a warning from L{RenderInfo.warnings} in the same way as
+    docutils does.
+
+        >>> print formatWarning((2, 'index.txt', 3, 'Unknown target.'))
+        index.txt:3: (WARNING/2) Unknown target.
+
+    @param warning: The warning.
+    @type warning: C{(level, source, line, message)} tuple
+    @return: The formatted warning.
+    @rtype: C{str}
+    """
+
+    import docutils.utils
+    level, source, line, message = warning
+    location = source or ''
+    if line is not None:
+        location = '%s:%d' % (location, line)
+    return '%s: (%s/%d) %s' % (
+        location, docutils.utils.Reporter.levels[level], level, message)
+
+
+def _collectLinks(restDoc, restPath, splitSections=False):
+    # Find the target of every reference in the document, along with
+    # the location of the reference.  Inline nodes do not usually have
+    # a line number, so we use the line number of the nearest ancestor
+    # that does.  If the document is going to be split into sections,
+    # also find the page on which the target must be found.
+    import docutils.nodes
+    sections = []
+    if splitSections:
+        sections = [node for node in restDoc.children
+                    if isinstance(node, docutils.nodes.section)]
+
+    def sectionPage(node):
+        # Return the index of the top-level section that contains the
+        # given node, or None if the node is not in a section.
+        while node is not None and node.parent is not restDoc:
+            node = node.parent
+        for index, section in enumerate(sections):
+            if section is node:
+                return index
+        return None
+
+    links = []
+    for node in restDoc.traverse(
+            lambda node: isinstance(node, (
+                docutils.nodes.reference, docutils.nodes.footnote_reference,
+                docutils.nodes.citation_reference))):
+        page = None
+        if node.get('refuri'):
+            target = node['refuri']
+            if sections:
+                page = sectionPage(node)
+        elif node.get('refid'):
+            target = '#' + node['refid']
+            if sections:
+                page = sectionPage(restDoc.ids.get(node['refid']))
+        else:
+            continue
+
+        located = node
+        while located.parent is not None and located.line is None:
+            located = located.parent
+        links.append(
+            (target, located.source or restPath, located.line, page))
+
+    return links
+
+
+def _collectAnchors(xmlBackend, xmlDoc):
+    # Return the ids and anchor names in the given result document.
+    return [xmlBackend.nodeText(node) for node in xmlBackend.xpath(
+        xmlDoc, '//@id | //*[local-name()="a"]/@name')]
+
+
+def _xpathLiteral(value):
+    """
+    Quote the given string as an XPATH string literal.
+
+        >>> print _xpathLiteral('Home')
+        'Home'
+        >>> print _xpathLiteral("Don't panic")
+        "Don't panic"
+        >>> print _xpathLiteral('''It's "fine"''')
+        concat('It', "'", 's "fine"')
+
+    @param value: The string.
+    @type value: C{str}
+    @return: The XPATH expression.
+    @rtype: C{str}
+    """
+
+    if "'" not in value:
+        return "'%s'" % (value)
+    elif '"' not in value:
+        return '"%s"' % (value)
+    else:
+        return 'concat(%s)' % (', "\'", '.join(
+            ["'%s'" % (part) for part in value.split("'")]))
@@ -0,0 +1,191 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Persistent worker mode for build-system integration.
+
+A worker reads job requests from its input, one per line, renders them
+with a single L{batch.Renderer} (so that caches stay warm across jobs),
+and writes one reply line per job to its output.  Each request is
+either a JSON object::
+
+    {"id": 7, "source": "docs/index.txt", "output": "out/index.html",
+     "stylesheet": "site.xsl", "params": {"section": "docs"}}
+
+or just the path to a reStructuredText file.  Only C{source} is
+required.  Each reply is a JSON object::
+
+    {"id": 7, "status": "ok", "outputs": ["out/index.html"],
+     "dependencies": ["docs/index.txt", "site.xsl", ...],
+     "warnings": ["docs/index.txt:12: (WARNING/2) ...", ...]}
+
+Failed jobs have a C{status} of C{error} and an C{error} message.  If
+libxml2 memory debugging is turned on (see L{memory.enableDebugMemory})
+each successful reply also has a C{memory} object giving the number of
+bytes allocated by libxml2 C{before} and C{after} the job; a worker
+whose C{after} figure keeps growing is leaking memory.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import json
+import sys
+
+# restxsl imports.
+import batch
+import output
+import transform
+
+
+
+# ######################################################################
+# Worker functions.
+#
+
+def serve(renderer, outputWriter, requests=sys.stdin, replies=sys.stdout,
+          depfiles=False):
+    """
+    Process job requests until the input is exhausted.
+
+    @param renderer: The renderer used for every job.
+    @type renderer: L{batch.Renderer}
+    @param outputWriter: The writer used for the output files.
+    @type outputWriter: L{output.OutputWriter}
+    @param requests: The stream from which job requests are read.
+    @type requests: C{file}
+    @param replies: The stream to which job replies are written.
+    @type replies: C{file}
+    @param depfiles: C{True} to write a depfile next to each output.
+    @type depfiles: C{bool}
+    """
+
+    for line in iter(requests.readline, ''):
+        # Skip blank lines.
+        line = line.strip()
+        if not line:
+            continue
+
+        # Process the job and send the reply.
+        reply = runJob(renderer, outputWriter, line, depfiles)
+        replies.write(json.dumps(reply) + '\n')
+        replies.flush()
+
+
+def runJob(renderer, outputWriter, request, depfiles=False):
+    """
+    Process a single job request.
+
+    @param renderer: The renderer used for the job.
+    @type renderer: L{batch.Renderer}
+    @param outputWriter: The writer used for the output files.
+    @type outputWriter: L{output.OutputWriter}
+    @param request: The job request (a JSON object or a path).
+    @type request: C{str}
+    @param depfiles: C{True} to write a depfile next to each output.
+    @type depfiles: C{bool}
+    @return: The reply to the request.
+    @rtype: C{dict}
+    """
+
+    reply = {'id': None}
+    try:
+        # Parse the request.
+        if request.startswith('{'):
+            job = _encode(json.loads(request))
+        else:
+            job = {'source': request}
+        reply['id'] = job.get('id')
+
+        # Stdin is reserved for job requests.
+        source = job['source']
+        if source == '-':
+            raise ValueError, 'Workers cannot read documents from stdin.'
+
+        # Render the document.
+        outputs, info = renderer.render(
+            source,
+            xslPath=job.get('stylesheet'),
+            xslParams=batch.quoteParams(job.get('params', {})),
+            outputPath=job.get('output'))
+
+        # Write out the result documents and wait for them to be
+        # completely written.
+        for path, xml in outputs:
+            outputWriter.write(path, xml)
+            if depfiles:
+                outputWriter.write(
+                    path + '.d',
+                    output.makeDepfile(path, info.dependencies),
+                    plain=True)
+        outputWriter.flush()
+
+        # Build the reply.
+        reply['status'] = 'ok'
+        reply['outputs'] = [path for path, xml in outputs]
+        reply['dependencies'] = info.dependencies
+        reply['warnings'] = [
+            transform.formatWarning(warning) for warning in info.warnings]
+        if info.memoryAfter is not None:
+            reply['memory'] = {
+                'before': info.memoryBefore, 'after': info.memoryAfter}
+    except Exception, e:
+        reply['status'] = 'error'
+        reply['error'] = '%s: %s' % (e.__class__.__name__, e)
+
+    return reply
+
+
+
+# ######################################################################
+# Utility functions.
+#
+
+def _encode(value):
+    """Convert the Unicode strings in a decoded JSON request to UTF-8
+    byte strings, which is what libxml2 expects."""
+
+    if isinstance(value, unicode):
+        return value.encode('UTF-8')
+    elif isinstance(value, dict):
+        return dict([(_encode(k), _encode(v)) for k, v in value.items()])
+    elif isinstance(value, list):
+        return [_encode(v) for v in value]
+    else:
+        return value
@@ -30,8 +30,13 @@
 # THE POSSIBILITY OF SUCH DAMAGE.
 
 """
-Wraps libxslt stylesheet objects to provide auto-deletion of the
-underlying L{libxslt.stylesheet} class.
+Backend-independent support for compiled stylesheets: the exception
+raised when a stylesheet cannot be compiled or applied, a cache of
+compiled stylesheets, the accumulation of template profiles, and
+access to libxslt's global depth limits.  The stylesheets themselves
+are compiled by the XML backends (see
+L{backend.XmlBackend.compileStylesheet}), so this module does not
+import libxml2 or libxslt.
 
 @author: Michael Alyn Miller <malyn@strangeGizmo.com>
 @copyright: 2006 by Michael Alyn Miller
@@ -43,9 +48,11 @@ underlying L{libxslt.stylesheet} class.
 # IMPORTS
 #
 
-# xmlsoft imports.
-import libxml2
-import libxslt
+# Python imports.
+import os
+
+# restxsl imports.
+import backend
 
 
 
@@ -64,56 +71,269 @@ class StylesheetException(Exception):
 #
 
 class Stylesheet(object):
-    """Wrapper around a libxslt stylesheet."""
+    """
+    The libxml2 stylesheet wrapper, under the name that it had before
+    the XML backends were introduced.  Constructing a Stylesheet returns
+    a L{libxml2backend.Libxml2Stylesheet}; the libxml2 backend is only
+    imported at that point, so that this module can still be imported
+    without the libxml2 bindings.  New code should compile stylesheets
+    with L{backend.XmlBackend.compileStylesheet}.
+    """
+
+    def __new__(cls, xslPath):
+        """
+        Compile the XSL stylesheet at the given path with libxslt.
+
+        @param xslPath: Path to the XSL file.
+        @type xslPath: C{str}
+        @return: The compiled stylesheet.
+        @rtype: L{libxml2backend.Libxml2Stylesheet}
+        @raise StylesheetException: If an error occurs while parsing the
+            stylesheet.
+        """
+
+        import libxml2backend
+        return libxml2backend.Libxml2Stylesheet(xslPath)
+
+
+
+# ######################################################################
+# StylesheetCache class.
+#
+
+class StylesheetCache(object):
+    """
+    Cache of compiled stylesheets.  Compiling a stylesheet (and all of
+    the stylesheets that it includes and imports) is expensive, so
+    long-running processes that transform many documents with the same
+    stylesheet should load their stylesheets through a cache.
+
+    A cached stylesheet is recompiled if any of the files that were read
+    while compiling it have been modified.  The cache owns its
+    stylesheets: stale stylesheets are closed when they are replaced,
+    and L{clear} closes every stylesheet in the cache.
+    """
 
     # ----------------------------------
     # Constructor and destructor.
     #
 
-    def __init__(self, xslPath):
+    def __init__(self, xmlBackend=None):
+        """
+        Initialize an empty StylesheetCache.
+
+        @param xmlBackend: The XML backend used to compile the
+            stylesheets, or C{None} to use the libxml2 backend.
+        @type xmlBackend: L{backend.XmlBackend}
+        """
+
+        # Initialize the cache and our statistics.
+        self.xmlBackend = xmlBackend or backend.getBackend()
+        self.__entries = {}
+        self.hits = 0
+        self.misses = 0
+
+
+    # ----------------------------------
+    # StylesheetCache methods.
+    #
+
+    def load(self, xslPath, entityLoader):
         """
-        Construct a Stylesheet object given the path to an XSL
-        stylesheet.
+        Return the compiled stylesheet for the given path, compiling the
+        stylesheet if it is not in the cache (or if it has changed).
 
         @param xslPath: Path to the XSL file.
         @type xslPath: C{str}
+        @param entityLoader: The entity loader that will be used to find
+            the stylesheet and its includes and imports.  The loader
+            must already have been installed in the XML backend.
+        @type entityLoader: L{loader.EntityLoader}
+        @return: A C{(stylesheet, dependencies)} tuple containing the
+            compiled stylesheet and the paths of the files that make up
+            the stylesheet.
+        @rtype: C{tuple}
         @raise StylesheetException: If an error occurs while parsing the
             stylesheet.
         """
 
-        # Parse the XSL file into an XML document.
-        self.__doc = libxml2.parseFile(xslPath)
+        # Look for the stylesheet in the cache.  References in the
+        # stylesheet are resolved by the entity loader, so the loader's
+        # paths are part of the key.
+        key = (xslPath, entityLoader.basePath, entityLoader.relPath)
+        try:
+            stylesheet, dependencies = self.__entries[key]
+            for path, mtime in dependencies:
+                if _mtime(path) != mtime:
+                    break
+            else:
+                self.hits += 1
+                return (stylesheet, [path for path, mtime in dependencies])
+
+            # The stylesheet is out of date; close it.
+            del self.__entries[key]
+            stylesheet.close()
+        except KeyError:
+            pass
 
-        # Now parse the stylesheet.
-        self.__stylesheet = libxslt.parseStylesheetDoc(self.__doc)
+        # Compile the stylesheet, keeping track of the files read by the
+        # entity loader while we do so.
+        self.misses += 1
+        firstDependency = len(entityLoader.dependencies)
+        stylesheet = self.xmlBackend.compileStylesheet(xslPath, entityLoader)
+        paths = entityLoader.dependencies[firstDependency:]
 
-        # Throw an exception if we were unable to parse the stylesheet.
-        if not self.__stylesheet:
-            raise StylesheetException, 'Error parsing stylesheet.'
+        # Cache the stylesheet and return it.
+        self.__entries[key] = (
+            stylesheet, [(path, _mtime(path)) for path in paths])
+        return (stylesheet, paths)
 
-    def __del__(self):
-        # Free the stylesheet.  This will also take care of freeing the
-        # underlying XML document.
-        try:
-            self.__stylesheet.freeStylesheet()
-        except:
-            pass
+    def clear(self):
+        """Remove all of the stylesheets from the cache, closing
+        them."""
+
+        entries = self.__entries.values()
+        self.__entries.clear()
+        for stylesheet, dependencies in entries:
+            stylesheet.close()
+
+
+
+# ######################################################################
+# TemplateProfile class.
+#
 
+class TemplateProfile(object):
+    """
+    The number of calls to each stylesheet template, and the total time
+    spent in each template, accumulated over any number of
+    transformations.  Templates are identified by the path of the
+    stylesheet that was applied (templates in included and imported
+    stylesheets are attributed to the applied stylesheet) and by their
+    match pattern, name, and mode.
+    """
 
     # ----------------------------------
-    # Stylesheet methods.
+    # Constructor and destructor.
     #
 
-    def apply(self, doc, params):
+    def __init__(self):
+        """Initialize an empty TemplateProfile."""
+
+        self.__templates = {}
+
+
+    # ----------------------------------
+    # TemplateProfile methods.
+    #
+
+    def add(self, entries):
+        """
+        Add the profile of one or more transformations.
+
+        @param entries: The profile entries, as collected by a
+            stylesheet's C{apply} method (or the C{templateProfile} of a
+            L{transform.RenderInfo}).
+        @type entries: C{list} of C{(stylesheet, match, name, mode,
+            calls, milliseconds)} tuples
+        """
+
+        for stylesheet, match, name, mode, calls, milliseconds in entries:
+            totals = self.__templates.setdefault(
+                (stylesheet, match, name, mode), [0, 0.0])
+            totals[0] += calls
+            totals[1] += milliseconds
+
+    def templates(self):
+        """
+        Return the accumulated profile, with the templates that took the
+        most time first.
+
+        @rtype: C{list} of C{(stylesheet, match, name, mode, calls,
+            milliseconds)} tuples
+        """
+
+        templates = [key + tuple(totals)
+                     for key, totals in self.__templates.items()]
+        templates.sort(key=lambda template: (-template[5], template[:4]))
+        return templates
+
+    def format(self):
         """
-        Apply this stylesheet to the given libxml2 xmlDoc object.
-
-        @param doc: The XML document.
-        @type doc: L{libxml2.xmlDoc}
-        @param params: Stylesheet parameters.
-        @type params: C{dict}
-        @return: The transformed XML document.
-        @rtype: L{libxml2.xmlDoc}
+        Return the accumulated profile as a plain-text table.
+
+        @rtype: C{str}
         """
 
-        return self.__stylesheet.applyStylesheet(doc, params)
+        lines = ['%10s %12s %10s  %s' % (
+            'calls', 'total ms', 'avg ms', 'template')]
+        for stylesheet, match, name, mode, calls, milliseconds \
+                in self.templates():
+            description = []
+            if match:
+                description.append('match="%s"' % (match))
+            if name:
+                description.append('name="%s"' % (name))
+            if mode:
+                description.append('mode="%s"' % (mode))
+            lines.append('%10d %12.1f %10.3f  %s %s' % (
+                calls, milliseconds, calls and milliseconds / calls or 0.0,
+                stylesheet, ' '.join(description)))
+        text = '\n'.join(lines) + '\n'
+        if isinstance(text, unicode):
+            text = text.encode('UTF-8')
+        return text
+
+
+
+# ######################################################################
+# Depth limits.
+#
+
+DEFAULT_MAX_TEMPLATE_DEPTH = 3000
+"""libxslt's default limit on the depth of nested template calls."""
+
+DEFAULT_MAX_VARIABLE_DEPTH = 15000
+"""libxslt's default limit on the number of variables and parameters
+on the transformation's stack."""
+
+def setLibxsltLimit(libraryPath, name, value):
+    """
+    Set one of libxslt's global limits (C{xsltMaxDepth} or
+    C{xsltMaxVars}).  libxslt copies the limits into each transformation
+    context when the context is created, so the new value applies to
+    the transformations that start after this call.  Neither the lxml
+    nor the libxslt bindings provide a way to set every limit, so the
+    variable is set directly through C{ctypes}.
+
+    @param libraryPath: The path to the shared library (or Python
+        extension module) that links libxslt.
+    @type libraryPath: C{str}
+    @param name: The name of the limit.
+    @type name: C{str}
+    @param value: The new value of the limit.
+    @type value: C{int}
+    @raise ValueError: If the limit cannot be found in the library.
+    """
+
+    import ctypes
+    try:
+        variable = ctypes.c_int.in_dll(ctypes.CDLL(libraryPath), name)
+    except (OSError, ValueError), e:
+        raise ValueError, 'cannot set the libxslt %s limit: %s' % (name, e)
+    variable.value = value
+
+
+
+# ######################################################################
+# Utility functions.
+#
+
+def _mtime(path):
+    """Return the modification time of the given file, or C{None} if the
+    file does not exist."""
+
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
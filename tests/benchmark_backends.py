@@ -0,0 +1,127 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Compares the speed of the XML backends on the same corpus.
+
+Each available backend renders every document in the corpus once with a
+cold Renderer (which compiles the stylesheet) and then C{--runs} more
+times with the same, warm Renderer.  The default corpus is the sample
+document in the C{examples} directory::
+
+    python tests/benchmark_backends.py --runs 200
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import optparse
+import sys
+import time
+
+# Test support imports.
+import support
+
+
+
+# ######################################################################
+# Benchmark.
+#
+
+def benchmark(backendName, restFiles, runs):
+    """
+    Render the corpus with the given backend.
+
+    @return: A C{(cold, warm, size)} tuple containing the time taken to
+        render the corpus with a new Renderer, the average time taken
+        to render the corpus with a warm Renderer (both in seconds), and
+        the total size of the outputs.
+    @rtype: C{tuple}
+    """
+
+    renderer = support.sampleRenderer(backendName)
+
+    # Render the corpus with a cold renderer.
+    startTime = time.time()
+    size = 0
+    for restFile in restFiles:
+        outputs, info = renderer.render(restFile)
+        size += sum([len(xml) for path, xml in outputs])
+    cold = time.time() - startTime
+
+    # Render the corpus with the warm renderer.
+    startTime = time.time()
+    for run in range(runs):
+        for restFile in restFiles:
+            renderer.render(restFile)
+    warm = (time.time() - startTime) / max(runs, 1)
+
+    return (cold, warm, size)
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage='usage: %prog [options] [file ...]')
+    parser.add_option(
+        '-n', '--runs',
+        type='int', metavar='N',
+        help='number of warm runs over the corpus (default: 50)')
+    parser.set_defaults(runs=50)
+    parser.add_option(
+        '-b', '--backend',
+        action='append', dest='backends', metavar='NAME',
+        help='benchmark only the given backend (may be repeated)')
+    parser.set_defaults(backends=[])
+    (options, args) = parser.parse_args()
+
+    restFiles = args or [support.SAMPLE]
+    backends = options.backends or support.availableBackends()
+    unavailable = [name for name in backends
+                   if name not in support.availableBackends()]
+    if unavailable:
+        parser.error('backend not available: %s' % (', '.join(unavailable)))
+
+    print '%d documents, %d warm runs' % (len(restFiles), options.runs)
+    print '%-10s %12s %12s %12s %12s' % (
+        'backend', 'cold ms', 'warm ms', 'ms/doc', 'output bytes')
+    for backendName in backends:
+        cold, warm, size = benchmark(backendName, restFiles, options.runs)
+        print '%-10s %12.1f %12.1f %12.2f %12d' % (
+            backendName, cold * 1000, warm * 1000,
+            warm * 1000 / len(restFiles), size)
+        sys.stdout.flush()
@@ -0,0 +1,99 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Shared support for the restxsl tests and benchmarks.
+
+The tests are run from the top of the source tree with::
+
+    python -m unittest discover tests
+
+The tests use the sample document in the C{examples} directory as their
+corpus.  Tests that need an optional module (the libxml2 bindings, for
+example) are skipped if it is not installed.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import os
+import sys
+
+# Make the restxsl package in this source tree importable when the
+# tests or benchmarks are run as scripts.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# restxsl imports.
+import restxsl.backend
+
+
+
+# ######################################################################
+# Test corpus.
+#
+
+EXAMPLES = os.path.join(ROOT, 'examples')
+"""The directory containing the sample documents."""
+
+SAMPLE = os.path.join(EXAMPLES, 'sample.txt')
+"""The sample document.  Its stylesheet refers to C{/xsl/reST.xsl}, so
+it must be rendered with L{ROOT} as the stylesheet base path."""
+
+SCRIPT = os.path.join(ROOT, 'scripts', 'restxsl')
+"""The restxsl script."""
+
+
+def availableBackends():
+    """Return the names of the XML backends that can be used."""
+
+    return sorted([name for name in restxsl.backend.BACKENDS
+                   if restxsl.backend.backendAvailable(name)])
+
+def sampleRenderer(backendName, **kwargs):
+    """
+    Return a L{restxsl.batch.Renderer} configured to render the sample
+    document with the given backend.  Additional keyword arguments are
+    passed to the Renderer.
+    """
+
+    import restxsl.batch
+    return restxsl.batch.Renderer(
+        smartPunctuation=True, xslBasePath=ROOT,
+        xmlBackend=restxsl.backend.getBackend(backendName), **kwargs)
@@ -0,0 +1,163 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Tests for the default (libxml2) XML backend and the compatibility names
+that it keeps.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Test support imports.
+import support
+
+# restxsl imports.
+import restxsl.backend
+import restxsl.batch
+import restxsl.xslt
+
+
+
+# ######################################################################
+# Test documents.
+#
+
+# A stylesheet that writes out the text of the document.
+TEXT_XSL = '''\
+<xsl:stylesheet version="1.0"
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:output method="text"/>
+<xsl:template match="/">
+<xsl:value-of select="/doc"/>
+</xsl:template>
+</xsl:stylesheet>
+'''
+
+# The title of the rendered sample document.
+SAMPLE_TITLE = '<title>My.Site : Sample reStructuredText Document</title>'
+
+
+
+# ######################################################################
+# Compatibility tests.
+#
+
+class CompatibilityTest(unittest.TestCase):
+
+    def testXsltWithoutBindings(self):
+        # restxsl.xslt keeps the Stylesheet name without importing the
+        # libxml2 bindings.
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [support.ROOT] + filter(None, [env.get('PYTHONPATH')]))
+        process = subprocess.Popen(
+            [sys.executable, '-c',
+             'import sys, restxsl.xslt\n'
+             'print restxsl.xslt.Stylesheet.__name__, '
+             "'libxml2' in sys.modules\n"],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        self.assertEqual(process.returncode, 0, stderr)
+        self.assertEqual(stdout.split(), ['Stylesheet', 'False'])
+
+
+
+# ######################################################################
+# Default backend tests.
+#
+
+class DefaultBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        if 'libxml2' not in support.availableBackends():
+            self.skipTest('the libxml2 backend is not available')
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def testDefault(self):
+        self.assertTrue(restxsl.backend.getBackend()
+                        is restxsl.backend.getBackend('libxml2'))
+
+    def testRenderSample(self):
+        # A Renderer without an XML backend uses the default backend.
+        renderer = restxsl.batch.Renderer(
+            smartPunctuation=True, xslBasePath=support.ROOT)
+        outputs, info = renderer.render(support.SAMPLE)
+        [(path, xml)] = outputs
+        self.assertEqual(path, os.path.splitext(support.SAMPLE)[0] + '.html')
+        self.assertTrue(SAMPLE_TITLE in xml)
+        self.assertTrue('id="overview"' in xml)
+        self.assertEqual(info.warnings, [])
+
+    def testStylesheet(self):
+        import libxml2
+        xslPath = os.path.join(self.tempDir, 'text.xsl')
+        f = open(xslPath, 'wb')
+        try:
+            f.write(TEXT_XSL)
+        finally:
+            f.close()
+
+        doc = libxml2.parseDoc('<doc>Hello</doc>')
+        stylesheet = restxsl.xslt.Stylesheet(xslPath)
+        try:
+            result = stylesheet.apply(doc, {})
+            try:
+                self.assertEqual(
+                    stylesheet.serialize(result, 'ASCII').strip(), 'Hello')
+            finally:
+                result.freeDoc()
+        finally:
+            stylesheet.close()
+            doc.freeDoc()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Tests for batch scheduling.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import os
+import shutil
+import tempfile
+import unittest
+
+# Test support imports.
+import support
+
+# restxsl imports.
+import restxsl.backend
+import restxsl.batch
+
+
+
+# ######################################################################
+# Test documents.
+#
+
+# A stylesheet that writes out the document's first paragraph, prefixed
+# with the name of the stylesheet.
+PARAGRAPH_XSL = '''\
+<xsl:stylesheet version="1.0"
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:output method="text"/>
+<xsl:template match="/">
+<xsl:value-of select="concat('%s:', /*/paragraph[1])"/>
+</xsl:template>
+</xsl:stylesheet>
+'''
+
+DOCUMENT_TXT = '''\
+=====
+Title
+=====
+
+:author: Nobody
+:xsl-template: %s
+
+%s
+'''
+
+
+
+# ######################################################################
+# Stylesheet scanning tests.
+#
+
+class ScanXslTemplateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def scan(self, text):
+        path = os.path.join(self.tempDir, 'document.txt')
+        f = open(path, 'wb')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+        return restxsl.batch.scanXslTemplate(path)
+
+    def testLeadingFieldList(self):
+        self.assertEqual(
+            self.scan(DOCUMENT_TXT % ('a.xsl', 'Text.')), 'a.xsl')
+        self.assertEqual(
+            self.scan('.. comment\n\n:xsl-template: a.xsl\n'
+                      ':xsl-template: b.xsl\n'), 'b.xsl')
+
+    def testFieldsAfterTheHeader(self):
+        # Fields after the first field list, or after the first
+        # paragraph, are not scanned.
+        self.assertEqual(
+            self.scan(':xsl-template: a.xsl\n\nText.\n\n'
+                      ':xsl-template: b.xsl\n'), 'a.xsl')
+        self.assertEqual(
+            self.scan('Title\n=====\n\nText.\n\n:xsl-template: b.xsl\n'),
+            None)
+
+    def testMissingFile(self):
+        self.assertEqual(
+            restxsl.batch.scanXslTemplate(
+                os.path.join(self.tempDir, 'missing.txt')), None)
+
+
+
+# ######################################################################
+# Scheduling tests.
+#
+
+class ChunkQueueTest(unittest.TestCase):
+
+    def testWorkersStayWithTheirGroup(self):
+        chunkQueue = restxsl.batch._ChunkQueue(
+            [['a1', 'a2', 'a3'], ['b1', 'b2', 'b3', 'b4'], ['c1']], 1)
+        self.assertEqual(chunkQueue.next(None), (0, 0))
+        self.assertEqual(chunkQueue.next(None), (1, 3))
+        self.assertEqual(chunkQueue.next(0), (0, 1))
+        self.assertEqual(chunkQueue.next(0), (0, 2))
+
+        # Group 0 is done, so its worker starts group 2, and then helps
+        # with group 1.
+        self.assertEqual(chunkQueue.next(0), (2, 7))
+        self.assertEqual(chunkQueue.next(2), (1, 4))
+        self.assertEqual(chunkQueue.next(1), (1, 5))
+        self.assertEqual(chunkQueue.next(1), (1, 6))
+        self.assertEqual(chunkQueue.next(1), (None, None))
+        self.assertEqual(chunkQueue.chunks[7], ['c1'])
+
+
+class RenderBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        if 'lxml' not in support.availableBackends():
+            self.skipTest('the lxml backend is not available')
+
+        self.tempDir = tempfile.mkdtemp()
+        self.restFiles = []
+        for name in ['a', 'b']:
+            xslPath = self.write('%s.xsl' % (name), PARAGRAPH_XSL % (name))
+            for index in range(4):
+                restFile = self.write(
+                    '%s%d.txt' % (name, index),
+                    DOCUMENT_TXT % (xslPath, 'Text %s%d.' % (name, index)))
+                self.restFiles.append(restFile)
+        self.restFiles.append(os.path.join(self.tempDir, 'missing.txt'))
+
+        self.renderer = restxsl.batch.Renderer(
+            xmlBackend=restxsl.backend.getBackend('lxml'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tempDir, name)
+        f = open(path, 'wb')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+        return path
+
+    def testResultOrder(self):
+        groups = restxsl.batch.groupByStylesheet(self.restFiles)
+        results = list(restxsl.batch.renderBatch(
+            self.renderer, groups, jobs=2, chunkSize=2, keepGoing=True))
+        self.assertEqual([restFile for restFile, outputs, info in results],
+                         sum(groups, []))
+
+        texts = [outputs[0][1].strip()
+                 for restFile, outputs, info in results if outputs]
+        self.assertEqual(texts, ['a:Text a0.', 'a:Text a1.', 'a:Text a2.',
+                                 'a:Text a3.', 'b:Text b0.', 'b:Text b1.',
+                                 'b:Text b2.', 'b:Text b3.'])
+        self.assertEqual(results[-1][2].restPath, self.restFiles[-1])
+
+    def testStylesheetAffinity(self):
+        # Each worker renders one group, so each stylesheet is compiled
+        # once (or twice, if a worker finishes its group early and helps
+        # with the other one).
+        groups = restxsl.batch.groupByStylesheet(self.restFiles[:-1])
+        results = list(restxsl.batch.renderBatch(
+            self.renderer, groups, jobs=2, chunkSize=1))
+        compiles = sum([len(info.stylesheetCompiles)
+                        for restFile, outputs, info in results])
+        self.assertTrue(compiles <= 3, '%d compiles' % (compiles))
+
+    def testErrorsAreRaised(self):
+        groups = restxsl.batch.groupByStylesheet(self.restFiles)
+        self.assertRaises(IOError, list, restxsl.batch.renderBatch(
+            self.renderer, groups, jobs=2, chunkSize=2))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Tests for the on-disk doctree cache.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import os
+import shutil
+import tempfile
+import unittest
+
+# Docutils imports.
+import docutils.core
+
+# Test support imports.
+import support
+
+# restxsl imports.
+import restxsl.doctreecache
+
+
+
+# ######################################################################
+# Doctree cache tests.
+#
+
+class DoctreeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.document = docutils.core.publish_doctree(
+            'A paragraph.\n\n' + 'More text. ' * 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def store(self, doctreeCache, count, start=0):
+        for index in range(start, start + count):
+            doctreeCache.store(
+                doctreeCache.key('doc%d.txt' % (index), '', {}),
+                self.document, [], [])
+
+    def cacheSize(self):
+        return sum([os.path.getsize(os.path.join(self.tempDir, name))
+                    for name in os.listdir(self.tempDir)])
+
+    def entrySize(self):
+        doctreeCache = restxsl.doctreecache.DoctreeCache(
+            os.path.join(self.tempDir, 'measure'))
+        self.store(doctreeCache, 1)
+        size = self.cacheSize()
+        shutil.rmtree(os.path.join(self.tempDir, 'measure'))
+        return size
+
+    def testStoreDoesNotRescan(self):
+        # The cache directory is measured on the first store, not on
+        # every store.
+        doctreeCache = restxsl.doctreecache.DoctreeCache(self.tempDir)
+        listdir = os.listdir
+        calls = []
+        def countingListdir(path):
+            calls.append(path)
+            return listdir(path)
+        os.listdir = countingListdir
+        try:
+            self.store(doctreeCache, 50)
+        finally:
+            os.listdir = listdir
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(os.listdir(self.tempDir)), 50)
+
+    def testSizeBound(self):
+        entrySize = self.entrySize()
+        doctreeCache = restxsl.doctreecache.DoctreeCache(
+            self.tempDir, entrySize * 10)
+        for index in range(30):
+            self.store(doctreeCache, 1, index)
+            self.assertTrue(self.cacheSize() <= entrySize * 10)
+
+    def testCloseCountsOtherProcesses(self):
+        # Entries stored by another cache on the same directory are
+        # only counted when the cache is closed.
+        entrySize = self.entrySize()
+        doctreeCache = restxsl.doctreecache.DoctreeCache(
+            self.tempDir, entrySize * 10)
+        other = restxsl.doctreecache.DoctreeCache(
+            self.tempDir, entrySize * 10)
+        self.store(doctreeCache, 5)
+        self.store(other, 10, 5)
+        doctreeCache.close()
+        self.assertTrue(self.cacheSize() <= entrySize * 10)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Tests for the include cache and the include directive that reads
+through it.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+# Test support imports.
+import support
+
+# Docutils imports.
+import docutils
+
+# restxsl imports.
+import restxsl.backend
+import restxsl.includecache
+import restxsl.transform
+
+
+
+# ######################################################################
+# Test documents.
+#
+
+# A stylesheet that copies the reStructuredText XML document.
+IDENTITY_XSL = '''\
+<xsl:stylesheet version="1.0"
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:template match="@*|node()">
+<xsl:copy><xsl:apply-templates select="@*|node()"/></xsl:copy>
+</xsl:template>
+</xsl:stylesheet>
+'''
+
+# The included file.
+PART_TXT = '''\
+Before the marker.
+
+.. START
+
+Included paragraph.
+
+\tTabbed literal text.
+
+.. END
+
+After the marker.
+'''
+
+# Documents that include the file with each of the directive's options.
+DOCUMENTS = {
+    'plain': '.. include:: part.txt\n',
+    'start-after': '.. include:: part.txt\n   :start-after: .. START\n',
+    'end-before': '.. include:: part.txt\n   :end-before: .. END\n',
+    'lines': '.. include:: part.txt\n   :start-line: 2\n   :end-line: 5\n',
+    'literal': '.. include:: part.txt\n   :literal:\n   :tab-width: 4\n',
+    'code': '.. include:: part.txt\n   :code: text\n',
+    'twice': '.. include:: part.txt\n\n.. include:: part.txt\n',
+    'recursive': '.. include:: loop.txt\n',
+    'missing': '.. include:: missing.txt\n',
+}
+
+
+
+# docutils only refuses circular inclusions from version 0.17 on; older
+# versions recurse until they run out of memory.
+DOCUTILS_VERSION = tuple(
+    [int(part) for part in re.match(
+        r'(\d+)\.(\d+)', docutils.__version__).groups()])
+DOCUTILS_CATCHES_LOOPS = DOCUTILS_VERSION >= (0, 17)
+
+
+
+# ######################################################################
+# Include directive tests.
+#
+
+class IncludeDirectiveTest(unittest.TestCase):
+    """The include directive must produce the same document with and
+    without an include cache."""
+
+    def setUp(self):
+        if 'lxml' not in support.availableBackends():
+            self.skipTest('the lxml backend is not available')
+
+        self.tempDir = tempfile.mkdtemp()
+        self.writeFile('part.txt', PART_TXT)
+        self.writeFile('loop.txt', 'Loop.\n\n.. include:: loop.txt\n')
+        self.writeFile('identity.xsl', IDENTITY_XSL)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def writeFile(self, name, text):
+        f = open(os.path.join(self.tempDir, name), 'wb')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+
+    def render(self, name, includeCache):
+        restPath = os.path.join(self.tempDir, 'doc-%s.txt' % (name))
+        self.writeFile(restPath, DOCUMENTS[name])
+        info = restxsl.transform.RenderInfo()
+        try:
+            [(filename, xml)] = restxsl.transform.restxsl(
+                restPath, xslPath=os.path.join(self.tempDir, 'identity.xsl'),
+                includeCache=includeCache, info=info, reportLevel=1,
+                xmlBackend=restxsl.backend.getBackend('lxml'))
+        except restxsl.transform.RestException, e:
+            xml = str(e)
+        return (xml, [(level, message) for level, source, line, message
+                      in info.warnings], info.dependencies)
+
+    def testOptions(self):
+        includeCache = restxsl.includecache.IncludeCache()
+        for name in sorted(DOCUMENTS):
+            if name == 'recursive' and not DOCUTILS_CATCHES_LOOPS:
+                continue
+            expected = self.render(name, None)
+            self.assertEqual(self.render(name, includeCache), expected,
+                             'include with %s option differs' % (name))
+
+        # The documents that include the file as reStructuredText read
+        # it through the cache; literal and code includes are left to
+        # docutils.
+        self.assertEqual(includeCache.misses, 2)
+        self.assertEqual(includeCache.hits, 5)
+
+    def testSelection(self):
+        includeCache = restxsl.includecache.IncludeCache()
+        xml, warnings, dependencies = self.render('start-after', includeCache)
+        self.assertTrue('Included paragraph' in xml)
+        self.assertFalse('Before the marker' in xml)
+        self.assertEqual(warnings, [])
+        self.assertTrue(os.path.join(self.tempDir, 'part.txt')
+                        in [os.path.abspath(path) for path in dependencies])
+
+    def testRecursiveInclude(self):
+        # The cached directive refuses circular inclusions with every
+        # version of docutils.
+        includeCache = restxsl.includecache.IncludeCache()
+        xml, warnings, dependencies = self.render('recursive', includeCache)
+        self.assertTrue([message for level, message in warnings
+                         if 'circular inclusion' in message])
+
+    def testDocutilsDirectiveWithoutCache(self):
+        import docutils.parsers.rst.directives
+        import docutils.parsers.rst.directives.misc
+        self.render('plain', None)
+        directive, messages = docutils.parsers.rst.directives.directive(
+            'include', None, None)
+        self.assertTrue(
+            directive is docutils.parsers.rst.directives.misc.Include)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
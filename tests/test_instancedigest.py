@@ -0,0 +1,294 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Tests for the digests of multidoc instances, and for the incremental
+rendering of multidoc documents that uses them.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Test support imports.
+import support
+
+# restxsl imports.
+import restxsl.output
+import restxsl.transform
+
+
+
+# ######################################################################
+# Test documents.
+#
+
+# An extension module with a directive that builds the same XML as a
+# multidoc pyxslt directive (without needing pyxslt or the libxml2
+# bindings): one page element for each line of its content, with the
+# page's filename and body.
+EXT_MODULE = '''\
+import docutils.nodes
+import docutils.parsers.rst
+import docutils.parsers.rst.directives
+
+def element(tagname, text=None):
+    node = docutils.nodes.container()
+    node.tagname = tagname
+    if text is not None:
+        node += docutils.nodes.Text(text)
+    return node
+
+class PagesDirective(docutils.parsers.rst.Directive):
+    has_content = True
+
+    def run(self):
+        settings = self.state.document.settings
+        settings.restxsl_multidoc = 'page/filename'
+        settings.restxsl_uncacheable = True
+        root = element('pyxslt')
+        root['multidoc'] = 'true'
+        for line in self.content:
+            filename, text = line.split(':', 1)
+            page = element('page')
+            page += element('filename', filename.strip())
+            page += element('body', text.strip())
+            root += page
+        return [root]
+
+docutils.parsers.rst.directives.register_directive('pages', PagesDirective)
+'''
+
+# A stylesheet that writes out the body of the page.
+PAGES_XSL = '''\
+<xsl:stylesheet version="1.0"
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:output method="text"/>
+<xsl:template match="/">
+<xsl:value-of select="//pyxslt/page/body"/>
+</xsl:template>
+</xsl:stylesheet>
+'''
+
+def pagesDocument(pages):
+    return 'Pages\n=====\n\n.. pages::\n\n' + ''.join(
+        ['   %s: %s\n' % (filename, text) for filename, text in pages])
+
+
+
+# ######################################################################
+# Helper functions.
+#
+
+def addClass(out, xmlDoc):
+    pass
+
+def addIds(out, xmlDoc):
+    pass
+
+
+class Stamper(object):
+    def __call__(self, out, xmlDoc):
+        pass
+
+
+def closureDigest(postProcessors=(), outputSettings=None):
+    return restxsl.transform._closureDigest(
+        support.SAMPLE, [], {'title': 'Sample'}, 'ASCII',
+        [restxsl.transform._postProcessorName(postProcessor)
+         for postProcessor in postProcessors],
+        outputSettings)
+
+
+def writerSettings(minify=False, compressors=()):
+    outputWriter = restxsl.output.OutputWriter(minify, compressors)
+    try:
+        return outputWriter.settings()
+    finally:
+        outputWriter.close()
+
+
+
+# ######################################################################
+# Instance digest tests.
+#
+
+class InstanceDigestTest(unittest.TestCase):
+
+    def testOutputSettings(self):
+        plain = writerSettings()
+        self.assertEqual(plain, writerSettings())
+        self.assertNotEqual(plain, writerSettings(minify=True))
+        self.assertNotEqual(plain, writerSettings(compressors=['gzip']))
+
+        self.assertEqual(closureDigest(outputSettings=plain),
+                         closureDigest(outputSettings=writerSettings()))
+        self.assertNotEqual(
+            closureDigest(outputSettings=plain),
+            closureDigest(outputSettings=writerSettings(minify=True)))
+        self.assertNotEqual(
+            closureDigest(outputSettings=plain),
+            closureDigest(outputSettings=writerSettings(
+                compressors=['gzip'])))
+
+    def testPostProcessors(self):
+        self.assertEqual(closureDigest([addClass]),
+                         closureDigest([addClass]))
+        self.assertNotEqual(closureDigest(), closureDigest([addClass]))
+        self.assertNotEqual(closureDigest([addClass]),
+                            closureDigest([addIds]))
+        self.assertNotEqual(closureDigest([addClass, addIds]),
+                            closureDigest([addIds, addClass]))
+
+        # Callable objects are named after their class, not their
+        # address.
+        self.assertEqual(closureDigest([Stamper()]),
+                         closureDigest([Stamper()]))
+        self.assertNotEqual(closureDigest([Stamper()]),
+                            closureDigest([addClass]))
+
+        # Lambdas are told apart by where they are defined.
+        lambdas = [lambda out, xmlDoc: None for index in range(2)]
+        self.assertEqual(closureDigest(lambdas[:1]),
+                         closureDigest(lambdas[1:]))
+        self.assertNotEqual(closureDigest([lambda out, xmlDoc: None]),
+                            closureDigest([lambda out, xmlDoc: 1]))
+
+
+
+# ######################################################################
+# Incremental multidoc tests.
+#
+
+class IncrementalMultidocTest(unittest.TestCase):
+
+    def setUp(self):
+        if 'lxml' not in support.availableBackends():
+            self.skipTest('the lxml backend is not available')
+
+        self.tempDir = tempfile.mkdtemp()
+        self.writeFile('pages.py', EXT_MODULE)
+        self.writeFile('pages.xsl', PAGES_XSL)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def writeFile(self, name, text):
+        f = open(os.path.join(self.tempDir, name), 'wb')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+
+    def readFile(self, name):
+        f = open(os.path.join(self.tempDir, name), 'rb')
+        try:
+            return f.read().strip()
+        finally:
+            f.close()
+
+    def render(self, pages, *args):
+        # Render the pages with the restxsl script, and return the
+        # manifest.
+        self.writeFile('doc.txt', pagesDocument(pages))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [support.ROOT] + filter(None, [env.get('PYTHONPATH')]))
+        process = subprocess.Popen(
+            [sys.executable, support.SCRIPT, '--backend', 'lxml',
+             '--write', '--manifest', 'manifest.json',
+             '--incremental-multidoc', '-m', 'pages.py', '-s', 'pages.xsl']
+            + list(args) + ['doc.txt'],
+            cwd=self.tempDir, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        self.assertEqual(process.returncode, 0, stderr)
+        return json.loads(self.readFile('manifest.json'))
+
+    def testIncrementalRender(self):
+        manifest = self.render([('one', 'First page.'),
+                                ('two', 'Second page.'),
+                                ('three', 'Third page.')])
+        self.assertEqual(manifest['created'],
+                         ['one.html', 'three.html', 'two.html'])
+        self.assertEqual(self.readFile('two.html'), 'Second page.')
+
+        # Edit the output of an instance that will not change, so that
+        # we can tell whether it was rendered again.
+        self.writeFile('one.html', 'Edited.')
+
+        # Change one instance, remove one, and add one.  Only the new
+        # and changed instances are rendered; the unchanged instance is
+        # kept, and the outputs of the removed instance are deleted.
+        manifest = self.render([('one', 'First page.'),
+                                ('two', 'Second page, changed.'),
+                                ('four', 'Fourth page.')])
+        self.assertEqual(self.readFile('one.html'), 'Edited.')
+        self.assertEqual(self.readFile('two.html'), 'Second page, changed.')
+        self.assertEqual(self.readFile('four.html'), 'Fourth page.')
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tempDir, 'three.html')))
+        self.assertEqual(manifest['created'], ['four.html'])
+        self.assertEqual(manifest['changed'], ['two.html'])
+        self.assertEqual(manifest['unchanged'], ['one.html'])
+        self.assertEqual(manifest['removed'], ['three.html'])
+        self.assertEqual(sorted(manifest['outputs']),
+                         ['four.html', 'one.html', 'two.html'])
+        self.assertEqual(
+            sorted(manifest['sources']['doc.txt']['instances']),
+            ['four', 'one', 'two'])
+
+        # Changing the output settings renders every instance again.
+        manifest = self.render([('one', 'First page.'),
+                                ('two', 'Second page, changed.'),
+                                ('four', 'Fourth page.')], '--minify')
+        self.assertEqual(self.readFile('one.html'), 'First page.')
+        self.assertEqual(manifest['changed'], ['one.html'])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Tests for the render limits.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import os
+import shutil
+import tempfile
+import unittest
+
+# Test support imports.
+import support
+
+# restxsl imports.
+import restxsl.backend
+import restxsl.batch
+import restxsl.limits
+import restxsl.xslt
+
+
+
+# ######################################################################
+# Test documents.
+#
+
+# A stylesheet that calls a template recursively $depth times.  Each
+# call adds a parameter and a variable to the stack.
+RECURSE_XSL = '''\
+<xsl:stylesheet version="1.0"
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:output method="text"/>
+<xsl:param name="depth" select="0"/>
+<xsl:template match="/">
+<xsl:call-template name="recurse">
+<xsl:with-param name="n" select="$depth"/>
+</xsl:call-template>
+</xsl:template>
+<xsl:template name="recurse">
+<xsl:param name="n"/>
+<xsl:variable name="next" select="$n - 1"/>
+<xsl:choose>
+<xsl:when test="$n &gt; 0">
+<xsl:call-template name="recurse">
+<xsl:with-param name="n" select="$next"/>
+</xsl:call-template>
+</xsl:when>
+<xsl:otherwise>done</xsl:otherwise>
+</xsl:choose>
+</xsl:template>
+</xsl:stylesheet>
+'''
+
+DOCUMENT_TXT = '''\
+A document.
+'''
+
+
+
+# ######################################################################
+# Depth limit tests.
+#
+
+class DepthLimitTest(unittest.TestCase):
+
+    backendName = 'lxml'
+
+    def setUp(self):
+        if self.backendName not in support.availableBackends():
+            self.skipTest('the %s backend is not available' % (
+                self.backendName))
+
+        self.tempDir = tempfile.mkdtemp()
+        for name, text in [('recurse.xsl', RECURSE_XSL),
+                           ('document.txt', DOCUMENT_TXT)]:
+            f = open(os.path.join(self.tempDir, name), 'wb')
+            try:
+                f.write(text)
+            finally:
+                f.close()
+
+    def tearDown(self):
+        # Restore libxslt's default limits for the other tests.
+        restxsl.backend.getBackend(self.backendName).setDepthLimits(
+            None, None)
+        shutil.rmtree(self.tempDir)
+
+    def render(self, depth, **kwargs):
+        renderer = restxsl.batch.Renderer(
+            xslPath=os.path.join(self.tempDir, 'recurse.xsl'),
+            xslParams={'depth': str(depth)},
+            xmlBackend=restxsl.backend.getBackend(self.backendName),
+            renderLimits=restxsl.limits.RenderLimits(**kwargs))
+        outputs, info = renderer.render(
+            os.path.join(self.tempDir, 'document.txt'))
+        return outputs[0][1].strip()
+
+    def testDefaultLimits(self):
+        self.assertEqual(self.render(500), 'done')
+
+    def testTemplateDepth(self):
+        # libxslt counts the local variables and parameters of each
+        # nested template towards the template depth, too.
+        self.assertEqual(self.render(20, maxTemplateDepth=100), 'done')
+        self.assertRaises(
+            restxsl.xslt.StylesheetException,
+            self.render, 200, maxTemplateDepth=100)
+
+    def testVariableDepth(self):
+        self.assertEqual(self.render(50, maxVariableDepth=200), 'done')
+        self.assertRaises(
+            restxsl.xslt.StylesheetException,
+            self.render, 200, maxVariableDepth=200)
+
+    def testLimitsAreRestored(self):
+        # A renderer without limits is not affected by an earlier
+        # renderer's limits.
+        self.assertRaises(
+            restxsl.xslt.StylesheetException,
+            self.render, 200, maxTemplateDepth=100, maxVariableDepth=200)
+        self.assertEqual(self.render(500), 'done')
+
+
+class Libxml2DepthLimitTest(DepthLimitTest):
+
+    backendName = 'libxml2'
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Tests for resolving links against the anchors of the rendered pages.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import os
+import shutil
+import tempfile
+import unittest
+
+# Test support imports.
+import support
+
+# restxsl imports.
+import restxsl.backend
+import restxsl.batch
+import restxsl.linkcheck
+
+
+
+# ######################################################################
+# Test documents.
+#
+
+# A stylesheet that turns every id in the document into an anchor.
+ANCHORS_XSL = '''\
+<xsl:stylesheet version="1.0"
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:template match="/">
+<page>
+<xsl:for-each select="//*[@ids]">
+<a name="{substring-before(concat(@ids, ' '), ' ')}"/>
+</xsl:for-each>
+</page>
+</xsl:template>
+</xsl:stylesheet>
+'''
+
+# The Usage section links to an anchor that is only on the Intro page.
+MANUAL_TXT = '''\
+Intro
+=====
+
+See Usage_ and the `notes <#notes>`_.
+
+.. _notes:
+
+Notes on the introduction.
+
+Usage
+=====
+
+Back to Intro_, and to the `notes <#notes>`_ again.
+'''
+
+
+
+# ######################################################################
+# Link checker tests.
+#
+
+class LinkCheckerTest(unittest.TestCase):
+
+    def setUp(self):
+        if 'lxml' not in support.availableBackends():
+            self.skipTest('the lxml backend is not available')
+
+        self.tempDir = tempfile.mkdtemp()
+        for name, text in [('anchors.xsl', ANCHORS_XSL),
+                           ('manual.txt', MANUAL_TXT)]:
+            f = open(os.path.join(self.tempDir, name), 'wb')
+            try:
+                f.write(text)
+            finally:
+                f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def check(self, splitSections):
+        renderer = restxsl.batch.Renderer(
+            xslPath=os.path.join(self.tempDir, 'anchors.xsl'),
+            xmlBackend=restxsl.backend.getBackend('lxml'),
+            splitSections=splitSections, collectLinks=True)
+        restPath = os.path.join(self.tempDir, 'manual.txt')
+        outputs, info = renderer.render(restPath)
+        linkChecker = restxsl.linkcheck.LinkChecker()
+        linkChecker.addDocument(restPath, outputs, info)
+        return linkChecker.check()
+
+    def testSinglePage(self):
+        self.assertEqual(self.check(False), [])
+
+    def testFragmentOnAnotherPage(self):
+        brokenLinks = self.check(True)
+        self.assertEqual([link.target for link in brokenLinks], ['#notes'])
+        self.assertEqual(brokenLinks[0].line, 13)
+        self.assertEqual(
+            brokenLinks[0].reason, 'no anchor notes in %s' % (
+                os.path.join(self.tempDir, 'manual-usage.html')))
+
+    def testReferencesBetweenPages(self):
+        # Internal references are resolved against the page that holds
+        # their target, so Usage_ and Intro_ are not broken.
+        targets = [link.target for link in self.check(True)]
+        self.assertTrue('#usage' not in targets)
+        self.assertTrue('#intro' not in targets)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
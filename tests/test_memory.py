@@ -0,0 +1,260 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Tests for the memory used while rendering documents.
+
+Peak memory is measured with C{getrusage} in a forked child (or a new
+interpreter), so that the measurements are not affected by the other
+tests.  The soak tests render the sample document many times and check
+that memory stays bounded once the caches are warm.  They render it 100
+times by default, which catches leaks of a few kilobytes per render; set
+C{RESTXSL_SOAK_RENDERS} to a few thousand to catch slower leaks::
+
+    export RESTXSL_SOAK_RENDERS=5000
+    python -m unittest discover -p test_memory.py tests
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import cPickle
+import gc
+import os
+import resource
+import subprocess
+import sys
+import unittest
+
+# Test support imports.
+import support
+
+# restxsl imports.
+import restxsl.backend
+
+
+
+# ######################################################################
+# Utility functions.
+#
+
+def maxRss():
+    """Return the peak resident set size of this process, in KB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def runInChild(function, *args):
+    """
+    Call the given function in a forked child and return its (pickled)
+    result.  Exceptions raised by the function are raised again in the
+    parent.
+    """
+
+    readFd, writeFd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(readFd)
+        try:
+            try:
+                result = (True, function(*args))
+            except Exception, e:
+                result = (False, '%s: %s' % (e.__class__.__name__, e))
+            os.write(writeFd, cPickle.dumps(result, 2))
+        finally:
+            os._exit(0)
+
+    os.close(writeFd)
+    data = []
+    for chunk in iter(lambda: os.read(readFd, 65536), ''):
+        data.append(chunk)
+    os.close(readFd)
+    os.waitpid(pid, 0)
+    isOk, result = cPickle.loads(''.join(data))
+    if not isOk:
+        raise AssertionError('child failed: %s' % (result))
+    return result
+
+def runInInterpreter(functionName, *args):
+    """
+    Call one of the functions in this module in a new Python interpreter
+    and return its (pickled) result.  Unlike L{runInChild}, none of the
+    modules imported by the other tests (lxml, for example) are loaded
+    before the function is called.
+    """
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.abspath(__file__)), support.ROOT]
+        + filter(None, [env.get('PYTHONPATH')]))
+    process = subprocess.Popen(
+        [sys.executable, '-c',
+         'import cPickle, sys, test_memory\n'
+         'result = getattr(test_memory, %r)(*%r)\n'
+         'sys.stdout.write(cPickle.dumps(result, 2))\n'
+         % (functionName, args)],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise AssertionError('interpreter failed: %s' % (stderr))
+    return cPickle.loads(stdout)
+
+
+
+# ######################################################################
+# Fragment grafting tests.
+#
+
+# The number of elements in the large fragment.
+FRAGMENT_ELEMENTS = 100000
+
+def graftLargeFragment():
+    # Build a large fragment the way the pyxslt serializer does (a
+    # document without a dictionary), then graft it into an output
+    # document.  Return the growth of the peak RSS while building the
+    # fragment and while grafting it, in KB.
+    import libxml2
+    xmlBackend = restxsl.backend.getBackend('libxml2')
+
+    before = maxRss()
+    fragmentDoc = libxml2.newDoc('1.0')
+    fragmentRoot = libxml2.newNode('pyxslt')
+    fragmentDoc.setRootElement(fragmentRoot)
+    for index in xrange(FRAGMENT_ELEMENTS):
+        item = fragmentRoot.newChild(None, 'item', 'x' * 100)
+        item.newProp('index', str(index))
+    built = maxRss()
+
+    outputDoc = xmlBackend.newDocument()
+    outputRoot = xmlBackend.setRootElement(outputDoc, 'document')
+    xmlBackend.addFragment(outputRoot, fragmentDoc)
+    grafted = maxRss()
+
+    # The whole fragment must have been moved.
+    count = int(xmlBackend.xpath(outputDoc, 'count(/document/pyxslt/item)'))
+    fragmentDoc.freeDoc()
+    xmlBackend.freeDocument(outputDoc)
+    if count != FRAGMENT_ELEMENTS:
+        raise ValueError('%d of %d elements grafted' % (
+            count, FRAGMENT_ELEMENTS))
+    return built - before, grafted - built
+
+
+class FragmentMemoryTest(unittest.TestCase):
+
+    def setUp(self):
+        if 'libxml2' not in support.availableBackends():
+            self.skipTest('the libxml2 backend is not available')
+
+    def testGraftingDoesNotCopy(self):
+        # Copying the fragment would raise the peak by about as much as
+        # building it did; moving it should barely change the peak.
+        fragmentGrowth, graftGrowth = runInChild(graftLargeFragment)
+        self.assertTrue(fragmentGrowth > 10 * 1024,
+                        'fragment only used %d KB' % (fragmentGrowth))
+        self.assertTrue(graftGrowth < fragmentGrowth / 4,
+                        'grafting raised the peak by %d KB (fragment: %d KB)'
+                        % (graftGrowth, fragmentGrowth))
+
+
+
+# ######################################################################
+# Soak tests.
+#
+
+# The number of renders before memory is first measured (which fills
+# the caches), and the number of renders after that.
+WARMUP_RENDERS = 20
+SOAK_RENDERS = int(os.environ.get('RESTXSL_SOAK_RENDERS', '100'))
+
+def soak(backendName):
+    # Render the sample document over and over again.  Return the
+    # growth of the peak RSS (in KB), the bytes allocated by libxml2 at
+    # the end of the warm-up, and the growth of those bytes by the end
+    # of the run.  docutils trees are full of reference cycles, so we
+    # collect the garbage after every render; otherwise the peak would
+    # depend on when the collector happened to run.
+    import restxsl.memory
+    restxsl.memory.enableDebugMemory(backendName)
+    renderer = support.sampleRenderer(backendName)
+
+    for index in xrange(WARMUP_RENDERS):
+        renderer.render(support.SAMPLE)
+        gc.collect()
+    rssBefore = maxRss()
+    bytesBefore = restxsl.memory.allocatedBytes()
+
+    for index in xrange(SOAK_RENDERS):
+        renderer.render(support.SAMPLE)
+        gc.collect()
+    rssGrowth = maxRss() - rssBefore
+    bytesGrowth = restxsl.memory.allocatedBytes() - bytesBefore
+    return rssGrowth, bytesBefore, bytesGrowth
+
+
+class SoakTest(unittest.TestCase):
+
+    def soak(self, backendName):
+        # Memory debugging has to be turned on before the backend's
+        # library is loaded, so the soak runs in a new interpreter.
+        if backendName not in support.availableBackends():
+            self.skipTest('the %s backend is not available' % (backendName))
+        rssGrowth, bytesBefore, bytesGrowth = runInInterpreter(
+            'soak', backendName)
+
+        # libxml2 accounts for every byte, so a render must not leave
+        # anything behind once the caches are full (which they are, so
+        # the accounting must have seen them).  A leaked node or
+        # document would cost far more than the slack allowed here.
+        self.assertTrue(bytesBefore > 0,
+                        'libxml2 did not account for the cached documents')
+        self.assertTrue(bytesGrowth < 4096,
+                        '%d bytes leaked by %d renders'
+                        % (bytesGrowth, SOAK_RENDERS))
+        self.assertTrue(rssGrowth < 256,
+                        'peak RSS grew by %d KB over %d renders'
+                        % (rssGrowth, SOAK_RENDERS))
+
+    def testLibxml2(self):
+        self.soak('libxml2')
+
+    def testLxml(self):
+        self.soak('lxml')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+Tests for the output writer and its manifest.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Test support imports.
+import support
+
+# restxsl imports.
+import restxsl.output
+
+
+
+# ######################################################################
+# Manifest tests.
+#
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.manifestPath = self.path('manifest.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def path(self, name):
+        return os.path.join(self.tempDir, name)
+
+    def render(self, sources, prune=False):
+        # Write and record the outputs of each source, given as a
+        # dictionary mapping source names to lists of output names.
+        outputWriter = restxsl.output.OutputWriter(
+            manifestPath=self.manifestPath, prune=prune)
+        for source, outputs in sorted(sources.items()):
+            for output in outputs:
+                outputWriter.write(self.path(output), output)
+            outputWriter.recordSource(
+                self.path(source), [self.path(output) for output in outputs],
+                [], None)
+        outputWriter.close()
+        return outputWriter
+
+    def testRemovedOutputs(self):
+        self.render({'a.txt': ['a.html', 'a-old.html'],
+                     'b.txt': ['b.html']})
+
+        # Only the outputs of the files rendered this time can be
+        # removed.
+        outputWriter = self.render({'a.txt': ['a.html']}, prune=True)
+        self.assertEqual(outputWriter.removed, [self.path('a-old.html')])
+        self.assertFalse(os.path.exists(self.path('a-old.html')))
+        self.assertTrue(os.path.exists(self.path('b.html')))
+
+    def testNothingRecorded(self):
+        self.render({'a.txt': ['a.html']})
+        outputWriter = self.render({}, prune=True)
+        self.assertEqual(outputWriter.removed, [])
+        self.assertTrue(os.path.exists(self.path('a.html')))
+
+    def testManifestRequiresWrite(self):
+        self.render({'a.txt': ['a.html']})
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [support.ROOT] + filter(None, [env.get('PYTHONPATH')]))
+        process = subprocess.Popen(
+            [sys.executable, support.SCRIPT, '--manifest',
+             self.manifestPath, '--prune', support.SAMPLE],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        self.assertEqual(process.returncode, 2)
+        self.assertTrue('require --write' in stderr)
+        self.assertTrue(os.path.exists(self.path('a.html')))
+        f = open(self.manifestPath, 'r')
+        try:
+            self.assertEqual(json.load(f)['outputs'].keys(),
+                             [self.path('a.html')])
+        finally:
+            f.close()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Tests for rendering each top-level section into its own page.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import os
+import shutil
+import tempfile
+import unittest
+
+# Test support imports.
+import support
+
+# restxsl imports.
+import restxsl.backend
+import restxsl.batch
+
+
+
+# ######################################################################
+# Test documents.
+#
+
+# A stylesheet that lists the section's page and its neighbors.
+PAGES_XSL = '''\
+<xsl:stylesheet version="1.0"
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:output method="text"/>
+<xsl:param name="section-page"/>
+<xsl:param name="prev-section-page"/>
+<xsl:param name="next-section-page"/>
+<xsl:template match="/">
+<xsl:value-of select="concat($prev-section-page, '|', $section-page, '|',
+                             $next-section-page, '|')"/>
+<xsl:for-each select="/*/split-toc/entry">
+<xsl:value-of select="concat(@page, ' ')"/>
+</xsl:for-each>
+</xsl:template>
+</xsl:stylesheet>
+'''
+
+MANUAL_TXT = '''\
+Intro
+=====
+
+Manual introduction.
+
+Usage
+=====
+
+Manual usage.
+'''
+
+GUIDE_TXT = '''\
+Intro
+=====
+
+Guide introduction.
+
+Setup
+=====
+
+Guide setup.
+'''
+
+
+
+# ######################################################################
+# Split section tests.
+#
+
+class SplitSectionsTest(unittest.TestCase):
+
+    def setUp(self):
+        if 'lxml' not in support.availableBackends():
+            self.skipTest('the lxml backend is not available')
+
+        self.tempDir = tempfile.mkdtemp()
+        for name, text in [('pages.xsl', PAGES_XSL),
+                           ('manual.txt', MANUAL_TXT),
+                           ('guide.txt', GUIDE_TXT)]:
+            f = open(os.path.join(self.tempDir, name), 'wb')
+            try:
+                f.write(text)
+            finally:
+                f.close()
+
+        self.renderer = restxsl.batch.Renderer(
+            xslPath=os.path.join(self.tempDir, 'pages.xsl'),
+            xmlBackend=restxsl.backend.getBackend('lxml'),
+            splitSections=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def render(self, name):
+        outputs, info = self.renderer.render(
+            os.path.join(self.tempDir, name))
+        return [(os.path.basename(path), xml) for path, xml in outputs]
+
+    def testPagesAreNamedAfterTheDocument(self):
+        manual = self.render('manual.txt')
+        guide = self.render('guide.txt')
+        self.assertEqual([path for path, xml in manual],
+                         ['manual-intro.html', 'manual-usage.html'])
+        self.assertEqual([path for path, xml in guide],
+                         ['guide-intro.html', 'guide-setup.html'])
+
+    def testPageParameters(self):
+        manual = dict(self.render('manual.txt'))
+        self.assertEqual(
+            manual['manual-intro.html'].strip(),
+            '|manual-intro|manual-usage|manual-intro manual-usage')
+        self.assertEqual(
+            manual['manual-usage.html'].strip(),
+            'manual-intro|manual-usage||manual-intro manual-usage')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Startup-time benchmarks for the restxsl script.
+
+Each test runs the script a few times and compares the fastest run to
+a time budget, so that a stray import of a heavy module (or of a
+module that an option does not need) is caught.  The script can also
+be run directly to print the timings::
+
+    python tests/test_startup.py
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+# Test support imports.
+import support
+
+
+
+# ######################################################################
+# Test documents.
+#
+
+# A stylesheet that writes out the document's title.
+TITLE_XSL = '''\
+<xsl:stylesheet version="1.0"
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:output method="text"/>
+<xsl:template match="/">
+<xsl:value-of select="/document/title"/>
+</xsl:template>
+</xsl:stylesheet>
+'''
+
+TRIVIAL_TXT = '''\
+=====
+Hello
+=====
+'''
+
+# The time budgets, in seconds.  These are several times what a
+# typical machine needs (about 20 ms and 120 ms), so that the tests do
+# not fail on a loaded build machine.
+VERSION_BUDGET = 0.25
+TRIVIAL_BUDGET = 1.0
+
+# The number of times each command is run.
+RUNS = 3
+
+
+
+# ######################################################################
+# Utility functions.
+#
+
+def runScript(args, runs=RUNS):
+    """
+    Run the restxsl script with the given arguments and return the
+    fastest of the runs' wall-clock times, in seconds, and the output
+    of the last run.
+    """
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [support.ROOT] + filter(None, [env.get('PYTHONPATH')]))
+
+    best = None
+    for index in xrange(runs):
+        start = time.time()
+        process = subprocess.Popen(
+            [sys.executable, support.SCRIPT] + list(args), env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        seconds = time.time() - start
+        if process.returncode != 0:
+            raise AssertionError('restxsl %s failed: %s' % (
+                ' '.join(args), stderr))
+        if best is None or seconds < best:
+            best = seconds
+    return best, stdout
+
+
+
+# ######################################################################
+# Startup tests.
+#
+
+class StartupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        for name, text in [('title.xsl', TITLE_XSL),
+                           ('trivial.txt', TRIVIAL_TXT)]:
+            f = open(os.path.join(self.tempDir, name), 'wb')
+            try:
+                f.write(text)
+            finally:
+                f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def trivialArgs(self):
+        return ['--backend', 'lxml',
+                '-s', os.path.join(self.tempDir, 'title.xsl'),
+                os.path.join(self.tempDir, 'trivial.txt')]
+
+    def testVersion(self):
+        seconds, output = runScript(['--version'])
+        self.assertTrue(seconds < VERSION_BUDGET,
+                        '--version took %.3fs (budget: %.3fs)'
+                        % (seconds, VERSION_BUDGET))
+
+    def testTrivialDocument(self):
+        if 'lxml' not in support.availableBackends():
+            self.skipTest('the lxml backend is not available')
+
+        seconds, output = runScript(self.trivialArgs())
+        self.assertEqual(output.strip(), 'Hello')
+        self.assertTrue(seconds < TRIVIAL_BUDGET,
+                        'a trivial document took %.3fs (budget: %.3fs)'
+                        % (seconds, TRIVIAL_BUDGET))
+
+    def testLibraryImport(self):
+        # Importing the transform module (as library users and the
+        # worker do) does not load docutils or an XML library; they are
+        # loaded when the first document is transformed.
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [support.ROOT] + filter(None, [env.get('PYTHONPATH')]))
+        process = subprocess.Popen(
+            [sys.executable, '-c',
+             'import sys, restxsl.transform\n'
+             'print " ".join(sorted([name for name in sys.modules\n'
+             '    if name.split(".")[0] in ("docutils", "libxml2", "lxml")\n'
+             '    and sys.modules[name]]))\n'],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        self.assertEqual(process.returncode, 0, stderr)
+        self.assertEqual(stdout.strip(), '')
+
+
+
+# ######################################################################
+# Benchmark entry point.
+#
+
+if __name__ == '__main__':
+    test = StartupTest('testVersion')
+    test.setUp()
+    try:
+        for name, args in [('--version', ['--version']),
+                           ('trivial document', test.trivialArgs())]:
+            seconds, output = runScript(args, 10)
+            print '%-20s %8.1f ms' % (name, seconds * 1000)
+    finally:
+        test.tearDown()
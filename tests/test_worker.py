@@ -0,0 +1,174 @@
+# Copyright (c) 2006, Michael Alyn Miller <malyn@strangeGizmo.com>.
+# All rights reserved.
+# vi:ts=4:sw=4:et
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+# 
+# 1.  Redistributions of source code must retain the above copyright
+#     notice unmodified, this list of conditions, and the following
+#     disclaimer.
+# 2.  Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in the
+#     documentation and/or other materials provided with the distribution.
+# 3.  Neither the name of Michael Alyn Miller nor the names of the
+#     contributors to this software may be used to endorse or promote
+#     products derived from this software without specific prior written
+#     permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Tests for the persistent worker mode.
+
+@author: Michael Alyn Miller <malyn@strangeGizmo.com>
+@copyright: 2006 by Michael Alyn Miller
+@license: BSD License (see source code for full license)
+"""
+
+
+# ######################################################################
+# IMPORTS
+#
+
+# Python imports.
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Test support imports.
+import support
+
+# restxsl imports.
+import restxsl.backend
+import restxsl.batch
+import restxsl.output
+import restxsl.worker
+
+
+
+# ######################################################################
+# Test documents.
+#
+
+# A stylesheet that writes out its title parameter.
+TITLE_XSL = '''\
+<xsl:stylesheet version="1.0"
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+<xsl:output method="text"/>
+<xsl:param name="title"/>
+<xsl:template match="/">
+<xsl:value-of select="$title"/>
+</xsl:template>
+</xsl:stylesheet>
+'''
+
+DOCUMENT_TXT = '''\
+A document.
+'''
+
+
+
+# ######################################################################
+# Worker tests.
+#
+
+class RunJobTest(unittest.TestCase):
+
+    def setUp(self):
+        if 'lxml' not in support.availableBackends():
+            self.skipTest('the lxml backend is not available')
+
+        self.tempDir = tempfile.mkdtemp()
+        for name, text in [('title.xsl', TITLE_XSL),
+                           ('document.txt', DOCUMENT_TXT)]:
+            f = open(os.path.join(self.tempDir, name), 'wb')
+            try:
+                f.write(text)
+            finally:
+                f.close()
+
+        self.renderer = restxsl.batch.Renderer(
+            xslPath=os.path.join(self.tempDir, 'title.xsl'),
+            xmlBackend=restxsl.backend.getBackend('lxml'))
+        self.outputWriter = restxsl.output.OutputWriter()
+
+    def tearDown(self):
+        self.outputWriter.close()
+        shutil.rmtree(self.tempDir)
+
+    def runJob(self, params, outputPath):
+        reply = restxsl.worker.runJob(
+            self.renderer, self.outputWriter, json.dumps({
+                'id': 1,
+                'source': os.path.join(self.tempDir, 'document.txt'),
+                'params': params,
+                'output': outputPath}))
+        self.assertEqual(reply['status'], 'ok', reply.get('error'))
+        f = open(outputPath, 'rb')
+        try:
+            return f.read().strip()
+        finally:
+            f.close()
+
+    def testQuotedParams(self):
+        outputPath = os.path.join(self.tempDir, 'document.html')
+        for title in ['Home', "Don't panic", 'It\'s "fine"']:
+            self.assertEqual(
+                self.runJob({'title': title}, outputPath), title)
+
+    def testMissingOutputDirectory(self):
+        outputPath = os.path.join(self.tempDir, 'site', 'docs', 'doc.html')
+        self.assertEqual(
+            self.runJob({'title': 'Home'}, outputPath), 'Home')
+
+
+class WorkerOptionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def runWorker(self, args):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [support.ROOT] + filter(None, [env.get('PYTHONPATH')]))
+        process = subprocess.Popen(
+            [sys.executable, support.SCRIPT, '--worker'] + args,
+            env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate(support.SAMPLE + '\n')
+        return process.returncode, stderr
+
+    def testManifestRejected(self):
+        # Each worker would overwrite the manifest, and treat the
+        # outputs rendered by the other workers as removed.
+        manifestPath = os.path.join(self.tempDir, 'manifest.json')
+        for args in [['--write', '--manifest', manifestPath],
+                     ['--write', '--prune']]:
+            returncode, stderr = self.runWorker(args)
+            self.assertEqual(returncode, 2)
+            self.assertTrue('cannot be used in worker mode' in stderr)
+        self.assertFalse(os.path.exists(manifestPath))
+
+
+
+if __name__ == '__main__':
+    unittest.main()